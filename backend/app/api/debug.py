@@ -0,0 +1,38 @@
+import hmac
+import tracemalloc
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from app.config import settings
+from app.services import memory
+
+# Mounted only with settings.debug_memory_enabled (see app/main.py)
+router = APIRouter()
+
+def require_debug_memory_token(request: Request):
+    """The endpoint only exists with settings.debug_memory_token and needs it as a bearer token"""
+    if not settings.debug_memory_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = request.headers.get("authorization", "")
+    if not hmac.compare_digest(supplied.encode("utf-8"), f"Bearer {settings.debug_memory_token}".encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid or missing token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+@router.get("/debug/memory")
+async def memory_breakdown(request: Request, top: int = Query(20, ge=0, le=200),
+                           trace: str = Query(None, pattern="^(start|stop)$"),
+                           enforce: bool = False):
+    """
+    Memory of this worker by component. trace=start begins tracemalloc
+    (allocations from then on are attributed; it slows the process down),
+    trace=stop ends it. enforce=true applies the memory budgets now.
+    """
+    require_debug_memory_token(request)
+    if trace == "start" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif trace == "stop" and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    actions = await run_in_threadpool(memory.enforce_budgets) if enforce else None
+    report = await run_in_threadpool(memory.memory_report, top)
+    if actions is not None:
+        report["budget_actions"] = actions
+    return report
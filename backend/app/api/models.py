@@ -1,10 +1,13 @@
 from pydantic import BaseModel
 from typing import List, Optional
+from app.config import settings
 
 class ChatRequest(BaseModel):
     message: str
     language: str
     user_id: Optional[str] = None
+    country: str = settings.default_country
+    omit_duplicates: bool = False  # drop search_results content already quoted in response
 
 class ChatResponse(BaseModel):
     response: str
@@ -14,12 +17,19 @@ class ChatResponse(BaseModel):
     suggestions: Optional[List[str]] = None
     source: Optional[str] = None
     url: Optional[str] = None
+    tier: Optional[str] = None  # answer tier: db_search, web, db, cache, offline or fallback
+    degraded: bool = False  # answered without NLP/web/database because of overload
+    plan: Optional[dict] = None  # tier order, attempts and chosen tier (app/services/tier_planner.py)
     
 class SearchRequest(BaseModel):
     query: str
     language: str
     category: Optional[str] = None
     limit: Optional[int] = 10
+    country: str = settings.default_country
+    cursor: Optional[str] = None  # next_cursor of the previous page
+    fields: Optional[List[str]] = None  # projection, e.g. ["category", "content"]
+    stream: bool = False  # stream every match as NDJSON instead of one page
     
 class SearchResult(BaseModel):
     category: str
@@ -32,3 +42,5 @@ class SearchResponse(BaseModel):
     query: str
     matched_keywords: List[str]
     total_results: int
+    next_cursor: Optional[str] = None
+    corrected_query: Optional[str] = None  # the query with typos fixed, if any were
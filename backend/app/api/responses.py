@@ -0,0 +1,200 @@
+"""
+Response path for the hot endpoints.
+
+Handlers return FastJSONResponse with plain dicts built by the services, so
+FastAPI does not re-validate data the app produced itself (response_model is
+kept for the OpenAPI schema only), and the body is encoded with orjson when
+it is installed. CompressionMiddleware compresses bodies of at least
+compression_min_size bytes with brotli (when installed and accepted) or gzip.
+
+Read-mostly endpoints send an ETag and Cache-Control, and answer a matching
+If-None-Match with 304 before doing any work. Their ETags are weak, since
+the same data is sent with different content encodings.
+"""
+import hashlib
+import json
+import zlib
+from typing import Any, Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from app.config import settings
+from app.services import corpus_version, spelling, vector_index
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def etag(*parts) -> str:
+    digest = hashlib.sha1(json.dumps(parts, default=str).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def corpus_etag(*parts) -> Optional[str]:
+    """ETag of data derived from the regulation corpus only; None while its version is unknown"""
+    version = corpus_version.current()
+    return etag("corpus", version, *parts) if version is not None else None
+
+
+def search_etag(language: str, country: str, *parts) -> Optional[str]:
+    """corpus_etag of search results, which also depend on the spelling and semantic indexes"""
+    return corpus_etag("search", spelling.index_version(language),
+                       vector_index.index_version(country, language), language, country, *parts)
+
+
+def cache_headers(tag: Optional[str]) -> Dict[str, str]:
+    headers = {"Cache-Control": f"public, max-age={settings.http_cache_max_age}"}
+    if tag:
+        headers["ETag"] = tag
+    return headers
+
+
+def not_modified(request: Request, tag: Optional[str]) -> Optional[Response]:
+    """A 304 response if the client already has the representation with this ETag"""
+    header = request.headers.get("if-none-match")
+    if not tag or not header:
+        return None
+    # Weak comparison (RFC 9110 13.1.2)
+    tags = {value.strip().removeprefix("W/") for value in header.split(",")}
+    if "*" in tags or tag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers=cache_headers(tag))
+    return None
+
+
+def chat_body(result: Dict, omit_duplicates: bool = False) -> Dict:
+    """The ChatResponse fields of a chat service result"""
+    search_results = result.get("search_results")
+    if search_results and omit_duplicates:
+        # The content of each result is already part of the response text
+        search_results = [{key: value for key, value in item.items() if key != "content"}
+                          for item in search_results]
+    return {
+        "response": result["response"],
+        "intent": result["intent"],
+        "confidence": result["confidence"],
+        "search_results": search_results,
+        "suggestions": result.get("suggestions"),
+        "source": result.get("source"),
+        "url": result.get("url"),
+        "tier": result.get("tier"),
+        "degraded": result.get("degraded", False),
+        "plan": result.get("plan")
+    }
+
+
+def _choose_encoding(accept_encoding: str) -> str:
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return ""
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=settings.compression_brotli_quality)
+            self._compress = self._compressor.process
+            self._sync = self._compressor.flush
+            self._finish = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31)
+            self._compress = self._compressor.compress
+            self._sync = lambda: self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._compressor.flush
+
+    def compress(self, data: bytes, sync: bool = False) -> bytes:
+        """sync=True emits everything compressed so far, so streamed chunks are not held back"""
+        return self._compress(data) + self._sync() if sync else self._compress(data)
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+class CompressionMiddleware:
+    """
+    Compress JSON and text responses for clients that accept it. Single-body
+    responses below compression_min_size are sent as is; streamed responses
+    (e.g. NDJSON search exports) are compressed chunk by chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = _choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if not encoding:
+            return await self.app(scope, receive, send)
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_compressed(message):
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message.get("headers", []))
+                content_type = headers.get("content-type", "")
+                state["passthrough"] = ("content-encoding" in headers
+                                        or not content_type.startswith(COMPRESSIBLE_TYPES))
+                if state["passthrough"]:
+                    await send(message)
+                else:
+                    state["start"] = message  # held until the first body chunk
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            start = state["start"]
+            if start is not None:
+                state["start"] = None
+                if not more_body and len(body) < settings.compression_min_size:
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                state["compressor"] = _Compressor(encoding)
+                if more_body:
+                    del headers["Content-Length"]
+                    await send({**start, "headers": headers.raw})
+                else:
+                    body = state["compressor"].compress(body) + state["compressor"].finish()
+                    headers["Content-Length"] = str(len(body))
+                    await send({**start, "headers": headers.raw})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+            compressor = state["compressor"]
+            chunk = compressor.compress(body, sync=more_body)
+            if not more_body:
+                chunk += compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,30 +1,60 @@
-from fastapi import APIRouter, Query
+import hmac
+import weakref
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from app import startup
+from app.config import settings
 from app.services.search_service import SearchService
 from app.api.models import ChatRequest, ChatResponse, SearchRequest, SearchResult, SearchResponse
 from app.services.chat_service import ChatService
 from app.database.operations import DatabaseOperations
+from app.api.responses import (FastJSONResponse, cache_headers, chat_body, corpus_etag, dumps, etag, not_modified,
+                               search_etag)
+from app.api.websocket import serve_chat_session
+from app.data.bulk_loader import BulkLoader, JSONStreamParser
+from app.services.metrics import render_metrics
+from app.services import admission, autocomplete
 from typing import List, Optional
 
 router = APIRouter()
 
+def admit(user_id: Optional[str] = None) -> str:
+    """Admission decision for a request; raises 429/503 if it is rejected"""
+    decision = admission.controller.enter(user_id)
+    if decision == admission.RATE_LIMITED:
+        raise HTTPException(status_code=429, detail="Too many requests",
+                            headers={"Retry-After": str(admission.controller.retry_after(decision))})
+    if decision == admission.SHED:
+        raise HTTPException(status_code=503, detail="Service overloaded",
+                            headers={"Retry-After": str(admission.controller.retry_after(decision))})
+    return decision
+
 @router.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
-    chat_service = ChatService()
-    result = await chat_service.process_message(
-        message=request.message,
-        language=request.language,
-        user_id=request.user_id
-    )
-    return ChatResponse(
-        response=result["response"],
-        intent=result["intent"],
-        confidence=result["confidence"],
-        search_results= result.get("search_results"),
-        suggestions=result.get("suggestions"),
-        source=result.get("source"),
-        url=result.get("url")
-    )
+async def chat_endpoint(request: ChatRequest, http_request: Request):
+    decision = admit(request.user_id)
+    try:
+        chat_service = ChatService()
+        result = await chat_service.process_message(
+            message=request.message,
+            language=request.language,
+            user_id=request.user_id,
+            country=request.country,
+            degraded=decision == admission.DEGRADED,
+            asker=request.user_id or (http_request.client.host if http_request.client else None)
+        )
+    finally:
+        admission.controller.leave()
+    # Built by the chat service, so it is sent without re-validating through ChatResponse
+    return FastJSONResponse(chat_body(result, request.omit_duplicates))
     
+@router.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket, user_id: Optional[str] = None, language: Optional[str] = None,
+                         country: Optional[str] = None):
+    """Persistent chat channel; see app/api/websocket.py for the message format"""
+    await serve_chat_session(websocket, user_id, language, country)
+
 @router.get("/chat/history/{user_id}")
 async def get_chat_history(user_id: str, limit: int = 10):
     chat_service = ChatService()
@@ -36,33 +66,145 @@ async def get_suggestions(request: ChatRequest):
     chat_service = ChatService()
     suggestions = await chat_service.generate_suggestions(
         message=request.message,
-        language=request.language
+        language=request.language,
+        country=request.country
     )
     return {"suggestions": suggestions}
     
+@router.get("/autocomplete")
+async def autocomplete_endpoint(prefix: str = Query(..., max_length=200), language: str = Query("en-US"),
+                                limit: int = Query(5, ge=1, le=10)):
+    """Question completions for a typed prefix, cheap enough to call per keystroke"""
+    return {"suggestions": autocomplete.complete(prefix, language, limit)}
+
 @router.post("/search", response_model=SearchResponse)
 async def search_endpoint(request: SearchRequest):
-    search_service = SearchService()
-    result = await search_service.search_regulations(
-        query=request.query,
-        language=request.language,
-        category=request.category,
-        limit=request.limit
-    )
-    return result
+    # Search has no cheap tier, so a degraded decision is served normally
+    admit()
+    streaming = False
+    try:
+        search_service = SearchService()
+        if request.stream:
+            documents = await search_service.iter_regulations(
+                query=request.query,
+                language=request.language,
+                category=request.category,
+                country=request.country,
+                cursor=request.cursor,
+                fields=request.fields
+            )
+            lines = (dumps(document) + b"\n" for document in documents)
+            # The slot is held until the stream is sent, or dropped if the client goes away first
+            release = weakref.finalize(lines, admission.controller.leave)
+            streaming = True
+            return StreamingResponse(lines, media_type="application/x-ndjson", background=BackgroundTask(release))
+        result = await search_service.search_regulations(
+            query=request.query,
+            language=request.language,
+            category=request.category,
+            limit=request.limit,
+            country=request.country,
+            cursor=request.cursor,
+            fields=request.fields
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if not streaming:
+            admission.controller.leave()
+    return FastJSONResponse(result)
+
+@router.get("/search", response_model=SearchResponse)
+async def search_get_endpoint(request: Request, query: str = Query(..., max_length=500),
+                              language: str = Query("en-US"), category: Optional[str] = None,
+                              limit: int = 10, country: str = Query(settings.default_country),
+                              cursor: Optional[str] = None, fields: Optional[str] = None):
+    """Cacheable form of POST /search, without streaming; fields are comma-separated"""
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    tag = search_etag(language, country, query, category, limit, cursor, field_list)
+    cached = not_modified(request, tag)
+    if cached:
+        return cached
+    response = await search_endpoint(SearchRequest(query=query, language=language, category=category, limit=limit,
+                                                   country=country, cursor=cursor, fields=field_list))
+    response.headers.update(cache_headers(tag))
+    return response
+
+def require_bulk_load_token(request: Request):
+    """The bulk endpoint only exists with settings.bulk_load_token and needs it as a bearer token"""
+    if not settings.bulk_load_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = request.headers.get("authorization", "")
+    if not hmac.compare_digest(supplied.encode("utf-8"), f"Bearer {settings.bulk_load_token}".encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid or missing token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+@router.post("/regulations/bulk")
+async def bulk_load_regulations(request: Request, batch_size: Optional[int] = None, dry_run: bool = False):
+    """Stream NDJSON/JSON regulations from the request body into the database"""
+    require_bulk_load_token(request)
+    max_bytes = int(settings.bulk_load_max_mb * 1024 * 1024)
+    too_large = HTTPException(status_code=413, detail=f"Body over {settings.bulk_load_max_mb:g} MB; "
+                                                      "use python -m app.data.bulk_loader for larger loads")
+    if int(request.headers.get("content-length") or 0) > max_bytes:
+        raise too_large
+    loader = BulkLoader(batch_size=batch_size, dry_run=dry_run)
+    parser = JSONStreamParser()
+    received = 0
+
+    def add_all(documents):
+        for document in documents:
+            loader.add(document)
+
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes:
+                raise too_large  # batches already flushed stay written
+            documents = parser.feed(chunk)
+            if documents:
+                # add() flushes full batches with a blocking bulk_write
+                await run_in_threadpool(add_all, documents)
+        await run_in_threadpool(add_all, parser.close())
+    except ValueError as e:
+        report = await run_in_threadpool(loader.finish)
+        return JSONResponse(status_code=400, content={"error": str(e), **report})
+    return await run_in_threadpool(loader.finish)
 
 @router.get("/categories")
-async def get_categories(language: str = Query("en-US")):
+async def get_categories(request: Request, language: str = Query("en-US"),
+                         country: str = Query(settings.default_country)):
+    tag = corpus_etag("categories", language, country)
+    cached = not_modified(request, tag)
+    if cached:
+        return cached
     db_ops = DatabaseOperations()
-    categories = db_ops.get_categories(language)
-    return {"categories": categories}
+    categories = db_ops.get_categories(language, country)
+    return FastJSONResponse({"categories": categories}, headers=cache_headers(tag))
 
 @router.get("/popular-questions")
-async def get_popular_questions(language: str = Query("en-US"), limit: int = 5):
+async def get_popular_questions(request: Request, language: str = Query("en-US"), limit: int = 5):
     chat_service = ChatService()
     questions = await chat_service.get_popular_questions(language, limit)
-    return {"questions": questions}
+    # Popularity follows live traffic rather than ingests, so the ETag is of the list itself
+    tag = etag("popular-questions", questions)
+    return not_modified(request, tag) or FastJSONResponse({"questions": questions}, headers=cache_headers(tag))
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Metrics of this worker process in the Prometheus text format"""
+    return render_metrics()
 
 @router.get("/health")
+@router.get("/health/live")
 async def health_check():
+    """Liveness: the process is up and serving requests"""
     return {"status": "OK"}
+
+@router.get("/health/ready")
+async def readiness_check():
+    """Readiness: models are loaded and warmed up"""
+    state = startup.get_state()
+    if not state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up", **state})
+    return {"status": "ready", **state}
@@ -0,0 +1,123 @@
+"""
+WebSocket chat channel, /api/ws/chat?user_id=&language=&country=
+
+The connection holds one ChatSession (app/services/chat_session.py). After
+the handshake the server sends {"type": "session", "session_id", "user_id",
+"language"}. Every client frame is a JSON chat message:
+
+    {"id": 1, "message": "...", "language": "de", "country": "germany", "omit_duplicates": false}
+
+Only "message" is required; "id" is echoed back so pipelined messages can be
+matched to their answers, which are pushed as soon as each completes and may
+arrive out of order:
+
+    {"type": "answer", "id": 1, "response": "...", "intent": "...", ...}   (the ChatResponse fields)
+    {"type": "error", "id": 1, "status": 429, "error": "...", "retry_after": 2}
+
+Up to ws_max_pipelined messages per connection are answered concurrently;
+beyond that the server stops reading until one completes. Every message goes
+through admission control like POST /api/chat.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app.api.responses import chat_body, dumps
+from app.config import settings
+from app.services import admission
+from app.services.chat_session import ChatSession, ws_messages
+
+logger = logging.getLogger(__name__)
+
+
+def _error(message_id, status: int, error: str, retry_after: Optional[int] = None) -> Dict:
+    ws_messages.inc(result=str(status))
+    payload = {"type": "error", "id": message_id, "status": status, "error": error}
+    if retry_after is not None:
+        payload["retry_after"] = retry_after
+    return payload
+
+
+def _parse(text: str) -> Dict:
+    try:
+        request = json.loads(text)
+    except ValueError:
+        return {"invalid": "Message is not valid JSON"}
+    if not isinstance(request, dict):
+        return {"invalid": "Message must be a JSON object"}
+    message = request.get("message")
+    if not isinstance(message, str) or not message.strip():
+        return {"id": request.get("id"), "invalid": "Field 'message' must be a non-empty string"}
+    if len(message) > settings.ws_max_message_chars:
+        return {"id": request.get("id"), "invalid": f"Message is longer than {settings.ws_max_message_chars} characters"}
+    for field in ("language", "country"):
+        if not isinstance(request.get(field), (str, type(None))):
+            return {"id": request.get("id"), "invalid": f"Field '{field}' must be a string"}
+    return request
+
+
+async def _reply(session: ChatSession, request: Dict) -> Dict:
+    message_id = request.get("id")
+    if "invalid" in request:
+        return _error(message_id, 400, request["invalid"])
+    decision = admission.controller.enter(session.user_id)
+    if decision == admission.RATE_LIMITED:
+        return _error(message_id, 429, "Too many requests", admission.controller.retry_after(decision))
+    if decision == admission.SHED:
+        return _error(message_id, 503, "Service overloaded", admission.controller.retry_after(decision))
+    try:
+        result = await session.answer(
+            request["message"],
+            language=request.get("language"),
+            country=request.get("country"),
+            degraded=decision == admission.DEGRADED
+        )
+    except Exception as e:
+        logger.error(f"Chat session {session.session_id} failed to answer: {e}")
+        return _error(message_id, 500, "Internal error")
+    finally:
+        admission.controller.leave()
+    ws_messages.inc(result="answered")
+    return {"type": "answer", "id": message_id, **chat_body(result, bool(request.get("omit_duplicates")))}
+
+
+async def serve_chat_session(websocket: WebSocket, user_id: Optional[str] = None,
+                             language: Optional[str] = None, country: Optional[str] = None):
+    await websocket.accept()
+    client = websocket.client.host if websocket.client else None
+    session = ChatSession(user_id, language, country, client)
+    send_lock = asyncio.Lock()
+    slots = asyncio.Semaphore(settings.ws_max_pipelined)
+    tasks = set()
+
+    async def send(payload: Dict):
+        async with send_lock:
+            await websocket.send_text(dumps(payload).decode("utf-8"))
+
+    async def handle(request: Dict):
+        try:
+            await send(await _reply(session, request))
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # the client went away before its answer was ready
+        finally:
+            slots.release()
+
+    try:
+        await send({"type": "session", "session_id": session.session_id, "user_id": session.user_id,
+                    "language": session.language})
+        while True:
+            request = _parse(await websocket.receive_text())
+            # Stop reading while the connection has ws_max_pipelined answers in flight
+            await slots.acquire()
+            task = asyncio.ensure_future(handle(request))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in list(tasks):
+            task.cancel()
+        session.close()
@@ -1,10 +1,208 @@
+import os
 from pydantic_settings import BaseSettings
 from pydantic import ConfigDict
+from typing import Dict, List, Union
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def resolve_path(path: str) -> str:
+    """Relative data paths are relative to the backend directory, not the working directory"""
+    return path if os.path.isabs(path) else os.path.join(BACKEND_DIR, path)
+
 class Settings(BaseSettings):
     mongodb_uri: str = "mongodb://localhost:27017"
     database_name: str = "driving_regulations"
     debug: bool = True
-    
+
+    # Regulations, indexes and web sources are partitioned by (country, language).
+    # Requests without a country use the default; partitions load lazily and
+    # served_countries (empty = all on disk) limits what is preloaded before fork.
+    default_country: str = "germany"
+    served_countries: List[str] = []
+
+    # Server settings. With debug enabled the app runs as a single reloading
+    # uvicorn process; otherwise app/server.py starts a pre-forking server.
+    host: str = "0.0.0.0"
+    port: int = 8000
+    workers: int = 1
+    preload_models: bool = True  # load models in the master before forking workers
+    max_requests: int = 0  # recycle a worker after this many requests (0 disables)
+    max_requests_jitter: int = 0
+    graceful_timeout: int = 30
+    worker_timeout: int = 120
+
+    # Semantic similarity index (app/services/vector_index.py)
+    vector_index_enabled: bool = True
+    vector_index_dir: str = "data/vector_index"
+    vector_index_dimensions: int = 256
+    vector_index_min_score: float = 0.35  # minimum cosine similarity for a match
+
+    # Bulk regulation loading (app/data/bulk_loader.py)
+    bulk_load_batch_size: int = 1000
+    # POST /api/regulations/bulk writes the corpus every answer is served from:
+    # it is disabled unless a token is set, and then requires
+    # "Authorization: Bearer <bulk_load_token>" and bodies under bulk_load_max_mb
+    bulk_load_token: str = ""
+    bulk_load_max_mb: float = 64
+
+    # Regulation feeds collected over HTTP (app/data/collector.py): URLs, or
+    # objects with "url", "fields" (schema field -> feed field) and "defaults"
+    regulation_feeds: List[Union[str, Dict]] = []
+    regulation_feed_concurrency: int = 4
+    regulation_feed_timeout: float = 30.0  # seconds to connect and between reads
+
+    # Search paging: page size cap and Mongo cursor batch size
+    search_max_limit: int = 100
+    search_batch_size: int = 100
+
+    # Scraped websites; point these at a local fixture server for load tests
+    route_to_germany_url: str = "https://routetogermany.com"
+    getting_around_germany_url: str = "https://www.gettingaroundgermany.info"
+
+    # Scraped pages are served from the page cache while younger than this (seconds);
+    # each worker keeps up to page_cache_max_entries of them in memory
+    page_cache_max_age: int = 3600
+    page_cache_max_entries: int = 256
+
+    # Level 2 of the page and chat answer caches, shared by the workers of a
+    # node (app/services/shared_cache.py): a Redis-protocol server if
+    # shared_cache_redis_url is set, else a SQLite file of at most max_mb
+    # (a relative shared_cache_path is relative to the backend directory)
+    shared_cache_enabled: bool = True
+    shared_cache_path: str = "data/shared_cache.sqlite3"
+    shared_cache_max_mb: float = 256
+    shared_cache_redis_url: str = ""
+    shared_cache_lease_seconds: float = 10
+
+    # Background recrawl of the scraped pages (app/services/recrawl.py). A page
+    # is recrawled every base interval, shortened for frequently requested
+    # topics and clamped to [min, max], with +/- jitter.
+    recrawl_enabled: bool = False
+    recrawl_base_interval: int = 6 * 3600
+    recrawl_min_interval: int = 600
+    recrawl_max_interval: int = 24 * 3600
+    recrawl_jitter: float = 0.2
+    recrawl_per_host_concurrency: int = 2
+    # One worker per node holds this file lock and fetches the pages; the others
+    # re-index from the pages it stores in the shared page cache
+    recrawl_lock_path: str = "data/recrawl.lock"
+
+    # Popular questions from live traffic (app/services/popularity.py): a
+    # space-saving summary of `popular_questions_capacity` counters per
+    # language and time bucket; the window is the sum of the buckets.
+    popular_questions_capacity: int = 200
+    popular_questions_window: int = 24 * 3600
+    popular_questions_buckets: int = 24
+    # Asked by fewer distinct users (guaranteed count) than this: use the static list
+    popular_questions_min_count: int = 10
+    popular_questions_checkpoint_interval: int = 300
+    # User questions are suggested by autocomplete once asked by this many users in
+    # the window, the most asked autocomplete_max_popular per language
+    autocomplete_min_count: int = 5
+    autocomplete_max_popular: int = 100
+
+    # Admission control (app/services/admission.py), per worker process.
+    # Beyond max_in_flight requests are shed with 503; beyond degrade_in_flight
+    # or above the loop lag, chat is answered from cache/offline knowledge only.
+    # Per-user token buckets refill at user_rate requests/second (0 disables).
+    admission_max_in_flight: int = 64
+    admission_degrade_in_flight: int = 32
+    admission_max_loop_lag_ms: float = 250.0
+    admission_user_rate: float = 1.0
+    admission_user_burst: int = 10
+
+    # spaCy calls are micro-batched onto a process pool (app/nlp/executor.py);
+    # 0 workers runs the batches on a thread instead.
+    nlp_pool_workers: int = 2
+    nlp_max_batch_size: int = 16
+    nlp_max_wait_ms: float = 5.0
+    nlp_pool_start_method: str = "fork"  # "spawn"/"forkserver" load the models per process
+
+    # /debug/memory reports memory per component (app/services/memory.py) to
+    # requests with "Authorization: Bearer <debug_memory_token>"; without a
+    # token it does not exist.
+    # Components over their budget (MB, e.g. {"chat_response_cache": 64}) are
+    # trimmed every memory_check_interval seconds, or logged if they cannot evict.
+    debug_memory_enabled: bool = False
+    debug_memory_token: str = ""
+    memory_budgets_mb: Dict[str, float] = {}
+    memory_check_interval: int = 60
+
+    # Opt-in request profiling (app/services/profiling.py): requests with
+    # "X-Profile: 1" and "X-Profile-Token: <profiling_token>", or a random
+    # sample_rate share, are profiled into profiling_dir. Off by default.
+    profiling_token: str = ""
+    profiling_sample_rate: float = 0.0
+    profiling_mode: str = "sample"  # "sample" (collapsed stacks) or "cprofile"
+    profiling_interval_ms: float = 1.0
+    profiling_dir: str = "data/profiles"
+    profiling_max_files: int = 500
+
+    # Responses of at least compression_min_size bytes are compressed with
+    # brotli (if installed and accepted) or gzip (app/api/responses.py)
+    compression_min_size: int = 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+
+    # /categories, /popular-questions and GET /search send ETags and may be
+    # cached for http_cache_max_age seconds; workers re-read the regulation
+    # corpus version every corpus_version_refresh_interval seconds
+    http_cache_max_age: int = 60
+    corpus_version_refresh_interval: float = 5
+
+    # Chat answers kept for degraded requests (app/services/response_cache.py)
+    chat_cache_max_entries: int = 2048
+    chat_cache_ttl: int = 900
+
+    # Misspelled words are corrected against the keyword vocabulary before
+    # routing (app/services/spelling.py)
+    spelling_correction_enabled: bool = True
+    spelling_max_edit_distance: int = 2
+    # Tokens whose normalised search terms are cached, per language (app/services/terms.py)
+    term_cache_size: int = 50000
+
+    # WebSocket chat at /api/ws/chat (app/services/chat_session.py): messages a
+    # connection may have in flight before reading pauses, and per-session caches
+    ws_max_pipelined: int = 8
+    ws_max_message_chars: int = 2000
+    ws_session_analysis_entries: int = 64
+
+    # Chat answer tiers (app/services/tier_planner.py). "planned" runs the tiers
+    # cheapest first and stops at an answer scoring accept_confidence (confidence
+    # times the tier weight); "fixed" keeps db_search, web, db, offline order.
+    # The slowest tier may start in parallel when it fits the latency budget and
+    # each cheaper tier scored below accept_confidence over at least
+    # chat_tier_min_samples answers on the topic.
+    chat_tier_policy: str = "planned"
+    chat_tier_accept_confidence: float = 0.75
+    chat_tier_weights: Dict[str, float] = {"offline": 0.75}
+    chat_tier_budget_ms: float = 4000
+    chat_tier_speculate: bool = True
+    chat_tier_max_speculative: int = 4  # speculative runs in flight per worker
+    chat_tier_min_samples: int = 20
+
+    # Answer tier analytics (app/services/analytics.py): chat events are appended
+    # to hourly NDJSON logs in analytics_dir and rolled up into hourly Mongo
+    # aggregates every flush_interval seconds. Questions answered by a slow tier
+    # or slower than slow_ms are counted for `python -m app.services.analytics`.
+    analytics_enabled: bool = True
+    analytics_dir: str = "data/analytics"
+    analytics_flush_interval: int = 30
+    analytics_retention_days: int = 30
+    analytics_slow_tiers: List[str] = ["web", "fallback"]
+    analytics_slow_ms: float = 1000
+
+    # MongoDB indexes and query monitoring. Missing indexes of the registry in
+    # app/database/indexes.py are created at startup. Commands slower than
+    # slow_query_ms (0 disables) are logged with their explain() plan summary
+    # (app/database/slow_queries.py), explaining a query shape at most once per
+    # explain_interval seconds; collscan_check explains every command.
+    mongo_ensure_indexes: bool = True
+    mongo_slow_query_ms: float = 100
+    mongo_explain_interval: float = 300
+    mongo_collscan_check: bool = False
+
     model_config = ConfigDict(
         extra='allow',  # Allow extra fields
         env_file='.env'
@@ -0,0 +1,331 @@
+"""
+Streaming bulk loader for regulation documents.
+
+Reads NDJSON or JSON (a top-level array or concatenated objects) of any size
+in fixed-size chunks, validates every document, stamps it with a content hash
+and its normalised search terms (app/services/terms.py, lemmatised per batch)
+and writes it with unordered ``bulk_write`` upserts keyed on that hash.
+Re-loading the same file is therefore a no-op, and one bad document only
+fails itself rather than the whole batch. That includes malformed JSON: the
+parser reports it as one invalid document and resumes at the next line (or
+array element).
+
+Usage:
+    python -m app.data.bulk_loader regulations.ndjson [more.json.gz ...] [--batch-size 1000]
+"""
+import argparse
+import codecs
+import gzip
+import hashlib
+import json
+import logging
+import sys
+import time
+from datetime import datetime
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = {
+    "category": str,
+    "content": str,
+    "country": str,
+}
+
+
+class MalformedDocument:
+    """Stands in for a document that is not valid JSON, so the loader counts it as invalid"""
+    __slots__ = ("error",)
+
+    def __init__(self, error: str):
+        self.error = error
+
+
+class JSONStreamParser:
+    """
+    Incremental parser for NDJSON, concatenated JSON objects or one top-level
+    JSON array. Feed it chunks of bytes; it yields each complete document.
+    Memory is bounded by the size of the largest single document.
+
+    A document that fails to parse before the end of the input received so
+    far is malformed rather than incomplete: it is yielded as a
+    MalformedDocument and parsing resumes after the next newline (or, in an
+    array, the next comma).
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._in_array = None  # unknown until the first non-whitespace character
+        self._array_closed = False
+        self._skip_to = None  # separators one of which ends the malformed document being skipped
+
+    def feed(self, chunk: bytes) -> List:
+        self._buffer += self._text_decoder.decode(chunk)
+        return self._drain()
+
+    def close(self) -> List:
+        self._buffer += self._text_decoder.decode(b"", final=True)
+        documents = self._drain(final=True)
+        if self._buffer.strip():
+            raise ValueError(f"Truncated JSON input: {self._buffer[:80]!r}")
+        if self._in_array and not self._array_closed:
+            raise ValueError("Truncated JSON input: missing closing ']'")
+        return documents
+
+    def _drain(self, final: bool = False) -> List:
+        documents = []
+        position = 0
+        buffer = self._buffer
+        if self._skip_to is not None:
+            position = self._find_any(buffer, self._skip_to, 0)
+            if position < 0:
+                self._buffer = ""
+                return documents
+            position += 1
+            self._skip_to = None
+        while True:
+            # Skip whitespace and the separators of a top-level array
+            while position < len(buffer) and (buffer[position].isspace() or (self._in_array and buffer[position] == ",")):
+                position += 1
+            if position >= len(buffer):
+                break
+            if self._in_array is None:
+                self._in_array = buffer[position] == "["
+                if self._in_array:
+                    position += 1
+                    continue
+            if self._in_array and buffer[position] == "]":
+                self._array_closed = True
+                position += 1
+                continue
+            try:
+                document, end = self._decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if self._incomplete(buffer, e):
+                    break  # incomplete document, wait for more input
+                documents.append(MalformedDocument(f"{e.msg} (character {e.pos - position})"))
+                # Resume at the next line, or in an array after the next comma past the error
+                resume = [index for index in (buffer.find("\n", position),
+                                              buffer.find(",", e.pos) if self._in_array else -1) if index >= 0]
+                if not resume:
+                    self._skip_to = "\n," if self._in_array else "\n"
+                    position = len(buffer)
+                    break
+                position = min(resume) + 1
+                continue
+            # A number at the end of the buffer may still be incomplete
+            if end == len(buffer) and not final and not isinstance(document, (dict, list)):
+                break
+            documents.append(document)
+            position = end
+        self._buffer = buffer[position:]
+        return documents
+
+    @staticmethod
+    def _incomplete(buffer: str, error: json.JSONDecodeError) -> bool:
+        """Whether the decode error is the input running out rather than a malformed document"""
+        # Raw newlines cannot occur inside a JSON string, so a document with one after the error is complete
+        if "\n" in buffer[error.pos:]:
+            return False
+        return error.pos >= len(buffer) or error.msg.startswith("Unterminated string")
+
+    @staticmethod
+    def _find_any(buffer: str, separators: str, start: int) -> int:
+        found = [index for index in (buffer.find(separator, start) for separator in separators) if index >= 0]
+        return min(found) if found else -1
+
+
+def iter_json_documents(chunks: Iterable[bytes]) -> Iterator:
+    """Yield documents from an iterable of byte chunks"""
+    parser = JSONStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def iter_file_chunks(stream: IO[bytes], chunk_size: int = 1 << 16) -> Iterator[bytes]:
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def validate_regulation(document) -> Tuple[Optional[Dict], Optional[str]]:
+    """Return a normalised copy of the document, or an error message"""
+    if isinstance(document, MalformedDocument):
+        return None, f"malformed JSON: {document.error}"
+    if not isinstance(document, dict):
+        return None, "document is not an object"
+    for field, field_type in REQUIRED_FIELDS.items():
+        if not isinstance(document.get(field), field_type) or not document[field].strip():
+            return None, f"missing or invalid '{field}'"
+
+    language = document.get("language")
+    if isinstance(language, str):
+        language = [language]
+    if not language or not isinstance(language, list) or not all(isinstance(l, str) for l in language):
+        return None, "missing or invalid 'language'"
+
+    keywords = document.get("keywords", [])
+    if not isinstance(keywords, list) or not all(isinstance(k, str) for k in keywords):
+        return None, "invalid 'keywords'"
+
+    fine_amount = document.get("fine_amount")
+    if fine_amount is not None and not isinstance(fine_amount, (int, float)):
+        return None, "invalid 'fine_amount'"
+
+    last_updated = document.get("last_updated") or datetime.now()
+    if isinstance(last_updated, str):
+        try:
+            last_updated = datetime.fromisoformat(last_updated)
+        except ValueError:
+            return None, "invalid 'last_updated'"
+
+    regulation = {key: value for key, value in document.items() if key != "_id"}
+    regulation.update({
+        "category": document["category"].strip(),
+        "content": document["content"].strip(),
+        "country": document["country"].strip().lower(),
+        "language": language if len(language) > 1 else language[0],
+        "keywords": [keyword.lower() for keyword in keywords],
+        "last_updated": last_updated,
+    })
+    regulation["content_hash"] = content_hash(regulation)
+    return regulation, None
+
+
+def content_hash(regulation: Dict) -> str:
+    """Hash of the fields that identify a regulation; metadata is excluded"""
+    language = regulation["language"]
+    canonical = json.dumps([
+        regulation["country"],
+        regulation["category"],
+        sorted(language) if isinstance(language, list) else [language],
+        regulation["content"],
+        regulation.get("source"),
+    ], ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class BulkLoader:
+    def __init__(self, db_ops=None, batch_size: Optional[int] = None, dry_run: bool = False):
+        if db_ops is None and not dry_run:
+            from app.database.operations import DatabaseOperations
+            db_ops = DatabaseOperations()
+        self.db_ops = db_ops
+        self.batch_size = batch_size or settings.bulk_load_batch_size
+        self.dry_run = dry_run
+        self._batch: List[Dict] = []
+        self._batch_hashes = set()
+        self.stats = {
+            "read": 0,
+            "invalid": 0,
+            "inserted": 0,
+            "duplicates": 0,
+            "write_errors": 0,
+        }
+        self.errors: List[str] = []  # first few validation/write errors
+        self._started = time.perf_counter()
+
+    def add(self, document):
+        self.stats["read"] += 1
+        regulation, error = validate_regulation(document)
+        if error:
+            self._record_error("invalid", f"document {self.stats['read']}: {error}")
+            return
+        if regulation["content_hash"] in self._batch_hashes:
+            self.stats["duplicates"] += 1
+            return
+        self._batch_hashes.add(regulation["content_hash"])
+        self._batch.append(regulation)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def load(self, documents: Iterable) -> Dict:
+        for document in documents:
+            self.add(document)
+        return self.finish()
+
+    def flush(self):
+        if not self._batch:
+            return
+        batch, self._batch, self._batch_hashes = self._batch, [], set()
+        if self.dry_run:
+            self.stats["inserted"] += len(batch)
+            return
+        from app.services.terms import document_terms
+
+        operations = []
+        for regulation, terms in zip(batch, document_terms(batch)):
+            regulation["terms"] = terms
+            operations.append(UpdateOne(
+                {"content_hash": regulation["content_hash"]},
+                {"$setOnInsert": regulation},
+                upsert=True
+            ))
+        try:
+            result = self.db_ops.bulk_upsert_regulations(operations)
+            details = result.bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            for write_error in details.get("writeErrors", []):
+                self._record_error("write_errors", write_error.get("errmsg", "write error"))
+        upserted = details.get("nUpserted", 0)
+        self.stats["inserted"] += upserted
+        self.stats["duplicates"] += details.get("nMatched", 0)
+
+    def finish(self) -> Dict:
+        self.flush()
+        return self.report()
+
+    def report(self) -> Dict:
+        elapsed = time.perf_counter() - self._started
+        return {
+            **self.stats,
+            "elapsed_seconds": round(elapsed, 3),
+            "documents_per_second": round(self.stats["read"] / elapsed, 1) if elapsed else 0.0,
+            "errors": self.errors,
+        }
+
+    def _record_error(self, counter: str, message: str):
+        self.stats[counter] += 1
+        if len(self.errors) < 20:
+            self.errors.append(message)
+
+
+def open_input(path: str) -> IO[bytes]:
+    if path == "-":
+        return sys.stdin.buffer
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream regulation documents into MongoDB")
+    parser.add_argument("paths", nargs="+", help="NDJSON/JSON files ('-' for stdin, .gz supported)")
+    parser.add_argument("--batch-size", type=int, default=settings.bulk_load_batch_size)
+    parser.add_argument("--dry-run", action="store_true", help="validate only, do not write")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    loader = BulkLoader(batch_size=args.batch_size, dry_run=args.dry_run)
+    for path in args.paths:
+        with open_input(path) as stream:
+            for document in iter_json_documents(iter_file_chunks(stream)):
+                loader.add(document)
+    report = loader.finish()
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["invalid"] or report["write_errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,191 @@
+"""
+Collector for regulation feeds published over HTTP.
+
+Fetches the feeds of settings.regulation_feeds concurrently over one pooled
+session and streams every response: the body is parsed incrementally
+(NDJSON, concatenated objects or one top-level JSON array, see
+JSONStreamParser), each record is mapped onto the regulation schema as it
+arrives and handed to a BulkLoader, which validates, deduplicates and
+upserts in batches. Memory is bounded by the bounded queue between the
+fetching threads and the loader, so feeds of any size can be collected.
+A malformed record is one invalid document; the records after it in the
+same feed are still collected.
+
+A feed is a URL or an object with
+- "url"
+- "fields": schema field -> field of the feed record, dotted for nested
+  fields (e.g. {"content": "rule.text"}); unmapped schema fields are looked
+  up under their usual names (FIELD_ALIASES)
+- "defaults": values for fields the records lack, e.g. {"country": "germany"}
+Records get the feed URL as their source unless they name one.
+
+Usage:
+    python -m app.data.collector [URL ...] [--concurrency 4] [--dry-run]
+"""
+import argparse
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Union
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from app.config import settings
+from app.data.bulk_loader import BulkLoader, JSONStreamParser
+
+logger = logging.getLogger(__name__)
+
+# Usual names of the schema fields in third-party feeds
+FIELD_ALIASES = {
+    "category": ["category", "topic", "type"],
+    "content": ["content", "text", "description", "rule"],
+    "country": ["country", "country_name"],
+    "language": ["language", "languages", "lang", "locale"],
+    "keywords": ["keywords", "tags"],
+    "fine_amount": ["fine_amount", "fine", "penalty"],
+    "source": ["source", "reference", "law"],
+    "last_updated": ["last_updated", "updated_at", "modified"],
+}
+CHUNK_SIZE = 1 << 16
+# Parsed chunks waiting for the loader, across all feeds
+QUEUE_CHUNKS = 64
+
+_FEED_DONE = object()
+
+
+def _field(record: Dict, path: str) -> Any:
+    value = record
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def map_record(record, feed: Dict) -> Any:
+    """The record with its fields renamed to the regulation schema; non-objects are passed on for the loader to reject"""
+    if not isinstance(record, dict):
+        return record
+    fields = feed.get("fields", {})
+    regulation = dict(feed.get("defaults", {}))
+    for field, aliases in FIELD_ALIASES.items():
+        names = [fields[field]] if field in fields else aliases
+        for name in names:
+            value = _field(record, name)
+            if value is not None:
+                regulation[field] = value
+                break
+    if isinstance(regulation.get("keywords"), str):
+        regulation["keywords"] = [keyword.strip() for keyword in regulation["keywords"].split(",") if keyword.strip()]
+    regulation.setdefault("source", feed["url"])
+    return regulation
+
 
 class DataCollector:
-    def __init__(self):
-        pass
-    
-    def fetch_regulations_from_source(self, url: str):
-        # This could be a web scrape or API call
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.json()
-        return {}
+    def __init__(self, feeds: Optional[List[Union[str, Dict]]] = None, concurrency: Optional[int] = None):
+        self.feeds = [self._feed(feed) for feed in (settings.regulation_feeds if feeds is None else feeds)]
+        self.concurrency = concurrency or settings.regulation_feed_concurrency
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats: Dict[str, Dict] = {}
+
+    @staticmethod
+    def _feed(feed: Union[str, Dict]) -> Dict:
+        return {"url": feed} if isinstance(feed, str) else feed
+
+    def fetch_regulations_from_source(self, url: str, feed: Optional[Dict] = None) -> Iterator[List]:
+        """Stream one feed, yielding the records mapped from each received chunk"""
+        feed = feed or self._feed(url)
+        stats = self.stats.setdefault(url, {"records": 0, "bytes": 0, "error": None})
+        timeout = settings.regulation_feed_timeout
+        with self.session.get(url, stream=True, timeout=(timeout, timeout)) as response:
+            response.raise_for_status()
+            parser = JSONStreamParser()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                stats["bytes"] += len(chunk)
+                records = parser.feed(chunk)
+                if records:
+                    stats["records"] += len(records)
+                    yield [map_record(record, feed) for record in records]
+            records = parser.close()
+            if records:
+                stats["records"] += len(records)
+                yield [map_record(record, feed) for record in records]
+
+    def iter_regulations(self) -> Iterator[Dict]:
+        """Mapped records of all feeds, fetched concurrently, in arrival order"""
+        chunks = queue.Queue(QUEUE_CHUNKS)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce(feed: Dict):
+            started = time.perf_counter()
+            try:
+                for records in self.fetch_regulations_from_source(feed["url"], feed):
+                    if not put(records):
+                        return
+            except (requests.RequestException, ValueError) as e:
+                self.stats[feed["url"]]["error"] = str(e)
+                logger.error(f"Regulation feed {feed['url']} failed: {e}")
+            finally:
+                self.stats[feed["url"]]["seconds"] = round(time.perf_counter() - started, 3)
+                put(_FEED_DONE)
+
+        for feed in self.feeds:
+            self.stats[feed["url"]] = {"records": 0, "bytes": 0, "error": None}
+        pending = len(self.feeds)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for feed in self.feeds:
+                pool.submit(produce, feed)
+            try:
+                while pending:
+                    item = chunks.get()
+                    if item is _FEED_DONE:
+                        pending -= 1
+                        continue
+                    yield from item
+            finally:
+                # Unblock the fetching threads if the consumer stops early
+                stop.set()
+
+    def collect(self, loader: Optional[BulkLoader] = None) -> Dict:
+        """Load every feed into the database; returns the loader report with per-feed stats"""
+        loader = loader or BulkLoader()
+        report = loader.load(self.iter_regulations())
+        report["feeds"] = self.stats
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect regulation feeds into MongoDB")
+    parser.add_argument("urls", nargs="*", help="feed URLs (default: settings.regulation_feeds)")
+    parser.add_argument("--concurrency", type=int, default=settings.regulation_feed_concurrency)
+    parser.add_argument("--batch-size", type=int, default=settings.bulk_load_batch_size)
+    parser.add_argument("--dry-run", action="store_true", help="validate only, do not write")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    collector = DataCollector(args.urls or None, args.concurrency)
+    report = collector.collect(BulkLoader(batch_size=args.batch_size, dry_run=args.dry_run))
+    print(json.dumps(report, indent=2))
+    failed = any(stats.get("error") for stats in report["feeds"].values())
+    sys.exit(1 if failed or report["write_errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
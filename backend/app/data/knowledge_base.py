@@ -0,0 +1,155 @@
+"""
+Offline knowledge base: canned answers per topic, chosen by keyword scoring
+when neither the web nor the database has an answer, and for degraded
+requests. Keys are the language codes the chat API answers in ("en-US", "de").
+"""
+
+OFFLINE_KNOWLEDGE = {
+    "en-US": {
+        "speed_limit": {
+            "keywords": ["speed", "limit", "fast", "mph", "kmh", "highway", "city", "urban"],
+            "response": "Speed limits vary by location and road type. Generally:\n• City/Urban areas: 25-35 mph (40-55 km/h)\n• Suburban areas: 35-45 mph (55-70 km/h)\n• Highways: 55-80 mph (90-130 km/h)\n• School zones: 15-25 mph (25-40 km/h)\n\nAlways check local speed limit signs as they may differ.",
+            "intent": "speed_limit"
+        },
+        "phone_driving": {
+            "keywords": ["phone", "cell", "mobile", "text", "call", "hands-free"],
+            "response": "Using a phone while driving is restricted in most places:\n• Handheld devices are typically prohibited\n• Hands-free calling is usually allowed\n• Texting while driving is illegal in most jurisdictions\n• Use voice commands or pull over safely to use your phone\n• Always prioritize safety over convenience.",
+            "intent": "phone_usage"
+        },
+        "alcohol_limit": {
+            "keywords": ["alcohol", "drink", "blood", "bac", "drunk", "dui", "dwi", "limit"],
+            "response": "Blood Alcohol Content (BAC) limits for drivers:\n• Most countries: 0.08% (0.08 g/100ml)\n• Some countries (like Germany): 0.05%\n• Commercial drivers: Often 0.04% or lower\n• New/young drivers: May have 0.00% tolerance\n\nBest practice: Don't drink and drive at all. Use designated drivers, taxis, or public transport.",
+            "intent": "alcohol_limit"
+        },
+        "seatbelt": {
+            "keywords": ["seatbelt", "seat belt", "buckle", "safety belt", "safety requirement", "safety", "belt"],
+            "response": "Seatbelt safety requirements:\n• Driver and all passengers must wear seatbelts\n• Children require appropriate car seats/booster seats based on age/weight\n• Front and rear seat passengers are required to buckle up\n• Failure to wear seatbelts can result in fines\n• Seatbelts reduce injury risk by about 45% and death risk by 50%\n• Always adjust seatbelt properly across chest and hips",
+            "intent": "safety_requirements"
+        },
+        "child_safety": {
+            "keywords": ["child seat", "car seat", "booster", "children", "kids", "infant", "toddler"],
+            "response": "Child safety seat requirements:\n• Rear-facing seats: Birth to 2 years (or until max height/weight)\n• Forward-facing seats: 2-4 years with harness\n• Booster seats: 4-8 years (until seatbelt fits properly)\n• Children under 13 should ride in back seat\n• Always follow manufacturer's instructions\n• Replace car seats after accidents",
+            "intent": "safety_requirements"
+        },
+        "phone_usage": {
+            "keywords": ["phone", "cell", "mobile", "text", "call", "hands-free", "bluetooth", "driving", "safety requirement"],
+            "response": "Phone usage safety requirements while driving:\n• Handheld phone calls are prohibited in most places\n• Texting while driving is illegal and extremely dangerous\n• Use hands-free/Bluetooth devices for calls\n• Voice commands are safer than manual input\n• Pull over safely if you must use your phone\n• Never text, email, or browse while driving",
+            "intent": "safety_requirements"
+        },
+        "stop_sign": {
+            "keywords": ["stop", "sign", "intersection", "complete stop"],
+            "response": "At a stop sign:\n• Come to a complete stop before the stop line\n• If no stop line, stop before entering the crosswalk\n• If no crosswalk, stop before entering the intersection\n• Look left, right, then left again\n• Yield to pedestrians and other vehicles with right-of-way\n• Proceed only when safe",
+            "intent": "stop_sign"
+        },
+        "parking": {
+            "keywords": ["park", "parking", "parallel", "reverse", "space", "curb", "meter", "zone"],
+            "response": "Parking regulations and tips:\n• No parking within 15 feet of fire hydrants\n• No parking in handicapped spaces without permits\n• Check time limits and pay parking meters\n• Parallel parking: Find space 1.5x car length, align mirrors, reverse with full turn, straighten, adjust\n• Don't block driveways, crosswalks, or bus stops\n• Park in same direction as traffic flow",
+            "intent": "parking_regulations"
+        },
+        "right_of_way": {
+            "keywords": ["right", "way", "yield", "priority", "who goes first", "intersection", "stop sign", "traffic light"],
+            "response": "Right-of-way rules at intersections:\n• At 4-way stop: First to arrive goes first, if simultaneous arrival, rightmost vehicle goes\n• At uncontrolled intersection: Vehicle on right has right-of-way\n• Left turns always yield to oncoming traffic\n• Emergency vehicles (ambulance, fire, police) always have right-of-way\n• Pedestrians have right-of-way at marked crosswalks\n• When in doubt, yield and proceed cautiously",
+            "intent": "right_of_way"
+        },
+        "traffic_signs": {
+            "keywords": ["traffic signs", "stop sign", "yield", "speed limit sign", "warning", "regulatory", "guide signs"],
+            "response": "Common traffic signs and meanings:\n• STOP: Complete stop required before proceeding\n• YIELD: Slow down, give right-of-way to other traffic\n• Speed Limit: Maximum safe speed allowed\n• No Parking: Parking prohibited in this area\n• School Zone: Reduced speed when children present\n• Construction Zone: Slow down, workers present\n• Always obey all posted traffic signs",
+            "intent": "traffic_signs"
+        },
+        "greeting": {
+            "keywords": ["hello", "hi", "help", "what can you do", "how are you", "hey", "good morning", "good afternoon", "good evening", "hey there", "what can you help", "what do you do"],
+            "response": "Hello! I'm Driver's Friend, your driving regulations assistant. I can help you with:\n• Speed limits and traffic rules\n• Parking regulations\n• Right-of-way rules\n• Safety requirements (seatbelts, phone usage)\n• Alcohol limits and DUI laws\n• Traffic signs and signals\n\nWhat driving question can I help you with today?",
+            "intent": "greeting"
+        },
+        "farewell": {
+            "keywords": ["bye", "goodbye", "see you", "thanks", "thank you", "thx", "that's all", "nothing else", 
+                       "thanks for your help", "thank you for your help", "appreciate it", "thank you so much", 
+                       "thanks a lot", "many thanks", "i appreciate it", "appreciate your help", "helpful", 
+                       "you helped me", "this helped", "very helpful"],
+            "response": "You're welcome! Drive safely and feel free to ask me anytime about traffic rules. Have a great day! 🚗",
+            "intent": "farewell"
+        },
+        "help": {
+            "keywords": ["help me", "what can you do", "capabilities", "features", "what do you know", "how can you help"],
+            "response": "I'm your personal driving assistant! I can help you with:\n\n🚦 Traffic Rules & Regulations\n🚗 Speed limits for different areas\n📱 Phone usage while driving\n🍺 Alcohol limits and DUI laws\n🔧 Parking and maneuvering tips\n⚠️ Safety requirements and best practices\n\nJust ask me any driving-related question!",
+            "intent": "help"
+        }
+    },
+    "de": {
+        "speed_limit": {
+            "keywords": ["geschwindigkeit", "limit", "schnell", "kmh", "autobahn", "stadt"],
+            "response": "Geschwindigkeitsbegrenzungen in Deutschland:\n• Innerorts: 50 km/h\n• Außerorts: 100 km/h\n• Autobahn: Richtgeschwindigkeit 130 km/h (oft keine Begrenzung)\n• Spielstraße: Schrittgeschwindigkeit\n• Bei Regen/schlechten Bedingungen gelten niedrigere Limits",
+            "intent": "speed_limit"
+        },
+        "alcohol_limit": {
+            "keywords": ["alkohol", "promille", "trinken", "betrunken", "fahren"],
+            "response": "Alkoholgrenzwerte in Deutschland:\n• Allgemein: 0,5 Promille\n• Fahranfänger (erste 2 Jahre): 0,0 Promille\n• Unter 21 Jahren: 0,0 Promille\n• Ab 0,3 Promille bei Fahrauffälligkeiten: Strafbar\n• Empfehlung: Gar nicht trinken wenn Sie fahren müssen",
+            "intent": "alcohol_limit"
+        },
+        "seatbelt": {
+            "keywords": ["sicherheitsgurt", "gurt", "anschnallen", "sicherheit", "safety"],
+            "response": "Sicherheitsgurt-Vorschriften in Deutschland:\n• Fahrer und alle Mitfahrer müssen angeschnallt sein\n• Kinder benötigen altersgerechte Kindersitze\n• Vorder- und Rücksitze: Anschnallpflicht\n• Verstoß kann Bußgeld zur Folge haben\n• Sicherheitsgurte reduzieren Verletzungsrisiko um 45%",
+            "intent": "safety_requirements"
+        },
+        "child_safety": {
+            "keywords": ["kindersitz", "kinder", "baby", "kleinkind", "sicherheit"],
+            "response": "Kindersicherheit im Auto:\n• Rückwärtsgerichtete Sitze: Geburt bis 2 Jahre\n• Vorwärtsgerichtete Sitze: 2-4 Jahre mit Gurt\n• Sitzerhöhung: 4-8 Jahre (bis Gurt richtig sitzt)\n• Kinder unter 12 Jahren sollten hinten sitzen\n• Nach Unfall Kindersitz ersetzen",
+            "intent": "safety_requirements"
+        },
+        "phone_usage": {
+            "keywords": ["handy", "telefon", "smartphone", "freisprechanlage", "telefonieren", "sms"],
+            "response": "Handy-Nutzung beim Fahren:\n• Handheld-Telefonate sind verboten\n• SMS oder WhatsApp während der Fahrt sind illegal\n• Freisprecheinrichtung oder Bluetooth verwenden\n• Sprachbefehle sind sicherer als manuelle Eingabe\n• Bei Bedarf sicher anhalten und parken",
+            "intent": "safety_requirements"
+        },
+        "parking": {
+            "keywords": ["parken", "parkplatz", "einparken", "parallel", "parkverbot"],
+            "response": "Parkvorschriften in Deutschland:\n• Nicht vor Feuerwehrzufahrten parken\n• Behindertenparkplätze nur mit Ausweis\n• Parkscheinautomaten und Zeiten beachten\n• Einparken: Platz 1,5x Autolänge, Spiegel ausrichten, rückwärts einparken\n• Nicht vor Einfahrten oder Zebrastreifen parken",
+            "intent": "parking_regulations"
+        },
+        "right_of_way": {
+            "keywords": ["vorfahrt", "vorrang", "kreuzung", "rechts vor links"],
+            "response": "Vorfahrtsregeln an Kreuzungen:\n• Rechts vor Links an gleichberechtigten Kreuzungen\n• Vorfahrtstraße hat immer Vorrang\n• Linksabbieger müssen Gegenverkehr durchlassen\n• Rettungsfahrzeuge haben immer Vorfahrt\n• Fußgänger an Zebrastreifen haben Vorrang\n• Im Zweifel: Vorsicht und nachgeben",
+            "intent": "right_of_way"
+        },
+        "traffic_signs": {
+            "keywords": ["verkehrszeichen", "schilder", "stop", "vorfahrt", "geschwindigkeit"],
+            "response": "Wichtige Verkehrszeichen:\n• STOP-Schild: Vollständig anhalten erforderlich\n• Vorfahrt gewähren: Verlangsamen, anderen Vorrang geben\n• Geschwindigkeitsbegrenzung: Höchstgeschwindigkeit beachten\n• Parkverbot: Parken in diesem Bereich verboten\n• Schulzone: Reduzierte Geschwindigkeit bei Kindern\n• Alle Verkehrszeichen sind zu befolgen",
+            "intent": "traffic_signs"
+        },
+        "greeting": {
+            "keywords": ["hallo", "hi", "guten tag", "guten morgen", "hey", "hilfe", "was kannst du", "wie geht"],
+            "response": "Hallo! Ich bin Driver's Friend, Ihr Assistent für Verkehrsregeln. Ich kann Ihnen helfen bei:\n• Geschwindigkeitsbegrenzungen\n• Verkehrsregeln und -zeichen\n• Parkvorschriften\n• Sicherheitsbestimmungen\n• Alkoholgrenzwerte\n\nWelche Frage zum Fahren kann ich Ihnen beantworten?",
+            "intent": "greeting"
+        },
+        "farewell": {
+            "keywords": ["tschüss", "auf wiedersehen", "danke", "vielen dank", "das wars", 
+                       "danke für die hilfe", "vielen dank für die hilfe", "ich schätze es", "danke vielmals", 
+                       "herzlichen dank", "besten dank", "danke schön", "dankeschön", "das hat geholfen", 
+                       "sehr hilfreich", "du hast mir geholfen", "das war hilfreich"],
+            "response": "Gerne geschehen! Fahren Sie sicher und fragen Sie mich jederzeit bei Verkehrsregeln. Schönen Tag noch! 🚗",
+            "intent": "farewell"
+        }
+    }
+}
+
+
+def best_match(message: str, language: str):
+    """The best scoring topic of the offline knowledge base for a message, or None"""
+    message_lower = message.lower()
+    knowledge_base = OFFLINE_KNOWLEDGE["de"] if language.startswith("de") else OFFLINE_KNOWLEDGE["en-US"]
+
+    # Score each category based on keyword matches
+    best, best_score = None, 0
+    for category, data in knowledge_base.items():
+        score = 0
+        for keyword in data["keywords"]:
+            if keyword in message_lower:
+                # Longer keywords get higher scores (more specific)
+                keyword_score = len(keyword)
+                # Exact word matches get bonus points
+                if f" {keyword} " in f" {message_lower} " or message_lower.startswith(keyword + " ") or message_lower.endswith(" " + keyword):
+                    keyword_score *= 2
+                score += keyword_score
+        if score > best_score:
+            best, best_score = data, score
+    return best
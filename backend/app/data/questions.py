@@ -0,0 +1,52 @@
+"""
+Static question lists used for chat suggestions and autocomplete.
+Keys are the language codes the chat API answers in ("en-US", "de").
+"""
+
+# Shown when the user has not asked anything yet
+POPULAR_QUESTIONS = {
+    "en-US": [
+        "What is the speed limit on highways?",
+        "Do I need to carry my driving license?",
+        "What's the alcohol limit for drivers?",
+        "When should I use headlights?",
+        "How do traffic circles work?"
+    ],
+    "de": [
+        "Wie hoch ist die Geschwindigkeitsbegrenzung auf Autobahnen?",
+        "Muss ich meinen Führerschein mitführen?",
+        "Wie hoch ist die Alkoholgrenze für Fahrer?",
+        "Wann sollte ich die Scheinwerfer einschalten?",
+        "Wie funktionieren Verkehrskreisel?"
+    ]
+}
+
+
+# Follow-up questions per answer intent
+RELATED_QUESTIONS = {
+    "speed_limit": {
+        "en-US": [
+            "What's the speed limit on highways?",
+            "What happens if I exceed the speed limit?",
+            "Are there different speed limits for trucks?"
+        ],
+        "de": [
+            "Wie hoch ist die Geschwindigkeitsbegrenzung auf Autobahnen?",
+            "Was passiert, wenn ich die Geschwindigkeitsbegrenzung überschreite?",
+            "Gibt es unterschiedliche Geschwindigkeitsbegrenzungen für LKWs?"
+        ]
+    },
+    "alcohol_limit": {
+        "en-US": [
+            "What are the penalties for drunk driving?",
+            "Is the alcohol limit different for new drivers?",
+            "How long should I wait after drinking before driving?"
+        ],
+        "de": [
+            "Welche Strafen gibt es für Trunkenheit am Steuer?",
+            "Ist die Alkoholgrenze für Fahranfänger anders?",
+            "Wie lange sollte ich nach dem Trinken warten, bevor ich fahre?"
+        ]
+    }
+}
+
@@ -1,10 +1,11 @@
-from app.database.operations import DatabaseOperations
+from app.database.indexes import reconcile
 
 def setup_database():
-    db_ops = DatabaseOperations()
-    # Example: create indexes, insert seed data, etc.
-    db_ops.db.regulations.create_index([("category", 1)])
-    db_ops.db.regulations.create_index([("language", 1)])
+    # The indexes are declared in app/database/indexes.py
+    report = reconcile()
+    for action in ("created", "conflicts", "extra"):
+        for index in report[action]:
+            print(f"{action}: {index['collection']}.{index['name']}")
     print("Database setup completed.")
 
 if __name__ == "__main__":
@@ -0,0 +1,106 @@
+"""
+Declarative registry of the MongoDB indexes.
+
+INDEXES lists, per collection, every index the queries of DatabaseOperations
+(and the loaders writing through it) rely on, with the methods each one
+serves. reconcile() compares the registry with the database: missing
+indexes are created, indexes that exist with other options (unique,
+partial filter) and indexes the registry does not know are reported but
+left alone, since dropping an index is a decision for an operator. It runs
+at startup (mongo_ensure_indexes) and from db_setup.
+
+benchmarks/check_indexes.py runs every DatabaseOperations query against a
+scratch database and fails if one of them plans to a collection scan;
+add the index here when it does.
+"""
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "regulations": [
+        {"keys": [("category", 1)], "queries": ["get_regulations"]},
+        # The language filters are unanchored regexes, which scan this index rather than the collection
+        {"keys": [("language", 1)],
+         "queries": ["get_categories", "get_regulation_titles", "get_regulation_keywords"]},
+        {"keys": [("keywords", 1)], "queries": ["search_regulations", "find_regulations_page"]},
+        # Inverted index of the normalised search terms (app/services/terms.py)
+        {"keys": [("terms", 1)], "queries": ["search_regulations", "find_regulations_page"]},
+        # Bulk loads upsert on the content hash; older documents may not have one
+        {"keys": [("content_hash", 1)],
+         "options": {"unique": True, "partialFilterExpression": {"content_hash": {"$exists": True}}},
+         "queries": ["bulk_upsert_regulations"]},
+    ],
+    "chat_history": [
+        {"keys": [("user_id", 1), ("timestamp", -1)], "queries": ["get_chat_history"]},
+    ],
+    # Popular question checkpoints are read per language and bucket by count
+    "popular_questions": [
+        {"keys": [("language", 1), ("bucket", 1), ("count", -1)], "queries": ["get_popular_question_counts"]},
+        {"keys": [("bucket", 1)], "queries": ["delete_popular_questions_before"]},
+    ],
+    # Answer tier analytics are read and expired by hour range (app/services/analytics.py)
+    "analytics_hourly": [
+        {"keys": [("hour", 1)], "queries": ["get_tier_stats", "delete_analytics_before"]},
+    ],
+    "analytics_slow_questions": [
+        {"keys": [("hour", 1), ("language", 1)], "queries": ["get_slow_questions", "delete_analytics_before"]},
+    ],
+    # meta is only read and written by _id (get_corpus_version, bump_corpus_version)
+    "meta": [],
+}
+# Index options compared by reconcile()
+COMPARED_OPTIONS = ("unique", "partialFilterExpression", "sparse", "expireAfterSeconds")
+
+
+def _key(keys) -> Tuple:
+    return tuple((field, int(direction) if isinstance(direction, float) else direction) for field, direction in keys)
+
+
+def reconcile(db=None) -> Dict[str, List[Dict]]:
+    """Create the missing indexes; returns the created, conflicting and extra ones"""
+    if db is None:
+        from app.database.operations import DatabaseOperations
+        db = DatabaseOperations().db
+    report = {"created": [], "conflicts": [], "extra": []}
+    collections = set(db.list_collection_names()) | set(INDEXES)
+    for collection in sorted(collections):
+        existing = {_key(info["key"]): (name, info) for name, info in db[collection].index_information().items()}
+        declared = set()
+        for spec in INDEXES.get(collection, []):
+            key = _key(spec["keys"])
+            declared.add(key)
+            options = spec.get("options", {})
+            if key not in existing:
+                name = db[collection].create_index(list(key), **options)
+                report["created"].append({"collection": collection, "name": name})
+                logger.info(f"Created index {name} on {collection}")
+                continue
+            name, info = existing[key]
+            differences = [option for option in COMPARED_OPTIONS if info.get(option) != options.get(option)]
+            if differences:
+                report["conflicts"].append({
+                    "collection": collection, "name": name,
+                    "existing": {option: info.get(option) for option in differences},
+                    "declared": {option: options.get(option) for option in differences},
+                })
+                logger.warning(f"Index {name} on {collection} differs from the registry in {', '.join(differences)}")
+        for key, (name, _) in existing.items():
+            if name != "_id_" and key not in declared:
+                report["extra"].append({"collection": collection, "name": name})
+                logger.warning(f"Index {name} on {collection} is not in the registry (app/database/indexes.py)")
+    return report
+
+
+def ensure_indexes(db=None) -> Optional[Dict[str, List[Dict]]]:
+    """reconcile() for startup: failures are logged rather than raised"""
+    if not settings.mongo_ensure_indexes:
+        return None
+    try:
+        return reconcile(db)
+    except Exception as e:
+        logger.error(f"Could not reconcile the indexes: {e}")
+        return None
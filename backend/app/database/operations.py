@@ -1,27 +1,101 @@
-from pymongo import MongoClient
+import os
+from bson import ObjectId
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError
 from typing import List, Optional
 from app.config import settings  # or wherever your config is stored
+from app.database import slow_queries
+from app.services.memory import register_component
+
+# Fields only the backend uses (search terms, bulk load dedup hash), left out of what the API returns
+INTERNAL_FIELDS = {"terms": 0, "content_hash": 0}
+
+_clients = {}
+
+def get_client(uri: str):
+    """
+    One client (and connection pool) per process and URI, shared by every
+    DatabaseOperations instance. Keyed by pid because pymongo clients must
+    not be shared across fork. A ``mongomock://`` URI gives an in-memory
+    stand-in for local load tests (requires the mongomock package). Clients
+    report slow commands to app/database/slow_queries.py.
+    """
+    key = (os.getpid(), uri)
+    if key not in _clients:
+        if uri.startswith("mongomock://"):
+            import mongomock
+            _clients[key] = mongomock.MongoClient()
+        else:
+            _clients[key] = MongoClient(uri, event_listeners=slow_queries.listeners(uri))
+    return _clients[key]
+
+def _clients_memory():
+    # Pool buffers are not measurable from here; enable tracemalloc and see by_package["pymongo"]
+    pools = {uri.split("@")[-1]: client.options.pool_options.max_pool_size if isinstance(client, MongoClient) else None
+             for (pid, uri), client in _clients.items() if pid == os.getpid()}
+    return {"entries": len(pools), "bytes": 0, "max_pool_sizes": pools}
+
+register_component("mongo_clients", _clients_memory)
 
 class DatabaseOperations:
     def __init__(self):
         # Connect to MongoDB using your config
-        self.client = MongoClient(settings.mongodb_uri)
+        self.client = get_client(settings.mongodb_uri)
         self.db = self.client[settings.database_name]
 
-    def search_regulations(self, keywords, language="en-US"):
+    def search_regulations(self, keywords, language="en-US", country: Optional[str] = None,
+                           limit: Optional[int] = None, terms: Optional[List[str]] = None):
         """
-        Search for rules that match any of the keywords and the specified language.
+        Search for rules that match any of the keywords (or normalised terms,
+        see app/services/terms.py) and the specified language.
         """
+        query = self._keyword_query(keywords, language, country, terms)
+        cursor = self.db.regulations.find(query, {"_id": 0, **INTERNAL_FIELDS})
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    def find_regulations_page(self, keywords, language="en-US", country: Optional[str] = None,
+                              category: Optional[str] = None, after_id: Optional[ObjectId] = None,
+                              limit: Optional[int] = None, fields: Optional[List[str]] = None,
+                              terms: Optional[List[str]] = None):
+        """
+        Keyset-paginated keyword search, ordered by _id.
+
+        Returns a cursor read in batches of settings.search_batch_size, so
+        memory stays flat however many documents match. Pass the _id of the
+        last document of the previous page as after_id to continue.
+        """
+        query = self._keyword_query(keywords, language, country, terms)
+        if category:
+            query["$and"].append({"category": category})
+        if after_id is not None:
+            query["$and"].append({"_id": {"$gt": after_id}})
+        projection = {field: 1 for field in fields} if fields else dict(INTERNAL_FIELDS)
+        cursor = self.db.regulations.find(query, projection).sort("_id", 1).batch_size(settings.search_batch_size)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
+
+    def _keyword_query(self, keywords, language: str, country: Optional[str],
+                       terms: Optional[List[str]] = None) -> dict:
+        match = {"keywords": {"$in": keywords}}  # Matches any keyword
+        if terms:
+            # Regulations indexed with terms also match on lemmas, stems and compound parts
+            match = {"$or": [match, {"terms": {"$in": terms}}]}
         query = {
             "$and": [
-                {"keywords": {"$in": keywords}},  # Matches any keyword
+                match,
                 {"language": {"$regex": language}} 
                 # Example: if your 'language' field is "[en-US], [en-GB], [en-IN]",
                 # you can use a regex to match "en-US"
             ]
         }
-        return list(self.db.regulations.find(query, {"_id": 0}))
-    def get_regulations(self, category: str, language: str = "en-US") -> List[dict]:
+        if country:
+            query["$and"].append({"country": country.lower()})
+        return query
+
+    def get_regulations(self, category: str, language: str = "en-US", country: Optional[str] = None) -> List[dict]:
         """
         Get regulations by category and language
         """
@@ -31,24 +105,49 @@ class DatabaseOperations:
                 {"language": {"$regex": language}}
             ]
         }
-        return list(self.db.regulations.find(query, {"_id": 0}))
-    def insert_regulation(self, regulations: List[dict]) -> None:
+        if country:
+            query["$and"].append({"country": country.lower()})
+        return list(self.db.regulations.find(query, {"_id": 0, **INTERNAL_FIELDS}))
+    def insert_regulation(self, regulations: List[dict]) -> dict:
         """
-        Insert new regulations into the database
+        Insert new regulations into the database, skipping documents that
+        are already stored (deduplicated by content hash)
         """
-        if isinstance(regulations, list):
-            self.db.regulations.insert_many(regulations)
-        else:
-            self.db.regulations.insert_one(regulations)
-            
-    def insert_regulation(self, regulations: List[dict]) -> None:
+        from app.data.bulk_loader import BulkLoader
+
+        if not isinstance(regulations, list):
+            regulations = [regulations]
+        return BulkLoader(self).load(regulations)
+
+    def bulk_upsert_regulations(self, operations: list):
         """
-        Insert new regulations into the database
+        Run a batch of upserts unordered, so one failing document does not
+        abort the rest of the batch
         """
-        if isinstance(regulations, list):
-            self.db.regulations.insert_many(regulations)
-        else:
-            self.db.regulations.insert_one(regulations)
+        try:
+            result = self.db.regulations.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # The other documents of the batch were still written
+            if any(e.details.get(count) for count in ("nInserted", "nUpserted", "nModified", "nRemoved")):
+                self.bump_corpus_version()
+            raise
+        if result.upserted_count or result.modified_count or result.inserted_count or result.deleted_count:
+            self.bump_corpus_version()
+        return result
+
+    def bump_corpus_version(self) -> int:
+        """Increment the regulation corpus version after a write (see app/services/corpus_version.py)"""
+        from app.services import corpus_version
+
+        document = self.db.meta.find_one_and_update(
+            {"_id": "regulations"}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        corpus_version.observe(document["version"])
+        return document["version"]
+
+    def get_corpus_version(self) -> int:
+        document = self.db.meta.find_one({"_id": "regulations"})
+        return document["version"] if document else 0
             
     def store_chat_message(self, message_data):
         return self.db.chat_history.insert_one(message_data)
@@ -59,14 +158,92 @@ class DatabaseOperations:
         {"_id": 0}
         ).sort("timestamp", -1).limit(limit))
     
-    def get_categories(self, language: str = "en-US") -> List[str]:
+    def get_categories(self, language: str = "en-US", country: Optional[str] = None) -> List[str]:
         """
         Get all available categories for a specific language
         """
+        match = {"language": {"$regex": language}}
+        if country:
+            match["country"] = country.lower()
         pipeline = [
-            {"$match": {"language": {"$regex": language}}},
+            {"$match": match},
             {"$group": {"_id": "$category"}},
             {"$sort": {"_id": 1}}
         ]
         result = list(self.db.regulations.aggregate(pipeline))
-        return [item["_id"] for item in result]
\ No newline at end of file
+        return [item["_id"] for item in result]
+
+    def get_regulation_titles(self, language: str = "en-US") -> List[str]:
+        """
+        Distinct regulation titles for a language; regulations without a
+        title contribute their category instead
+        """
+        pipeline = [
+            {"$match": {"language": {"$regex": language}}},
+            {"$group": {"_id": {"$ifNull": ["$title", "$category"]}}},
+        ]
+        return [item["_id"] for item in self.db.regulations.aggregate(pipeline)]
+
+    def get_regulation_keywords(self, language: str = "en-US") -> List[str]:
+        """Distinct keywords of the regulations in a language"""
+        return self.db.regulations.distinct("keywords", {"language": {"$regex": language}})
+
+
+    def increment_popular_questions(self, operations: list):
+        """Apply checkpointed question counts ($inc upserts) unordered"""
+        return self.db.popular_questions.bulk_write(operations, ordered=False)
+
+    def get_popular_question_counts(self, language: str, bucket: int, limit: int) -> List[dict]:
+        return list(self.db.popular_questions.find(
+            {"language": language, "bucket": bucket}, {"_id": 0}
+        ).sort("count", -1).limit(limit))
+
+    def delete_popular_questions_before(self, bucket: int):
+        return self.db.popular_questions.delete_many({"bucket": {"$lt": bucket}})
+
+    def increment_tier_stats(self, operations: list):
+        """Apply hourly answer tier aggregates ($inc upserts) unordered"""
+        return self.db.analytics_hourly.bulk_write(operations, ordered=False)
+
+    def increment_slow_questions(self, operations: list):
+        return self.db.analytics_slow_questions.bulk_write(operations, ordered=False)
+
+    def delete_analytics_before(self, hour):
+        self.db.analytics_hourly.delete_many({"hour": {"$lt": hour}})
+        self.db.analytics_slow_questions.delete_many({"hour": {"$lt": hour}})
+
+    def get_tier_stats(self, since, language: Optional[str] = None) -> List[dict]:
+        """Answers, latency and confidence sums per language, tier and source since an hour"""
+        match = {"hour": {"$gte": since}}
+        if language:
+            match["language"] = {"$regex": f"^{language}"}
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": {"language": "$language", "tier": "$tier", "source": "$source"},
+                        "count": {"$sum": "$count"}, "ms_sum": {"$sum": "$ms_sum"},
+                        "confidence_sum": {"$sum": "$confidence_sum"}}},
+            {"$sort": {"count": -1}},
+        ]
+        return [{**row["_id"], **{key: value for key, value in row.items() if key != "_id"}}
+                for row in self.db.analytics_hourly.aggregate(pipeline)]
+
+    def get_slow_questions(self, since, language: Optional[str] = None, limit: int = 20) -> List[dict]:
+        """The questions answered by slow tiers most often since an hour, with counts per tier"""
+        match = {"hour": {"$gte": since}}
+        if language:
+            match["language"] = {"$regex": f"^{language}"}
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": {"language": "$language", "question": "$question"},
+                        "count": {"$sum": "$count"}, "tiers": {"$push": "$tiers"}}},
+            {"$sort": {"count": -1}},
+            {"$limit": limit},
+        ]
+        rows = []
+        for row in self.db.analytics_slow_questions.aggregate(pipeline):
+            tiers = {}
+            for counts in row["tiers"]:
+                for tier, n in counts.items():
+                    tiers[tier] = tiers.get(tier, 0) + n
+            rows.append({**row["_id"], "count": row["count"], "tiers": tiers})
+        return rows
@@ -0,0 +1,215 @@
+"""
+Slow query log with query plans.
+
+A pymongo command listener, attached to the clients of get_client(), times
+every command. Reads and writes slower than mongo_slow_query_ms are logged
+with the shape of their filter (values replaced by "?") and a summary of
+their query plan, e.g. "FETCH > IXSCAN(category_1)" or "COLLSCAN". The plan
+comes from explain() in queryPlanner mode, run on a background thread so
+the slow request does not wait for it, and is reused for the same shape for
+mongo_explain_interval seconds. The thread is started per process, so
+workers forked from a master that already explained get their own.
+
+With mongo_collscan_check every explainable command is explained, however
+fast, and the plans are collected in the listener's explained list (see
+benchmarks/check_indexes.py).
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from app.config import settings
+from app.services.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Commands explain() accepts; updates and deletes are explained by their first statement
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+# Command fields explain() rejects or that only concern the session
+SESSION_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern",
+                  "$db", "$clusterTime", "$readPreference", "maxTimeMS"}
+# Explains waiting for the background thread; more are dropped
+MAX_PENDING_EXPLAINS = 100
+MAX_CACHED_PLANS = 1000
+MAX_EXPLAINED = 1000
+
+slow_queries = Counter("mongo_slow_queries_total", "Mongo commands over mongo_slow_query_ms by collection and command")
+collscans_total = Counter("mongo_collscans_total", "Explained Mongo commands planning a collection scan by collection")
+
+
+def shape(value):
+    """The structure of a filter with the values replaced, so equal queries log alike"""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [shape(value[0])] if value else []
+    return "?"
+
+
+def plan_summary(explain: Dict) -> Tuple[str, bool]:
+    """The winning plan as "STAGE > STAGE(index)" and whether it scans the collection"""
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        # Aggregations not pushed down entirely report the plan of their $cursor stage
+        for stage in explain.get("stages", []):
+            if "$cursor" in stage:
+                planner = stage["$cursor"].get("queryPlanner")
+                break
+    if planner is None:
+        return "unknown", False
+    plan = planner.get("winningPlan", {})
+    stages = []
+    collscan = _walk(plan.get("queryPlan", plan), stages)  # queryPlan: slot based engine
+    return " > ".join(stages), collscan
+
+
+def _walk(stage: Dict, stages: List[str]) -> bool:
+    name = stage.get("stage", "?")
+    stages.append(f"{name}({stage['indexName']})" if "indexName" in stage else name)
+    collscan = name == "COLLSCAN"
+    children = stage.get("inputStages") or ([stage["inputStage"]] if "inputStage" in stage else [])
+    if len(children) > 1:
+        branches = []
+        for child in children:
+            branch = []
+            collscan = _walk(child, branch) or collscan
+            branches.append(" > ".join(branch))
+        stages.append("[" + ", ".join(branches) + "]")
+    elif children:
+        collscan = _walk(children[0], stages) or collscan
+    return collscan
+
+
+def explain_command(command_name: str, command: Dict) -> Dict:
+    """The command in the form explain() takes"""
+    command = {key: value for key, value in command.items() if key not in SESSION_FIELDS}
+    for statements in ("updates", "deletes"):
+        if statements in command:
+            command[statements] = command[statements][:1]
+    return command
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    def __init__(self, uri: str):
+        self.uri = uri
+        self.explained: List[Dict] = []  # with mongo_collscan_check
+        self._started: Dict[Tuple, Tuple[str, str, Dict]] = {}
+        self._plans: Dict[str, Tuple[str, bool, float]] = {}  # shape -> (summary, collscan, explained at)
+        self._lock = threading.Lock()
+        self._explains = queue.Queue(MAX_PENDING_EXPLAINS)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None  # a forked child does not inherit the thread
+
+    def started(self, event):
+        if event.command_name in EXPLAINABLE:
+            with self._lock:
+                self._started[(event.connection_id, event.request_id)] = (
+                    event.database_name, event.command_name, event.command
+                )
+
+    def succeeded(self, event):
+        with self._lock:
+            started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        ms = event.duration_micros / 1000
+        slow = 0 < settings.mongo_slow_query_ms <= ms
+        if slow or settings.mongo_collscan_check:
+            self._submit(*started, ms if slow else None)
+
+    def failed(self, event):
+        with self._lock:
+            self._started.pop((event.connection_id, event.request_id), None)
+
+    def _submit(self, database: str, command_name: str, command: Dict, ms: Optional[float]):
+        collection = command.get(command_name)
+        if ms is not None:
+            slow_queries.inc(collection=str(collection), command=command_name)
+        filter_shape = self._filter_shape(command_name, command)
+        cached = self._plans.get(filter_shape)
+        if cached and time.monotonic() - cached[2] < settings.mongo_explain_interval and not settings.mongo_collscan_check:
+            self._log(collection, command_name, filter_shape, ms, cached[0])
+            return
+        with self._lock:
+            if self._thread_pid != os.getpid():
+                # Explains queued in the parent belong to its thread
+                self._explains = queue.Queue(MAX_PENDING_EXPLAINS)
+                self._thread = threading.Thread(target=self._run, name="mongo-explain", daemon=True)
+                self._thread.start()
+                self._thread_pid = os.getpid()
+        try:
+            self._explains.put_nowait((database, command_name, command, filter_shape, ms))
+        except queue.Full:
+            self._log(collection, command_name, filter_shape, ms, "not explained, explain queue full")
+
+    def _filter_shape(self, command_name: str, command: Dict) -> str:
+        if command_name == "aggregate":
+            query = [stage for stage in command.get("pipeline", []) if "$match" in stage][:1]
+        elif command_name in ("update", "delete"):
+            statements = command.get("updates") or command.get("deletes") or [{}]
+            query = statements[0].get("q", {})
+        else:
+            query = command.get("filter", command.get("query", {}))
+        return f"{command_name} {command.get(command_name)} {json.dumps(shape(query), default=str, sort_keys=True)}"
+
+    def _run(self):
+        while True:
+            database, command_name, command, filter_shape, ms = self._explains.get()
+            try:
+                self._explain(database, command_name, command, filter_shape, ms)
+            finally:
+                self._explains.task_done()
+
+    def _explain(self, database: str, command_name: str, command: Dict, filter_shape: str, ms: Optional[float]):
+        from app.database.operations import get_client
+
+        collection = command.get(command_name)
+        try:
+            explain = get_client(self.uri)[database].command(
+                {"explain": explain_command(command_name, command), "verbosity": "queryPlanner"}
+            )
+            summary, collscan = plan_summary(explain)
+        except Exception as e:
+            summary, collscan = f"explain failed: {e}", False
+        with self._lock:
+            if len(self._plans) >= MAX_CACHED_PLANS:
+                self._plans.clear()
+            self._plans[filter_shape] = (summary, collscan, time.monotonic())
+            if settings.mongo_collscan_check and len(self.explained) < MAX_EXPLAINED:
+                self.explained.append({"query": filter_shape, "plan": summary, "collscan": collscan})
+        if collscan:
+            collscans_total.inc(collection=str(collection))
+        self._log(collection, command_name, filter_shape, ms, summary)
+
+    def _log(self, collection, command_name: str, filter_shape: str, ms: Optional[float], summary: str):
+        if ms is not None:
+            logger.warning(f"Slow Mongo {command_name} on {collection} ({ms:.0f} ms): {filter_shape}; plan {summary}")
+        elif "COLLSCAN" in summary:
+            logger.error(f"Mongo {command_name} on {collection} scans the collection: {filter_shape}")
+
+    def wait_for_explains(self):
+        """Block until the queued explains ran"""
+        self._explains.join()
+
+
+_listeners: Dict[str, SlowQueryListener] = {}
+
+
+def listeners(uri: str) -> List[SlowQueryListener]:
+    """Event listeners for a new client of uri; none when both the slow query log and the check are off"""
+    if settings.mongo_slow_query_ms <= 0 and not settings.mongo_collscan_check:
+        return []
+    if uri not in _listeners:
+        _listeners[uri] = SlowQueryListener(uri)
+    return [_listeners[uri]]
+
+
+def monitor(uri: Optional[str] = None) -> Optional[SlowQueryListener]:
+    """The listener of the clients of uri (default settings.mongodb_uri), if any"""
+    return _listeners.get(uri or settings.mongodb_uri)
@@ -1,6 +1,13 @@
+import asyncio
 import uvicorn
 from fastapi import FastAPI
+from app import startup
+from app.database import indexes
+from app.nlp.executor import shutdown_nlp_executor
+from app.services import admission, analytics, corpus_version, memory, popularity, recrawl
+from app.services.profiling import ProfilingMiddleware, profiling_enabled
 from app.config import settings
+from app.api.responses import CompressionMiddleware
 from app.api.routes import router
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -15,13 +22,51 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+app.add_middleware(CompressionMiddleware)
+
+# Profile requests that ask for it (or a sample); not installed at all when off
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
 # Include all your API endpoints from routes.py
 app.include_router(router, prefix="/api")
 
+if settings.debug_memory_enabled:
+    from app.api.debug import router as debug_router
+    app.include_router(debug_router)
+
+@app.on_event("startup")
+async def start_warm_up():
+    # Warm up in the background; /api/health/ready gates traffic until done
+    asyncio.ensure_future(startup.warm_up_async())
+    # Create missing indexes without holding up startup when Mongo is slow to answer
+    asyncio.get_event_loop().run_in_executor(None, indexes.ensure_indexes)
+    recrawl.start_recrawl()
+    popularity.start_checkpoints()
+    corpus_version.start_refresh()
+    analytics.start_flushes()
+    admission.controller.start()
+    memory.start_budget_checks()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await recrawl.stop_recrawl()
+    await popularity.stop_checkpoints()
+    await corpus_version.stop_refresh()
+    await analytics.stop_flushes()
+    await admission.controller.stop()
+    await memory.stop_budget_checks()
+    shutdown_nlp_executor()
+
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",    # "module:variable"
-        host="0.0.0.0",
-        port=8000,
-        reload=settings.debug
-    )
+    if settings.debug:
+        uvicorn.run(
+            "app.main:app",    # "module:variable"
+            host=settings.host,
+            port=settings.port,
+            reload=True
+        )
+    else:
+        # Multi-worker serving with models preloaded before fork
+        from app.server import run
+        run()
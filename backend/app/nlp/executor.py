@@ -0,0 +1,197 @@
+"""
+Micro-batching executor for spaCy calls.
+
+Concurrent requests for the same operation and language are gathered into a
+batch until it holds nlp_max_batch_size texts or the first text has waited
+nlp_max_wait_ms. The batch then runs through nlp.pipe in a pool of worker
+processes, so spaCy's CPU work neither blocks the event loop nor serialises
+concurrent chats behind the GIL. Every caller awaits its own future.
+
+The pool is created lazily in the serving process. With the fork start method
+its processes inherit the models preloaded in the server master (see
+app/server.py); otherwise each process loads them in its initializer. With
+nlp_pool_workers = 0 batches run on the event loop's default thread pool, as
+do the batches the pool cannot take or loses when it breaks.
+"""
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.nlp.processor import load_models, run_batch
+from app.services.memory import register_component, rss_bytes
+from app.services.metrics import Histogram
+from app.services.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+batch_sizes = Histogram("nlp_batch_size", "Texts per NLP batch", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+batch_seconds = Histogram("nlp_batch_duration_seconds", "Time from flushing an NLP batch to its results")
+
+
+class NLPExecutor:
+    def __init__(self, workers: Optional[int] = None, max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None, start_method: Optional[str] = None):
+        self.workers = settings.nlp_pool_workers if workers is None else workers
+        self.max_batch_size = max(1, max_batch_size or settings.nlp_max_batch_size)
+        self.max_wait = (settings.nlp_max_wait_ms if max_wait_ms is None else max_wait_ms) / 1000
+        self.start_method = start_method or settings.nlp_pool_start_method
+        self._pending: Dict[Tuple[str, str], List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=load_models,
+                )
+            return self._pool
+
+    def warm_up(self):
+        """Start the pool processes and run one batch through each language"""
+        pool = self._get_pool()
+        if pool is not None:
+            for language in ("en", "de"):
+                pool.submit(run_batch, "extract_keywords", language, ["warm up"]).result()
+
+    async def extract_keywords(self, text: str, language: str = "en") -> List[str]:
+        return await self.submit("extract_keywords", text, language)
+
+    async def process_text(self, text: str, language: str = "en") -> Dict:
+        return await self.submit("process_text", text, language)
+
+    async def submit(self, operation: str, text: str, language: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (operation, language)
+        with self._lock:
+            batch = self._pending.setdefault(key, [])
+            batch.append((text, future))
+            full = len(batch) >= self.max_batch_size
+            if not full and len(batch) == 1:
+                self._timers[key] = loop.call_later(self.max_wait, self._flush, key)
+        if full:
+            self._flush(key)
+        with stage(f"nlp.{operation}"):
+            return await future
+
+    def _flush(self, key: Tuple[str, str]):
+        with self._lock:
+            batch = self._pending.pop(key, None)
+            timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        if not batch:
+            return
+        operation, language = key
+        texts = [text for text, _ in batch]
+        batch_sizes.observe(len(texts), operation=operation)
+        started = time.perf_counter()
+        try:
+            pool = self._get_pool()
+            if pool is not None:
+                pool.submit(run_batch, operation, language, texts).add_done_callback(
+                    lambda done: self._resolve(key, batch, done, started)
+                )
+                return
+        except Exception as e:
+            # A broken or shut down pool, or one that cannot start its processes
+            logger.error(f"NLP pool failed, running a batch of {len(batch)} in process: {e}")
+            self._reset_pool()
+        self._run_locally_or_fail(key, batch, started)
+
+    def _run_locally(self, key: Tuple[str, str], batch, started: float):
+        """Run a batch on the default thread pool of the loop its callers wait on"""
+        operation, language = key
+        texts = [text for text, _ in batch]
+        result = batch[0][1].get_loop().run_in_executor(None, run_batch, operation, language, texts)
+        result.add_done_callback(lambda done: self._resolve(key, batch, done, started))
+
+    def _run_locally_or_fail(self, key: Tuple[str, str], batch, started: float):
+        try:
+            self._run_locally(key, batch, started)
+        except Exception as e:
+            self._fail(batch, e)
+
+    def _resolve(self, key: Tuple[str, str], batch, done: Future, started: float):
+        batch_seconds.observe(time.perf_counter() - started)
+        error = done.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._reset_pool()
+            logger.error(f"NLP pool broke, running a batch of {len(batch)} in process: {error}")
+            loop = batch[0][1].get_loop()
+            loop.call_soon_threadsafe(self._run_locally_or_fail, key, batch, started)
+            return
+        if error is not None:
+            logger.error(f"NLP batch of {len(batch)} failed: {error}")
+            self._fail(batch, error)
+            return
+        for (_, future), result in zip(batch, done.result()):
+            future.get_loop().call_soon_threadsafe(_set_result, future, result)
+
+    def _fail(self, batch, error: BaseException):
+        for _, future in batch:
+            future.get_loop().call_soon_threadsafe(_set_exception, future, error)
+
+    def _reset_pool(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def shutdown(self):
+        self._reset_pool()
+
+    def memory_usage(self) -> Dict:
+        """RSS of the pool processes; pages shared with this process count in both"""
+        pids = list(self._pool._processes) if self._pool is not None else []
+        per_process = {pid: rss_bytes(pid) for pid in pids}
+        return {"entries": len(pids), "bytes": sum(per_process.values()), "per_process": per_process}
+
+
+def _set_result(future: asyncio.Future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, error: BaseException):
+    if not future.done():
+        future.set_exception(error)
+
+
+_executor: Optional[NLPExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_nlp_executor() -> NLPExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = NLPExecutor()
+        return _executor
+
+
+def _pool_memory() -> Dict:
+    return _executor.memory_usage() if _executor is not None else {"entries": 0, "bytes": 0}
+
+
+register_component("nlp_pool", _pool_memory)
+
+
+def shutdown_nlp_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
@@ -1,25 +1,78 @@
-import spacy
-import torch
+from app.services.memory import register_component, rss_bytes
+
+# spaCy pipelines are loaded once per process and shared by every
+# LanguageProcessor. When the app is preloaded in the server master (see
+# app/server.py) they are inherited by the forked workers copy-on-write.
+MODEL_NAMES = {
+    'en': 'en_core_web_sm',
+    'de': 'de_core_news_sm'
+}
+LANGUAGE_ALIASES = {
+    'en': 'en',
+    'en_us': 'en',
+    'en_gb': 'en',
+    'en_in': 'en',
+    'de': 'de'
+}
+_models = {}
+_model_bytes = {}  # RSS growth while loading each model
+
+def load_models():
+    """Load every configured spaCy pipeline into the process-wide cache"""
+    # spaCy is imported on first use so importing the API does not pay for it
+    import spacy
+
+    for language, model_name in MODEL_NAMES.items():
+        if language not in _models:
+            before = rss_bytes()
+            _models[language] = spacy.load(model_name)
+            _model_bytes[language] = max(rss_bytes() - before, 0)
+    return _models
+
+def _models_memory():
+    return {"entries": len(_models), "bytes": sum(_model_bytes.values()), "per_model": dict(_model_bytes)}
+
+register_component("spacy_models", _models_memory)
+
+def _keyword(token):
+    """Lemma of a token, so "limits" and "limit" are the same keyword; pipelines without a lemmatizer give the text"""
+    return (token.lemma_ or token.text).lower()
+
 class LanguageProcessor:
-    def __init__(self, device=torch.device("mps" if torch.backends.mps.is_available() else "cpu")):  # Apple MPS or CPU fallback
-        self.device = device
-        self.nlp = {
-            'en': spacy.load('en_core_web_sm'),
-            'en_us': spacy.load('en_core_web_sm'),
-            'en_gb': spacy.load('en_core_web_sm'),
-            'en_in': spacy.load('en_core_web_sm'),
-            'de': spacy.load('de_core_news_sm')
-        }
-        
+    def __init__(self):
+        models = load_models()
+        self.nlp = {alias: models[language] for alias, language in LANGUAGE_ALIASES.items()}
+
     def extract_keywords(self, text, language = 'en'):
         nlp = self.nlp.get(language, self.nlp['en'])
         doc = nlp(text)
-        return [token.text.lower() for token in doc if token.is_alpha]
-    
+        return [_keyword(token) for token in doc if token.is_alpha]
+
     def process_text(self, text, language='en'):
         nlp = self.nlp.get(language, self.nlp['en'])
         doc = nlp(text)
+        return self._summarize(doc)
+
+    def extract_keywords_batch(self, texts, language='en'):
+        """extract_keywords for many texts in one nlp.pipe pass"""
+        nlp = self.nlp.get(language, self.nlp['en'])
+        return [[_keyword(token) for token in doc if token.is_alpha] for doc in nlp.pipe(texts)]
+
+    def process_text_batch(self, texts, language='en'):
+        nlp = self.nlp.get(language, self.nlp['en'])
+        return [self._summarize(doc) for doc in nlp.pipe(texts)]
+
+    def _summarize(self, doc):
         return {
             'tokens': [token.text for token in doc],
             'entities': [(ent.text, ent.label_) for ent in doc.ents]
         }
+
+BATCH_OPERATIONS = {
+    'extract_keywords': LanguageProcessor.extract_keywords_batch,
+    'process_text': LanguageProcessor.process_text_batch,
+}
+
+def run_batch(operation, language, texts):
+    """Entry point of the NLP pool processes (see app/nlp/executor.py)"""
+    return BATCH_OPERATIONS[operation](LanguageProcessor(), texts, language)
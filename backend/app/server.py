@@ -0,0 +1,82 @@
+"""
+Production server entry point.
+
+Runs the FastAPI app under gunicorn with uvicorn workers. The app, its
+spaCy models and the spelling indexes are loaded once in the master process
+before the workers are forked, so their pages are shared copy-on-write
+between workers instead of being loaded again by each of them.
+"""
+import gc
+import logging
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from app import startup
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def post_worker_init(worker):
+    """gunicorn hook: a worker only reports ready once its models are usable"""
+    startup.warm_up()
+    if startup.is_ready():
+        worker.log.info("Worker %s ready", os.getpid())
+    else:
+        worker.log.error("Worker %s failed to warm up: %s", os.getpid(), startup.get_state()["error"])
+
+
+class ProductionServer(BaseApplication):
+    def __init__(self, app_path: str = "app.main:app", options: dict = None):
+        self.app_path = app_path
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        from gunicorn.util import import_app
+
+        if settings.preload_models:
+            from app.nlp.processor import load_models
+            from app.services.spelling import preload_indexes
+            from app.services.vector_index import preload_partitions
+            load_models()
+            preload_partitions(settings.served_countries)
+            preload_indexes()
+
+        app = import_app(self.app_path)
+
+        # Move everything loaded so far into the permanent generation so the
+        # cyclic GC in the workers does not touch (and thereby copy) the
+        # pages shared with the master.
+        gc.collect()
+        gc.freeze()
+        return app
+
+
+def get_server_options() -> dict:
+    return {
+        "bind": f"{settings.host}:{settings.port}",
+        "workers": settings.workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": settings.preload_models,
+        "max_requests": settings.max_requests,
+        "max_requests_jitter": settings.max_requests_jitter,
+        "graceful_timeout": settings.graceful_timeout,
+        "timeout": settings.worker_timeout,
+        "post_worker_init": post_worker_init,
+    }
+
+
+def run():
+    logger.info("Starting production server with %s workers", settings.workers)
+    ProductionServer(options=get_server_options()).run()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,117 @@
+"""
+Admission control for the chat and search endpoints.
+
+A request is rejected with 429 when its user has exhausted their token
+bucket, and shed with 503 when the worker already has admission_max_in_flight
+requests in progress. Between admission_degrade_in_flight and that limit, or
+while the event loop lags by more than admission_max_loop_lag_ms, chat
+requests are admitted degraded: answered from the response cache or the
+offline knowledge base without NLP, web or database work.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.config import settings
+from app.services.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+ADMITTED = "admitted"
+DEGRADED = "degraded"
+SHED = "shed"
+RATE_LIMITED = "rate_limited"
+
+# Interval of the event-loop lag probe, in seconds
+LAG_PROBE_INTERVAL = 0.1
+
+admission_decisions = Counter("admission_requests_total", "Admission decisions (admitted, degraded, shed, rate_limited)")
+
+
+class TokenBuckets:
+    """Per-user token buckets; the least recently seen users are forgotten first"""
+
+    def __init__(self, rate: float, burst: float, max_users: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # user -> [tokens, updated at]
+
+    def allow(self, user_id: str) -> bool:
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = [self.burst, now]
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+
+class AdmissionController:
+    def __init__(self):
+        self.max_in_flight = settings.admission_max_in_flight
+        self.degrade_in_flight = settings.admission_degrade_in_flight
+        self.max_loop_lag = settings.admission_max_loop_lag_ms / 1000
+        self.buckets = TokenBuckets(settings.admission_user_rate, settings.admission_user_burst)
+        self.in_flight = 0
+        self.loop_lag = 0.0
+        self._lag_task: Optional[asyncio.Task] = None
+
+    def enter(self, user_id: Optional[str] = None) -> str:
+        """Decide on a request; unless it is shed or rate limited, call leave() when done"""
+        if user_id and settings.admission_user_rate > 0 and not self.buckets.allow(user_id):
+            decision = RATE_LIMITED
+        elif self.max_in_flight and self.in_flight >= self.max_in_flight:
+            decision = SHED
+        elif (self.degrade_in_flight and self.in_flight >= self.degrade_in_flight) or \
+                (self.max_loop_lag and self.loop_lag > self.max_loop_lag):
+            decision = DEGRADED
+        else:
+            decision = ADMITTED
+        admission_decisions.inc(decision=decision)
+        if decision in (ADMITTED, DEGRADED):
+            self.in_flight += 1
+        return decision
+
+    def leave(self):
+        self.in_flight -= 1
+
+    def retry_after(self, decision: str) -> int:
+        """Seconds a rejected client should wait"""
+        if decision == RATE_LIMITED and settings.admission_user_rate > 0:
+            return max(1, round(1 / settings.admission_user_rate))
+        return 1
+
+    async def _probe_loop_lag(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            lag = time.monotonic() - started - LAG_PROBE_INTERVAL
+            # Rise at once, decay gradually, so one quiet probe does not end degradation
+            self.loop_lag = max(lag, self.loop_lag * 0.8)
+
+    def start(self):
+        if self._lag_task is None:
+            self._lag_task = asyncio.ensure_future(self._probe_loop_lag())
+
+    async def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+
+
+controller = AdmissionController()
+
+Gauge("admission_in_flight", "Chat and search requests in progress",
+      callback=lambda: {(): controller.in_flight})
+Gauge("event_loop_lag_seconds", "Smoothed event loop scheduling lag",
+      callback=lambda: {(): round(controller.loop_lag, 4)})
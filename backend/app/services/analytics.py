@@ -0,0 +1,249 @@
+"""
+Answer-tier analytics.
+
+Every processed chat message emits a compact event: time, language, topic,
+tier (with the website for web answers), latency, confidence and whether
+the request was degraded. Events are buffered per worker and every
+analytics_flush_interval seconds
+- appended to an hourly NDJSON log in analytics_dir, one O_APPEND write per
+  flush so the workers share the files; logs older than
+  analytics_retention_days are deleted
+- rolled up into per-hour aggregates in Mongo with $inc upserts, so workers
+  and restarts add up: analytics_hourly counts answers, latency and
+  confidence per (hour, language, tier, source, topic), and
+  analytics_slow_questions counts the questions answered by a slow tier
+  (analytics_slow_tiers, or slower than analytics_slow_ms)
+
+Report the tier mix and the questions that most often hit the slow tiers,
+i.e. what to ingest next:
+    python -m app.services.analytics --hours 168 --limit 20
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from app.config import resolve_path, settings
+from app.database.operations import DatabaseOperations
+from app.services.autocomplete import normalize
+from app.services.memory import deep_sizeof, register_component
+from app.services.metrics import Counter
+from app.services.tier_planner import message_topic
+
+logger = logging.getLogger(__name__)
+
+# Distinct slow questions buffered per worker between flushes; more are dropped
+MAX_PENDING_QUESTIONS = 10000
+
+chat_answers = Counter("chat_answers_total", "Answered chat messages by tier and language")
+dropped_events = Counter("analytics_dropped_questions_total", "Slow questions not recorded because the buffer was full")
+
+
+def _hour(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+class AnalyticsRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._log_lines: Dict[datetime, List[str]] = {}  # hour -> NDJSON lines not yet written
+        self._tiers: Dict[Tuple, List[float]] = {}  # (hour, language, tier, source, topic) -> [count, ms, confidence]
+        self._questions: Dict[Tuple, Dict[str, int]] = {}  # (hour, language, question) -> {tier: count}
+
+    def record(self, message: str, language: str, result: Dict, seconds: float):
+        now = time.time()
+        tier = result.get("tier") or "unknown"
+        source = (result.get("source") or "") if tier == "web" else ""
+        plan = result.get("plan") or {}
+        topic = plan.get("topic") or message_topic(message, language)
+        ms = round(seconds * 1000, 1)
+        confidence = result.get("confidence", 0.0)
+        event = {"ts": round(now, 3), "language": language, "topic": topic, "tier": tier, "source": source,
+                 "ms": ms, "confidence": confidence, "degraded": result.get("degraded", False),
+                 "question": normalize(message)}
+        chat_answers.inc(tier=tier, language=language)
+        hour = _hour(now)
+        slow = tier in settings.analytics_slow_tiers or ms >= settings.analytics_slow_ms
+        with self._lock:
+            self._log_lines.setdefault(hour, []).append(json.dumps(event, ensure_ascii=False))
+            totals = self._tiers.setdefault((hour, language, tier, source, topic), [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += ms
+            totals[2] += confidence
+            if slow and event["question"]:
+                key = (hour, language, event["question"])
+                tiers = self._questions.get(key)
+                if tiers is None:
+                    if len(self._questions) >= MAX_PENDING_QUESTIONS:
+                        dropped_events.inc()
+                        return
+                    tiers = self._questions[key] = {}
+                tiers[tier] = tiers.get(tier, 0) + 1
+
+    def flush(self) -> int:
+        """Append the buffered events to the logs and roll them up into Mongo; returns the number rolled up"""
+        with self._lock:
+            log_lines, self._log_lines = self._log_lines, {}
+            tiers, self._tiers = self._tiers, {}
+            questions, self._questions = self._questions, {}
+        self._write_logs(log_lines)
+        if not tiers:
+            return 0
+        db_ops = DatabaseOperations()
+        try:
+            db_ops.increment_tier_stats(self._tier_operations(tiers))
+        except Exception as e:
+            logger.error(f"Analytics roll-up failed: {e}")
+            self._restore(tiers, questions)
+            return 0
+        if questions:
+            try:
+                db_ops.increment_slow_questions(self._question_operations(questions))
+            except Exception as e:
+                logger.error(f"Analytics roll-up of slow questions failed: {e}")
+                self._restore({}, questions)
+        try:
+            db_ops.delete_analytics_before(_hour(time.time()) - timedelta(days=settings.analytics_retention_days))
+        except Exception as e:
+            logger.warning(f"Could not delete old analytics: {e}")
+        return int(sum(totals[0] for totals in tiers.values()))
+
+    def _write_logs(self, log_lines: Dict[datetime, List[str]]):
+        if not log_lines:
+            return
+        try:
+            directory = resolve_path(settings.analytics_dir)
+            os.makedirs(directory, exist_ok=True)
+            for hour, lines in log_lines.items():
+                path = os.path.join(directory, f"events-{hour:%Y%m%d%H}.ndjson")
+                fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, ("\n".join(lines) + "\n").encode("utf-8"))
+                finally:
+                    os.close(fd)
+            self._delete_old_logs()
+        except OSError as e:
+            logger.error(f"Could not write the analytics log: {e}")
+
+    def _delete_old_logs(self):
+        cutoff = f"events-{_hour(time.time()) - timedelta(days=settings.analytics_retention_days):%Y%m%d%H}"
+        directory = resolve_path(settings.analytics_dir)
+        for name in os.listdir(directory):
+            if name.startswith("events-") and name < cutoff:
+                os.remove(os.path.join(directory, name))
+
+    def _tier_operations(self, tiers: Dict[Tuple, List[float]]) -> List[UpdateOne]:
+        return [
+            UpdateOne(
+                {"_id": f"{hour:%Y%m%d%H}:{language}:{tier}:{source}:{topic}"},
+                {"$inc": {"count": count, "ms_sum": ms, "confidence_sum": confidence},
+                 "$setOnInsert": {"hour": hour, "language": language, "tier": tier, "source": source,
+                                  "topic": topic}},
+                upsert=True,
+            )
+            for (hour, language, tier, source, topic), (count, ms, confidence) in tiers.items()
+        ]
+
+    def _question_operations(self, questions: Dict[Tuple, Dict[str, int]]) -> List[UpdateOne]:
+        return [
+            UpdateOne(
+                {"_id": f"{hour:%Y%m%d%H}:{language}:{hashlib.sha1(question.encode('utf-8')).hexdigest()[:16]}"},
+                {"$inc": {"count": sum(counts.values()), **{f"tiers.{tier}": n for tier, n in counts.items()}},
+                 "$setOnInsert": {"hour": hour, "language": language, "question": question}},
+                upsert=True,
+            )
+            for (hour, language, question), counts in questions.items()
+        ]
+
+    def _restore(self, tiers: Dict[Tuple, List[float]], questions: Dict[Tuple, Dict[str, int]]):
+        """Put the deltas of a failed roll-up back for the next flush"""
+        with self._lock:
+            for key, (count, ms, confidence) in tiers.items():
+                totals = self._tiers.setdefault(key, [0, 0.0, 0.0])
+                totals[0] += count
+                totals[1] += ms
+                totals[2] += confidence
+            for key, counts in questions.items():
+                if key not in self._questions and len(self._questions) >= MAX_PENDING_QUESTIONS:
+                    dropped_events.inc()
+                    continue
+                pending = self._questions.setdefault(key, {})
+                for tier, n in counts.items():
+                    pending[tier] = pending.get(tier, 0) + n
+
+    def memory_usage(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._tiers) + len(self._questions),
+                    "bytes": deep_sizeof(self._log_lines) + deep_sizeof(self._tiers) + deep_sizeof(self._questions)}
+
+
+recorder = AnalyticsRecorder()
+register_component("analytics_buffer", recorder.memory_usage)
+_flush_task: Optional[asyncio.Task] = None
+
+
+def record_chat(message: str, language: str, result: Dict, seconds: float):
+    if settings.analytics_enabled:
+        recorder.record(message, language, result, seconds)
+
+
+async def _flush_loop():
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(settings.analytics_flush_interval)
+        await loop.run_in_executor(None, recorder.flush)
+
+
+def start_flushes():
+    global _flush_task
+    if _flush_task is None and settings.analytics_enabled:
+        _flush_task = asyncio.ensure_future(_flush_loop())
+
+
+async def stop_flushes():
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, recorder.flush)
+
+
+def report(hours: int, limit: int, language: Optional[str] = None):
+    since = _hour(time.time()) - timedelta(hours=hours - 1)
+    db_ops = DatabaseOperations()
+    rows = db_ops.get_tier_stats(since, language)
+    total = sum(row["count"] for row in rows) or 1
+    print(f"Answers since {since:%Y-%m-%d %H:00} UTC")
+    print(f"{'language':<10}{'tier':<11}{'source':<28}{'answers':>9}{'share':>8}{'avg ms':>9}{'avg conf':>10}")
+    for row in rows:
+        print(f"{row['language']:<10}{row['tier']:<11}{row['source'] or '-':<28}{row['count']:>9}"
+              f"{row['count'] / total:>8.1%}{row['ms_sum'] / row['count']:>9.0f}"
+              f"{row['confidence_sum'] / row['count']:>10.2f}")
+    print(f"\nTop questions answered by slow tiers ({', '.join(settings.analytics_slow_tiers)}, "
+          f"or over {settings.analytics_slow_ms:.0f} ms)")
+    print(f"{'count':>7}  {'language':<10}{'tiers':<28}question")
+    for row in db_ops.get_slow_questions(since, language, limit):
+        tiers = ", ".join(f"{tier} {n}" for tier, n in sorted(row["tiers"].items(), key=lambda item: -item[1]))
+        print(f"{row['count']:>7}  {row['language']:<10}{tiers:<28}{row['question']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer tier mix and the questions that hit the slow tiers")
+    parser.add_argument("--hours", type=int, default=24 * 7, help="hours to report, up to now")
+    parser.add_argument("--limit", type=int, default=20, help="slow questions to list")
+    parser.add_argument("--language", help="only this language, e.g. de")
+    args = parser.parse_args()
+    report(args.hours, args.limit, args.language)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Frequency-weighted prefix trie for question autocomplete.
+
+Phrases come from the static popular/related question lists, regulation
+titles and the questions users ask most. User questions are not inserted as
+they are asked: the most frequent ones in the popularity summary
+(app/services/popularity.py) asked by at least autocomplete_min_count users are
+promoted, at most autocomplete_max_popular per language, when the tries are
+rebuilt with each popularity checkpoint. Questions that drop out of the
+summary drop out of the trie, which keeps it bounded. Every phrase is inserted once per word
+start, so "speed li" also completes "What is the speed limit on highways?",
+with matches at the start of a phrase ranked higher. Each node keeps its
+top-k completions, so a lookup is a walk down the prefix and a slice.
+"""
+import logging
+import re
+import threading
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.data.questions import POPULAR_QUESTIONS, RELATED_QUESTIONS
+from app.database.operations import DatabaseOperations
+from app.services.memory import deep_sizeof, register_component
+from app.services.vector_index import language_key
+
+logger = logging.getLogger(__name__)
+
+# Weights per source; promoted user questions weigh their count
+POPULAR_WEIGHT = 5.0
+RELATED_WEIGHT = 3.0
+TITLE_WEIGHT = 2.0
+# Matches in the middle of a phrase rank below matches at its start
+INNER_MATCH_FACTOR = 0.5
+MAX_PHRASE_LENGTH = 120
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    text = _PUNCTUATION_RE.sub("", text.casefold())
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+class _Node:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.top: List[tuple] = []  # (score, key), best first
+
+
+class PrefixTrie:
+    def __init__(self, top_k: int = 10):
+        self.top_k = top_k
+        self.root = _Node()
+        self.weights: Dict[str, float] = {}
+        self.phrases: Dict[str, str] = {}  # normalized key -> phrase as shown
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.weights)
+
+    def add(self, phrase: str, weight: float = 1.0):
+        """Insert a phrase or raise its weight. Weights only ever grow."""
+        phrase = phrase.strip()
+        key = normalize(phrase)
+        if not key or len(key) > MAX_PHRASE_LENGTH:
+            return
+        with self._lock:
+            total = self.weights.get(key, 0.0) + weight
+            self.weights[key] = total
+            self.phrases.setdefault(key, phrase)
+            for start in self._word_starts(key):
+                score = total if start == 0 else total * INNER_MATCH_FACTOR
+                node = self.root
+                for char in key[start:]:
+                    child = node.children.get(char)
+                    if child is None:
+                        child = node.children[char] = _Node()
+                    node = child
+                    self._update_top(node, score, key)
+
+    def complete(self, prefix: str, limit: int = 5) -> List[str]:
+        key = normalize(prefix)
+        if prefix[-1:].isspace() and key:
+            key += " "  # "speed " should not complete "speedometer"
+        if not key:
+            return []
+        node = self.root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return [self.phrases[entry_key] for _, entry_key in node.top[:limit]]
+
+    @staticmethod
+    def _word_starts(key: str) -> List[int]:
+        return [0] + [i + 1 for i, char in enumerate(key) if char == " "]
+
+    def _update_top(self, node: _Node, score: float, key: str):
+        if len(node.top) >= self.top_k and score <= node.top[-1][0]:
+            return  # would not make the list; scores only grow, so key is not in it at a higher score
+        top = [entry for entry in node.top if entry[1] != key]
+        top.append((score, key))
+        top.sort(key=itemgetter(0), reverse=True)
+        # Readers never take the lock, so swap in a complete list
+        node.top = top[:self.top_k]
+
+
+_tries: Dict[str, PrefixTrie] = {}
+_titles: Dict[str, List[str]] = {}  # per language, so rebuilds do not query Mongo
+_promoted: Dict[str, Dict[str, int]] = {}  # language -> promoted key -> count
+_build_lock = threading.Lock()
+
+
+def humanize_title(title: str) -> str:
+    """Regulations without a title fall back to their category, e.g. 'speed_limit'"""
+    if "_" in title or title.islower():
+        return title.replace("_", " ").capitalize()
+    return title
+
+
+def build_trie(language: str, titles: Optional[List[str]] = None,
+               popular: Optional[List[Tuple[str, int]]] = None) -> PrefixTrie:
+    lang_key = "de" if language_key(language) == "de" else "en-US"
+    trie = PrefixTrie()
+    for question in POPULAR_QUESTIONS.get(lang_key, []):
+        trie.add(question, POPULAR_WEIGHT)
+    for questions in RELATED_QUESTIONS.values():
+        for question in questions.get(lang_key, []):
+            trie.add(question, RELATED_WEIGHT)
+    for title in titles or []:
+        trie.add(title, TITLE_WEIGHT)
+    for question, count in popular or []:
+        trie.add(question, float(count))
+    return trie
+
+
+def _regulation_titles(language: str) -> List[str]:
+    try:
+        titles = DatabaseOperations().get_regulation_titles(language_key(language))
+    except Exception as e:
+        logger.warning(f"Autocomplete built without regulation titles: {e}")
+        return []
+    return [humanize_title(title) for title in titles if title]
+
+
+def get_trie(language: str) -> PrefixTrie:
+    """Trie for a language, built on first use"""
+    key = language_key(language)
+    trie = _tries.get(key)
+    if trie is None:
+        with _build_lock:
+            trie = _tries.get(key)
+            if trie is None:
+                _titles[key] = _regulation_titles(key)
+                popular = promoted_questions(key)
+                trie = build_trie(key, _titles[key], popular)
+                _promoted[key] = {normalize(question): count for question, count in popular}
+                _tries[key] = trie
+                logger.info(f"Autocomplete trie for '{key}' built with {len(trie)} phrases")
+    return trie
+
+
+def promoted_questions(language: str) -> List[Tuple[str, int]]:
+    """User questions popular enough to suggest, with their counts"""
+    from app.services import popularity  # popularity imports normalize from here
+
+    promoted = []
+    for question, count in popularity.tracker.top(language, settings.autocomplete_max_popular):
+        question = _WHITESPACE_RE.sub(" ", question).strip()
+        if count >= settings.autocomplete_min_count and 3 <= len(question) <= MAX_PHRASE_LENGTH:
+            promoted.append((question, count))
+    return promoted
+
+
+def refresh_popular():
+    """Rebuild the built tries whose promoted user questions changed"""
+    for key in list(_tries):
+        popular = promoted_questions(key)
+        counts = {normalize(question): count for question, count in popular}
+        if counts == _promoted.get(key):
+            continue
+        trie = build_trie(key, _titles.get(key), popular)
+        with _build_lock:
+            # Readers never take the lock, so swap in a complete trie
+            _tries[key] = trie
+            _promoted[key] = counts
+        logger.info(f"Autocomplete trie for '{key}' rebuilt with {len(counts)} popular questions")
+
+
+def _tries_memory() -> Dict:
+    tries = list(_tries.values())
+    return {"entries": sum(len(trie) for trie in tries), "bytes": deep_sizeof(tries)}
+
+
+register_component("autocomplete_tries", _tries_memory)
+
+
+def complete(prefix: str, language: str, limit: int = 5) -> List[str]:
+    return get_trie(language).complete(prefix, limit)
+
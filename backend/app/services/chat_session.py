@@ -0,0 +1,101 @@
+"""
+Server-side state of a WebSocket chat connection (/api/ws/chat).
+
+A session lives as long as its connection and keeps what the HTTP endpoint
+rebuilds on every call: one ChatService, the conversation context under the
+session's user id, the language and the NLP analysis of earlier messages,
+so repeated questions skip keyword extraction. A language given on connect
+or with a message sticks for the following messages; until then it is
+detected per message.
+"""
+import logging
+import re
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.config import settings
+from app.services.chat_service import ChatService
+from app.services.memory import deep_sizeof, register_component
+from app.services.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+_GERMAN_WORDS = {
+    "ich", "ist", "sind", "der", "die", "das", "und", "nicht", "wie", "was", "wo", "wann", "warum",
+    "welche", "muss", "darf", "kann", "gibt", "es", "ein", "eine", "mit", "auf", "für", "auto", "hallo",
+}
+_WORD_RE = re.compile(r"\w+")
+
+_sessions = weakref.WeakSet()
+
+ws_messages = Counter("ws_chat_messages_total", "WebSocket chat messages by result")
+Gauge("ws_chat_sessions", "Open WebSocket chat sessions", callback=lambda: {(): len(_sessions)})
+
+
+def detect_language(text: str) -> str:
+    """"de" for German-looking text, "en-US" otherwise"""
+    if any(char in text for char in "äöüßÄÖÜ"):
+        return "de"
+    words = _WORD_RE.findall(text.lower())
+    german = sum(1 for word in words if word in _GERMAN_WORDS)
+    return "de" if words and german * 3 >= len(words) else "en-US"
+
+
+class ChatSession:
+    def __init__(self, user_id: Optional[str] = None, language: Optional[str] = None,
+                 country: Optional[str] = None, client: Optional[str] = None):
+        self.session_id = uuid.uuid4().hex
+        # Anonymous connections get a user id of their own, so context carries across messages
+        self.anonymous = not user_id
+        self.user_id = user_id or f"ws-{self.session_id}"
+        # Popular questions count people, so an anonymous session counts as its client address
+        self.asker = user_id or client
+        self.language = language
+        self.language_fixed = bool(language)
+        self.country = country or settings.default_country
+        self.service = ChatService()
+        self.analysis: "OrderedDict[tuple, object]" = OrderedDict()
+        self.messages = 0
+        _sessions.add(self)
+
+    def resolve_language(self, message: str, language: Optional[str] = None) -> str:
+        if language:
+            self.language, self.language_fixed = language, True
+        elif not self.language_fixed:
+            self.language = detect_language(message)
+        return self.language
+
+    async def answer(self, message: str, language: Optional[str] = None, country: Optional[str] = None,
+                     degraded: bool = False) -> Dict:
+        self.messages += 1
+        result = await self.service.process_message(
+            message=message,
+            language=self.resolve_language(message, language),
+            user_id=self.user_id,
+            country=country or self.country,
+            degraded=degraded,
+            analysis=self.analysis,
+            asker=self.asker
+        )
+        while len(self.analysis) > settings.ws_session_analysis_entries:
+            self.analysis.popitem(last=False)
+        return result
+
+    def close(self):
+        if self.anonymous:
+            self.service.forget_conversation(self.user_id)
+        _sessions.discard(self)
+        logger.debug(f"Chat session {self.session_id} closed after {self.messages} messages")
+
+    def memory_usage(self) -> int:
+        return deep_sizeof(self.analysis)
+
+
+def _sessions_memory() -> Dict:
+    sessions = list(_sessions)
+    return {"entries": len(sessions), "bytes": sum(session.memory_usage() for session in sessions)}
+
+
+register_component("ws_chat_sessions", _sessions_memory)
@@ -0,0 +1,64 @@
+"""
+Version stamp of the regulation corpus, for HTTP caching.
+
+Every write to the regulations (bulk loads, inserts, the terms backfill)
+increments a counter in the ``meta`` collection
+(DatabaseOperations.bump_corpus_version). Each worker keeps the last version
+it has seen: its own writes update it at once, those of other workers and
+hosts are picked up by re-reading it every corpus_version_refresh_interval
+seconds. The version is first read when the refresh task starts, and only
+ever re-read by that task, never on a request. The ETags of /categories and
+/search derive from it, so a conditional request is answered with 304 from
+memory, without touching Mongo.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_version: Optional[int] = None
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def observe(version: int):
+    global _version
+    _version = version
+
+
+def refresh() -> Optional[int]:
+    """Re-read the version from Mongo; keeps the last known one if that fails"""
+    from app.database.operations import DatabaseOperations
+
+    try:
+        observe(DatabaseOperations().get_corpus_version())
+    except Exception as e:
+        logger.warning(f"Could not read the corpus version: {e}")
+    return _version
+
+
+def current() -> Optional[int]:
+    """The corpus version, or None while it is unknown (responses then carry no ETag)"""
+    return _version
+
+
+async def _refresh_loop():
+    loop = asyncio.get_event_loop()
+    while True:
+        await loop.run_in_executor(None, refresh)
+        await asyncio.sleep(settings.corpus_version_refresh_interval)
+
+
+def start_refresh():
+    global _refresh_task
+    if _refresh_task is None:
+        _refresh_task = asyncio.ensure_future(_refresh_loop())
+
+
+async def stop_refresh():
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        _refresh_task = None
@@ -0,0 +1,180 @@
+"""
+Per-component memory accounting.
+
+Modules that hold memory for the lifetime of the process register a
+component: a function reporting its entry count and approximate bytes, and
+optionally a function that evicts entries. /debug/memory (enabled with
+DEBUG_MEMORY_ENABLED, authenticated with DEBUG_MEMORY_TOKEN) reports the breakdown next to the process RSS, plus the
+top tracemalloc allocation sites while tracing is on. Components over their
+budget in settings.memory_budgets_mb are trimmed if they can evict, and
+logged otherwise.
+"""
+import asyncio
+import logging
+import os
+import resource
+import sys
+import tracemalloc
+from typing import Callable, Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# name -> (usage function returning {"entries": int, "bytes": int, ...}, evict function or None)
+_components: Dict[str, tuple] = {}
+_budget_task: Optional[asyncio.Task] = None
+
+
+def register_component(name: str, usage: Callable[[], Dict], evict: Optional[Callable[[float], None]] = None):
+    """evict(keep_fraction) should drop all but roughly that fraction of the entries"""
+    _components[name] = (usage, evict)
+
+
+def rss_bytes(pid: Optional[int] = None) -> int:
+    """
+    Resident set size of this process or of pid. Without /proc, this process
+    reports its peak RSS and other processes report 0.
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if pid is not None:
+            return 0
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def deep_sizeof(obj, _seen=None) -> int:
+    """Approximate bytes held by an object graph of builtins and plain objects"""
+    seen = set() if _seen is None else _seen
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+        elif hasattr(item, "__slots__"):
+            stack.extend(getattr(item, slot) for slot in item.__slots__ if hasattr(item, slot))
+    return total
+
+
+def component_usage() -> Dict[str, Dict]:
+    budgets = settings.memory_budgets_mb
+    report = {}
+    for name, (usage, evict) in _components.items():
+        try:
+            row = dict(usage())
+        except Exception as e:
+            logger.error(f"Memory usage of {name} failed: {e}")
+            row = {"error": str(e)}
+        if name in budgets:
+            row["budget_bytes"] = int(budgets[name] * 1024 * 1024)
+        row["evictable"] = evict is not None
+        report[name] = row
+    return report
+
+
+def tracemalloc_top(limit: int, group_by: str = "lineno"):
+    if not tracemalloc.is_tracing():
+        return []
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    return [
+        {"site": str(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+        for stat in snapshot.statistics(group_by)[:limit]
+    ]
+
+
+def tracemalloc_by_package() -> Dict[str, int]:
+    """Traced bytes per top-level package, e.g. spacy, bs4, pymongo or app"""
+    if not tracemalloc.is_tracing():
+        return {}
+    totals: Dict[str, int] = {}
+    for stat in tracemalloc.take_snapshot().statistics("filename"):
+        path = stat.traceback[0].filename.replace(os.sep, "/")
+        if "/site-packages/" in path:
+            package = path.split("/site-packages/", 1)[1].split("/", 1)[0]
+        elif "/app/" in path:
+            package = "app"
+        else:
+            package = "other"
+        totals[package] = totals.get(package, 0) + stat.size
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def memory_report(top: int = 0) -> Dict:
+    report = {
+        "pid": os.getpid(),
+        "rss_bytes": rss_bytes(),
+        "components": component_usage(),
+        "tracemalloc": {"tracing": tracemalloc.is_tracing()},
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        report["tracemalloc"].update(current_bytes=current, peak_bytes=peak,
+                                     by_package=tracemalloc_by_package(), top=tracemalloc_top(top))
+    return report
+
+
+def enforce_budgets() -> Dict[str, str]:
+    """Trim or report every component over its budget; returns the action per component"""
+    actions = {}
+    for name, budget_mb in settings.memory_budgets_mb.items():
+        if name not in _components:
+            continue
+        usage, evict = _components[name]
+        try:
+            used = usage().get("bytes", 0)
+            budget = budget_mb * 1024 * 1024
+            if used <= budget:
+                continue
+            if evict is not None:
+                # Keep a little less than the budget so the next check does not trim again at once
+                evict(0.9 * budget / used)
+                actions[name] = "evicted"
+                logger.warning(f"Memory budget of {name} exceeded ({used} > {int(budget)} bytes); evicted entries")
+            else:
+                actions[name] = "warned"
+                logger.warning(f"Memory budget of {name} exceeded ({used} > {int(budget)} bytes)")
+        except Exception as e:
+            # One broken component must not stop the checks of the others
+            actions[name] = "failed"
+            logger.error(f"Memory budget check of {name} failed: {e}")
+    return actions
+
+
+async def _budget_loop():
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(settings.memory_check_interval)
+        try:
+            await loop.run_in_executor(None, enforce_budgets)
+        except Exception as e:
+            logger.error(f"Memory budget checks failed: {e}")
+
+
+def start_budget_checks():
+    global _budget_task
+    if settings.memory_budgets_mb and _budget_task is None:
+        _budget_task = asyncio.ensure_future(_budget_loop())
+
+
+async def stop_budget_checks():
+    global _budget_task
+    if _budget_task is not None:
+        _budget_task.cancel()
+        _budget_task = None
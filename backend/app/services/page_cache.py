@@ -0,0 +1,76 @@
+"""
+Cache of scraped pages, shared by the workers of a node.
+
+The scrapers serve pages from here while they are younger than
+settings.page_cache_max_age, so user requests only fetch a page when it is
+missing or stale, and concurrent requests for a missing page fetch it once
+(see app/services/shared_cache.py). The recrawl scheduler keeps the cache
+fresh in the background and uses the request counts of this worker to decide
+how often to recrawl a page.
+"""
+import hashlib
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+from app.config import settings
+from app.services.memory import register_component
+from app.services.response_cache import ResponseCache
+from app.services.shared_cache import JSONCodec, TieredCache
+
+# Pages are HTML, which compresses well
+PAGE_CODEC = JSONCodec(compress_level=6)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class PageCache:
+    def __init__(self):
+        self._pages = TieredCache(
+            "pages", ResponseCache(settings.page_cache_max_entries, settings.page_cache_max_age), PAGE_CODEC
+        )
+        self.request_counts = Counter()  # user-driven lookups per URL
+
+    def get(self, url: str, max_age: float) -> Optional[str]:
+        page = self._pages.get(url)
+        if page and time.time() - page["fetched_at"] <= max_age:
+            return page["html"]
+        return None
+
+    def get_or_fetch(self, url: str, fetch: Callable[[str], Optional[str]]) -> Optional[str]:
+        """A fresh page, fetched by one of the concurrent callers if it is missing"""
+        # Entries expire at page_cache_max_age, so a cached page is fresh
+        page = self._pages.get_or_compute(url, lambda: self._page(fetch(url)))
+        return page["html"] if page else None
+
+    def put(self, url: str, html: str) -> bool:
+        """Store a freshly fetched page; returns True if its content changed"""
+        page = self._page(html)
+        previous = self._pages.get(url)
+        self._pages.put(url, page)
+        return previous is None or previous["hash"] != page["hash"]
+
+    def _page(self, html: Optional[str]) -> Optional[Dict]:
+        if html is None:
+            return None
+        return {"html": html, "fetched_at": time.time(), "hash": content_hash(html)}
+
+    def record_request(self, url: str):
+        self.request_counts[url] += 1
+
+    def fetched_at(self, url: str) -> Optional[float]:
+        page = self._pages.get(url)
+        return page["fetched_at"] if page else None
+
+    def memory_usage(self) -> Dict:
+        return self._pages.memory_usage()
+
+    def evict(self, keep_fraction: float):
+        """Drop the least recently used pages of this worker"""
+        self._pages.evict(keep_fraction)
+
+
+page_cache = PageCache()
+register_component("page_cache", page_cache.memory_usage, page_cache.evict)
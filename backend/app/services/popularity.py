@@ -0,0 +1,252 @@
+"""
+Popular questions from live traffic.
+
+Every answered question is normalised and counted in a space-saving summary
+(Metwally et al.): at most `capacity` counters per language and time bucket;
+when a new question arrives at a full summary it takes over the smallest
+counter. Counts are then overestimates by at most that counter's error, and
+every question asked more than window_total / capacity times is guaranteed
+to be tracked. The buckets of the window are merged into a cached top list
+at most once per second, so serving the popular questions is a slice. The
+list is ranked and thresholded on the guaranteed counts (count - error), so
+a question that just took over a counter is not popular on its inherited
+count.
+
+A question is counted once per asker (user id, else client address) and
+bucket, so one client repeating a question does not make it popular; it
+takes popular_questions_min_count different askers.
+
+Count increments since the last checkpoint, including those of questions
+evicted from a summary since, are written to Mongo with $inc upserts, so
+the workers and restarts add up instead of overwriting each other; on first
+use a worker seeds its summaries from those counts.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from app.config import settings
+from app.database.operations import DatabaseOperations
+from app.services.autocomplete import normalize, refresh_popular
+from app.services.memory import deep_sizeof, register_component
+from app.services.vector_index import language_key
+
+logger = logging.getLogger(__name__)
+
+# Seconds the merged top list may lag behind the counters
+REFRESH_SECONDS = 1.0
+# (asker, question) pairs remembered per language and bucket; once full, further pairs are not counted
+MAX_ASKERS_PER_BUCKET = 50_000
+
+
+class SpaceSaving:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counters: Dict[str, List[int]] = {}  # key -> [count, error]
+        self.phrases: Dict[str, str] = {}
+        self.pending: Dict[str, int] = {}  # increments not yet checkpointed
+        self.evicted: Dict[str, Tuple[str, int]] = {}  # evicted key -> (phrase, increments not yet checkpointed)
+
+    def add(self, key: str, phrase: str, amount: int = 1, checkpoint: bool = True):
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += amount
+        elif len(self.counters) < self.capacity:
+            self.counters[key] = [amount, 0]
+            self.phrases[key] = phrase
+        else:
+            smallest = min(self.counters, key=lambda k: self.counters[k][0])
+            floor = self.counters.pop(smallest)[0]
+            evicted_phrase = self.phrases.pop(smallest)
+            if smallest in self.pending:
+                # Still owed to the store, which keeps counting the evicted question
+                self.restore(smallest, evicted_phrase, self.pending.pop(smallest))
+            self.counters[key] = [floor + amount, floor]
+            self.phrases[key] = phrase
+        if checkpoint:
+            self.pending[key] = self.pending.get(key, 0) + amount
+
+    def restore(self, key: str, phrase: str, amount: int):
+        """Put back increments to checkpoint, also for a key no longer counted here"""
+        if key in self.counters:
+            self.pending[key] = self.pending.get(key, 0) + amount
+        else:
+            _, evicted = self.evicted.get(key, (phrase, 0))
+            self.evicted[key] = (phrase, evicted + amount)
+
+    def take_pending(self) -> Dict[str, Tuple[str, int]]:
+        """key -> (phrase, increments) since the last checkpoint, evicted keys included"""
+        pending = {key: (self.phrases[key], amount) for key, amount in self.pending.items()}
+        for key, (phrase, amount) in self.evicted.items():
+            _, counted = pending.get(key, (phrase, 0))
+            pending[key] = (phrase, counted + amount)
+        self.pending, self.evicted = {}, {}
+        return pending
+
+
+class PopularityTracker:
+    def __init__(self, capacity: Optional[int] = None, window: Optional[int] = None,
+                 buckets: Optional[int] = None):
+        self.capacity = capacity or settings.popular_questions_capacity
+        self.buckets = buckets or settings.popular_questions_buckets
+        self.bucket_seconds = (window or settings.popular_questions_window) // self.buckets
+        self._summaries: Dict[str, Dict[int, SpaceSaving]] = {}  # language -> bucket -> summary
+        self._top: Dict[str, Tuple[float, List[Tuple[str, int]]]] = {}  # language -> (built at, top)
+        self._askers: Dict[Tuple[str, int], set] = {}  # (language, bucket) -> hashes of counted (asker, key)
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def current_bucket(self) -> int:
+        return int(time.time() // self.bucket_seconds)
+
+    def record(self, question: str, language: str, asker: str):
+        """Count a question once per asker and bucket"""
+        key = normalize(question)
+        if not key or not asker:
+            return
+        lang = language_key(language)
+        self._ensure_loaded(lang)
+        with self._lock:
+            summaries = self._summaries[lang]
+            bucket = self.current_bucket()
+            askers = self._askers.setdefault((lang, bucket), set())
+            pair = hash((asker, key))
+            if pair in askers or len(askers) >= MAX_ASKERS_PER_BUCKET:
+                return
+            askers.add(pair)
+            if bucket not in summaries:
+                summaries[bucket] = SpaceSaving(self.capacity)
+            summaries[bucket].add(key, question.strip())
+            self._dirty.add(lang)
+
+    def top(self, language: str, limit: int) -> List[Tuple[str, int]]:
+        """(phrase, guaranteed count) pairs, most asked first"""
+        lang = language_key(language)
+        self._ensure_loaded(lang)
+        built_at, top = self._top.get(lang, (0.0, []))
+        if lang in self._dirty and time.monotonic() - built_at > REFRESH_SECONDS:
+            top = self._merge(lang)
+        return top[:limit]
+
+    def _merge(self, lang: str) -> List[Tuple[str, int]]:
+        with self._lock:
+            oldest = self.current_bucket() - self.buckets + 1
+            summaries = self._summaries[lang]
+            for bucket in [bucket for bucket in summaries if bucket < oldest]:
+                del summaries[bucket]
+            for expired in [key for key in self._askers if key[0] == lang and key[1] < oldest]:
+                del self._askers[expired]
+            counts: Dict[str, int] = {}
+            phrases: Dict[str, str] = {}
+            for summary in summaries.values():
+                for key, (count, error) in summary.counters.items():
+                    counts[key] = counts.get(key, 0) + count - error
+                    phrases.setdefault(key, summary.phrases[key])
+            self._dirty.discard(lang)
+        top = sorted(((phrases[key], count) for key, count in counts.items() if count > 0),
+                     key=lambda item: -item[1])
+        self._top[lang] = (time.monotonic(), top[:self.capacity])
+        return top
+
+    def _ensure_loaded(self, lang: str):
+        if lang in self._summaries:
+            return
+        summaries = {}
+        try:
+            db_ops = DatabaseOperations()
+            current = self.current_bucket()
+            for bucket in range(current - self.buckets + 1, current + 1):
+                rows = db_ops.get_popular_question_counts(lang, bucket, self.capacity)
+                if rows:
+                    summary = summaries[bucket] = SpaceSaving(self.capacity)
+                    for row in rows:
+                        summary.add(row["key"], row["phrase"], row["count"], checkpoint=False)
+        except Exception as e:
+            logger.warning(f"Could not restore popular questions for '{lang}': {e}")
+        with self._lock:
+            if lang not in self._summaries:
+                self._summaries[lang] = summaries
+                self._dirty.add(lang)
+
+    def checkpoint(self):
+        """Write the increments since the last checkpoint to Mongo"""
+        with self._lock:
+            pending = [
+                (lang, bucket, key, phrase, amount)
+                for lang, summaries in self._summaries.items()
+                for bucket, summary in summaries.items()
+                for key, (phrase, amount) in summary.take_pending().items()
+            ]
+        if not pending:
+            return 0
+        operations = [
+            UpdateOne(
+                {"_id": f"{lang}:{bucket}:{key}"},
+                {"$inc": {"count": amount},
+                 "$setOnInsert": {"language": lang, "bucket": bucket, "key": key, "phrase": phrase}},
+                upsert=True,
+            )
+            for lang, bucket, key, phrase, amount in pending
+        ]
+        db_ops = DatabaseOperations()
+        try:
+            db_ops.increment_popular_questions(operations)
+            db_ops.delete_popular_questions_before(self.current_bucket() - self.buckets + 1)
+        except Exception as e:
+            logger.error(f"Popular questions checkpoint failed: {e}")
+            with self._lock:
+                for lang, bucket, key, phrase, amount in pending:
+                    summary = self._summaries[lang].get(bucket)
+                    if summary:
+                        summary.restore(key, phrase, amount)
+            return 0
+        return len(operations)
+
+    def memory_usage(self) -> Dict:
+        with self._lock:
+            entries = sum(len(summary.counters) for summaries in self._summaries.values()
+                          for summary in summaries.values())
+            return {"entries": entries, "bytes": deep_sizeof(self._summaries) + deep_sizeof(self._askers)}
+
+
+tracker = PopularityTracker()
+register_component("popular_questions", tracker.memory_usage)
+_checkpoint_task: Optional[asyncio.Task] = None
+
+
+def record_question(question: str, language: str, asker: str):
+    tracker.record(question, language, asker)
+
+
+def popular_questions(language: str, limit: int) -> List[str]:
+    """Questions asked by at least popular_questions_min_count askers in the window"""
+    return [phrase for phrase, count in tracker.top(language, limit)
+            if count >= settings.popular_questions_min_count]
+
+
+async def _checkpoint_loop():
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(settings.popular_questions_checkpoint_interval)
+        await loop.run_in_executor(None, tracker.checkpoint)
+        # Promote the questions now popular into autocomplete
+        await loop.run_in_executor(None, refresh_popular)
+
+
+def start_checkpoints():
+    global _checkpoint_task
+    if _checkpoint_task is None:
+        _checkpoint_task = asyncio.ensure_future(_checkpoint_loop())
+
+
+async def stop_checkpoints():
+    global _checkpoint_task
+    if _checkpoint_task is not None:
+        _checkpoint_task.cancel()
+        _checkpoint_task = None
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, tracker.checkpoint)
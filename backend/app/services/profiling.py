@@ -0,0 +1,232 @@
+"""
+Opt-in per-request profiling.
+
+A request is profiled when it carries ``X-Profile: 1`` together with
+``X-Profile-Token: <PROFILING_TOKEN>``, or when it is picked at random with
+PROFILING_SAMPLE_RATE. The request then runs under a profiler and writes to
+PROFILING_DIR, keyed by request id:
+- ``<request id>.collapsed``: sampled stacks of the event loop thread in
+  the collapsed format read by flamegraph.pl and speedscope (the default
+  "sample" mode), or ``<request id>.prof`` for cProfile/pstats with
+  PROFILING_MODE=cprofile
+- ``<request id>.json``: the stage breakdown recorded with ``stage()``
+  across chat, search, NLP and the scrapers
+
+Both profilers see the whole event loop thread, so a profile covers
+everything the loop ran while the request was in flight, concurrent
+requests included. cProfile installs one profile hook per thread, so only
+one cProfile run is active at a time: a request selected while another is
+being profiled runs unprofiled. The stage timings belong to this request
+only; they are also returned in a Server-Timing header.
+
+The middleware is only installed when a token or sample rate is configured.
+Without an active profile, ``stage()`` is one context variable lookup.
+"""
+import asyncio
+import contextvars
+import cProfile
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Optional
+
+from app.config import resolve_path, settings
+
+logger = logging.getLogger(__name__)
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Set while a cProfile run holds the event loop thread's profile hook
+_cprofile_active = False
+
+# Stage timings of the profiled request: name -> [count, seconds]
+_stages: contextvars.ContextVar[Optional[Dict[str, list]]] = contextvars.ContextVar("profile_stages", default=None)
+
+
+class _Stage:
+    __slots__ = ("stages", "name", "started")
+
+    def __init__(self, stages: Dict[str, list], name: str):
+        self.stages = stages
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        entry = self.stages.setdefault(self.name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += time.perf_counter() - self.started
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name: str):
+    """Time a block as a stage of the current request, if it is being profiled"""
+    stages = _stages.get()
+    return _NO_STAGE if stages is None else _Stage(stages, name)
+
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if frames:
+                self.counts[";".join(reversed(frames))] += 1
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class CProfiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path: str):
+        self.profile.dump_stats(path)
+
+
+def profiling_enabled() -> bool:
+    return bool(settings.profiling_token) or settings.profiling_sample_rate > 0
+
+
+def _should_profile(headers: Dict[str, str]) -> bool:
+    if settings.profiling_token and headers.get("x-profile") == "1":
+        token = headers.get("x-profile-token", "")
+        if hmac.compare_digest(token.encode(), settings.profiling_token.encode()):
+            return True
+    return settings.profiling_sample_rate > 0 and random.random() < settings.profiling_sample_rate
+
+
+def _prune(directory: str, keep: int):
+    files = sorted((os.path.join(directory, name) for name in os.listdir(directory)), key=os.path.getmtime)
+    for path in files[:max(len(files) - keep, 0)]:
+        os.remove(path)
+
+
+def _write_profile(profiler, request_id: str, summary: Dict):
+    directory = resolve_path(settings.profiling_dir)
+    os.makedirs(directory, exist_ok=True)
+    extension = "prof" if isinstance(profiler, CProfiler) else "collapsed"
+    profiler.write(os.path.join(directory, f"{request_id}.{extension}"))
+    with open(os.path.join(directory, f"{request_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    _prune(directory, settings.profiling_max_files)
+
+
+def _server_timing(stages: Dict[str, list]) -> str:
+    return ", ".join(f"{name.replace('.', '-')};dur={seconds * 1000:.1f}" for name, (_, seconds) in stages.items())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles requests selected by _should_profile"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _cprofile_active
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        if not _should_profile(headers):
+            return await self.app(scope, receive, send)
+        cprofile = settings.profiling_mode == "cprofile"
+        if cprofile and _cprofile_active:
+            logger.debug(f"Not profiling {scope['path']}: a cProfile run is already active")
+            return await self.app(scope, receive, send)
+
+        request_id = headers.get("x-request-id", "")
+        if not _REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex  # the id names files, so only accept safe ones
+        stages: Dict[str, list] = {}
+        token = _stages.set(stages)
+        if cprofile:
+            profiler = CProfiler()
+            _cprofile_active = True
+        else:
+            profiler = StackSampler(threading.get_ident(), settings.profiling_interval_ms / 1000)
+        status = {"code": None}
+        started = time.perf_counter()
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                extra = [(b"x-request-id", request_id.encode()), (b"x-profile-id", request_id.encode())]
+                if stages:
+                    extra.append((b"server-timing", _server_timing(stages).encode()))
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            profiler.stop()
+            if cprofile:
+                _cprofile_active = False
+            _stages.reset(token)
+            summary = {
+                "request_id": request_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status["code"],
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "stages": {name: {"count": count, "ms": round(seconds * 1000, 2)}
+                           for name, (count, seconds) in stages.items()},
+            }
+            loop = asyncio.get_event_loop()
+            try:
+                await loop.run_in_executor(None, _write_profile, profiler, request_id, summary)
+            except OSError as e:
+                logger.error(f"Could not write profile {request_id}: {e}")
@@ -0,0 +1,217 @@
+"""
+Background incremental recrawl of the scraped websites.
+
+Every known source page is recrawled on its own schedule: the base interval
+is shortened for pages whose topics users ask about often, clamped to the
+configured bounds and jittered so pages do not synchronise. Fetches run with
+a per-host concurrency limit. A page whose content hash is unchanged only
+refreshes its cache timestamp; a changed page is split into sections and only
+the sections that were added or removed since the last crawl (or, on the
+first crawl, since the index was built) are re-indexed.
+
+Of the workers of a node, the one holding the file lock at
+recrawl_lock_path fetches the pages and stores them in the shared page cache.
+The others follow on the same schedule without network traffic: they read the
+pages from the shared cache and re-index their own copy of the vector index.
+Followers retry the lock, so another worker takes over when the leader exits.
+"""
+import asyncio
+import logging
+import math
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional, Set
+from urllib.parse import urlparse
+
+from app.config import resolve_path, settings
+from app.services.metrics import Counter, Gauge, Histogram
+from app.services.page_cache import content_hash, page_cache
+from app.services.vector_index import get_vector_index, section_hash
+from app.services.web_scraper import WebSearchService
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows: every worker crawls
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Scraped sections are English and cover Germany only
+INDEX_PARTITION = ("germany", "en")
+
+crawl_duration = Histogram("recrawl_duration_seconds", "Time to fetch and process one page")
+crawl_bytes = Counter("recrawl_bytes_total", "Bytes fetched by the recrawler")
+crawl_pages = Counter("recrawl_pages_total", "Recrawled pages by result (changed, unchanged, missing, error) and role")
+crawl_sections = Counter("recrawl_sections_reindexed_total", "Sections added or removed by recrawls")
+
+_known_urls: Set[str] = set()
+
+
+def _staleness() -> Dict:
+    now = time.time()
+    values = {}
+    for url in list(page_cache.request_counts) + list(_known_urls):
+        fetched_at = page_cache.fetched_at(url)
+        if fetched_at is not None:
+            values[(("url", url),)] = round(now - fetched_at, 1)
+    return values
+
+
+page_staleness = Gauge("page_staleness_seconds", "Age of the cached copy of each source page", callback=_staleness)
+
+
+class RecrawlScheduler:
+    def __init__(self, web_search_service: Optional[WebSearchService] = None):
+        self.web_search_service = web_search_service or WebSearchService()
+        self.pages = {page["url"]: page for page in self.web_search_service.source_pages()}
+        _known_urls.update(self.pages)
+        self.section_hashes: Dict[str, Set[str]] = {}
+        self.page_hashes: Dict[str, str] = {}
+        self.leader = False
+        self._lock_file = None
+        self.next_due: Dict[str, float] = {}
+        self._in_flight: Set[str] = set()
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._reindex_lock = threading.Lock()  # re-indexing runs in executor threads, one page at a time
+
+    def interval_for(self, url: str) -> float:
+        """Recrawl interval in seconds: popular pages are refreshed more often"""
+        requests = page_cache.request_counts.get(url, 0)
+        interval = settings.recrawl_base_interval / (1 + math.log1p(requests))
+        interval = min(max(interval, settings.recrawl_min_interval), settings.recrawl_max_interval)
+        return interval * random.uniform(1 - settings.recrawl_jitter, 1 + settings.recrawl_jitter)
+
+    def try_lead(self) -> bool:
+        """Take the node's recrawl lock if no other worker holds it"""
+        if self.leader:
+            return True
+        if fcntl is None:
+            self.leader = True
+            return True
+        path = resolve_path(settings.recrawl_lock_path)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            lock_file = open(path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        except OSError as e:
+            logger.warning(f"Could not open the recrawl lock {path}: {e}")
+            return False
+        # Released by the OS when this process exits
+        self._lock_file = lock_file
+        self.leader = True
+        logger.info(f"Worker {os.getpid()} fetches the recrawled pages")
+        return True
+
+    def start(self):
+        now = time.monotonic()
+        # Spread the first crawl of every page over the minimum interval
+        for url in self.pages:
+            self.next_due[url] = now + random.uniform(0, settings.recrawl_min_interval)
+        self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+            self.leader = False
+
+    async def run(self):
+        while True:
+            self.try_lead()
+            now = time.monotonic()
+            for url, due in list(self.next_due.items()):
+                if due <= now and url not in self._in_flight:
+                    self._in_flight.add(url)
+                    asyncio.ensure_future(self.crawl(self.pages[url]))
+            next_due = min(self.next_due.values(), default=now + 60)
+            await asyncio.sleep(min(max(next_due - now, 1.0), 60))
+
+    async def crawl(self, page: Dict):
+        url = page["url"]
+        host = urlparse(url).netloc
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(settings.recrawl_per_host_concurrency))
+        loop = asyncio.get_event_loop()
+        role = "leader" if self.leader else "follower"
+        try:
+            async with semaphore:
+                started = time.perf_counter()
+                if self.leader:
+                    html_content = await loop.run_in_executor(None, self.web_search_service.fetch_page, page)
+                else:
+                    html_content = await loop.run_in_executor(None, page_cache.get, url, math.inf)
+                if html_content is None:
+                    crawl_pages.inc(result="error" if self.leader else "missing", role=role)
+                    return
+                digest = content_hash(html_content)
+                if self.leader:
+                    crawl_bytes.inc(len(html_content.encode("utf-8")))
+                    await loop.run_in_executor(None, page_cache.put, url, html_content)
+                if digest != self.page_hashes.get(url):
+                    documents = await loop.run_in_executor(
+                        None, self.web_search_service.page_documents, page, html_content
+                    )
+                    # Reading the index's section hashes and embedding are too slow for the event loop
+                    await loop.run_in_executor(None, self._reindex, url, documents)
+                    self.page_hashes[url] = digest
+                    crawl_pages.inc(result="changed", role=role)
+                else:
+                    crawl_pages.inc(result="unchanged", role=role)
+                crawl_duration.observe(time.perf_counter() - started, host=host)
+        except Exception as e:
+            crawl_pages.inc(result="error", role=role)
+            logger.error(f"Recrawl of {url} failed: {e}")
+        finally:
+            self.next_due[url] = time.monotonic() + self.interval_for(url)
+            self._in_flight.discard(url)
+
+    def _reindex(self, url: str, documents):
+        with self._reindex_lock:
+            self._reindex_page(url, documents)
+
+    def _reindex_page(self, url: str, documents):
+        hashes = {section_hash(document["content"]): document for document in documents}
+        index = get_vector_index(*INDEX_PARTITION)
+        previous = self.section_hashes.get(url)
+        if previous is None:
+            # First crawl since startup: compare with the sections the index was built from
+            previous = index.section_hashes(url) if index is not None else set(hashes)
+        self.section_hashes[url] = set(hashes)
+        removed = previous - set(hashes)
+        added = [document for digest, document in hashes.items() if digest not in previous]
+        if not removed and not added:
+            return
+        if index is not None:
+            index.apply_section_changes(url, removed, added)
+        crawl_sections.inc(len(removed), change="removed")
+        crawl_sections.inc(len(added), change="added")
+        logger.info(f"Recrawl of {url}: {len(added)} sections added, {len(removed)} removed")
+
+
+_scheduler: Optional[RecrawlScheduler] = None
+
+
+def start_recrawl():
+    global _scheduler
+    if settings.recrawl_enabled and _scheduler is None:
+        _scheduler = RecrawlScheduler()
+        _scheduler.start()
+
+
+async def stop_recrawl():
+    global _scheduler
+    if _scheduler is not None:
+        await _scheduler.stop()
+        _scheduler = None
@@ -0,0 +1,57 @@
+"""
+In-process LRU cache with a time-to-live per entry, the first level of the
+shared caches (app/services/shared_cache.py). Degraded requests (see
+app/services/admission.py) are answered from the chat answers cached here
+when possible.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from app.config import settings
+from app.services.memory import deep_sizeof, register_component
+from app.services.shared_cache import TieredCache
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires at, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() > entry[0]:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def memory_usage(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": deep_sizeof(self._entries)}
+
+    def evict(self, keep_fraction: float):
+        """Drop the least recently used entries"""
+        with self._lock:
+            for _ in range(len(self._entries) - int(len(self._entries) * keep_fraction)):
+                self._entries.popitem(last=False)
+
+
+chat_response_cache = TieredCache("chat", ResponseCache(settings.chat_cache_max_entries, settings.chat_cache_ttl))
+register_component("chat_response_cache", chat_response_cache.memory_usage, chat_response_cache.evict)
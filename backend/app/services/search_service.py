@@ -1,40 +1,143 @@
+import base64
+import hashlib
+import json
+from typing import Dict, Iterator, List, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app.config import settings
 from app.database.operations import DatabaseOperations
-from app.nlp.processor import LanguageProcessor
+from app.nlp.executor import get_nlp_executor
+from app.services import spelling, terms
+from app.services.profiling import stage
+from app.services.vector_index import get_vector_index
+
+# Fields a client may request through the search projection parameter
+SEARCH_FIELDS = ["category", "content", "country", "language", "source", "keywords",
+                 "fine_amount", "last_updated", "url"]
+
+
+def encode_cursor(last_id: ObjectId, fingerprint: str) -> str:
+    """Opaque next-page token: the last _id of the page and the query it belongs to"""
+    token = json.dumps({"after": str(last_id), "query": fingerprint}).encode("utf-8")
+    return base64.urlsafe_b64encode(token).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> ObjectId:
+    try:
+        token = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        after_id = ObjectId(token["after"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise ValueError("Invalid cursor")
+    if token.get("query") != fingerprint:
+        raise ValueError("Cursor does not belong to this query")
+    return after_id
+
 
 class SearchService:
     def __init__(self):
         self.db_ops = DatabaseOperations()
-        self.processor = LanguageProcessor()
-    
-    async def search_regulations(self, query: str, language: str, category: str = None, limit: int = 10):
+
+    async def search_regulations(self, query: str, language: str, category: str = None, limit: int = 10,
+                                 country: str = None, cursor: Optional[str] = None,
+                                 fields: Optional[List[str]] = None, keywords: Optional[List[str]] = None):
         """
         Search for regulations based on a text query
-        
+
         Args:
             query: The search text from user
             language: Language code (e.g., 'en-US', 'de')
             category: Optional category filter
-            limit: Maximum number of results to return
-            
+            limit: Maximum number of results to return (page size)
+            country: Country partition to search (defaults to settings.default_country)
+            cursor: next_cursor of the previous page, to continue a search
+            fields: Optional projection, a subset of SEARCH_FIELDS
+            keywords: Keywords already extracted from the query, if any
+
         Returns:
-            List of matching regulations
+            One page of matching regulations and the cursor of the next page
         """
-        # Extract keywords from the query
-        keywords = self.processor.extract_keywords(query, language.split('-')[0])
-        
-        # Get results from database
-        results = self.db_ops.search_regulations(keywords, language)
-        
-        # Filter by category if provided
-        if category and results:
-            results = [r for r in results if r.get("category") == category]
-        
-        # Limit results
-        results = results[:limit]
-        
+        country = country or settings.default_country
+        limit = min(limit or 10, settings.search_max_limit)
+        projection = self._projection(fields)
+        fingerprint = self._fingerprint(query, language, country, category, fields)
+        after_id = decode_cursor(cursor, fingerprint) if cursor else None
+
+        # Extract keywords from the query (batched with concurrent requests)
+        corrected_query = spelling.correct_text(query, language)
+        if keywords is None:
+            keywords = await get_nlp_executor().extract_keywords(corrected_query, language.split('-')[0])
+        search_terms = terms.query_terms(keywords, language)
+
+        # Get one page (plus one document to detect a next page) from the database
+        with stage("search.mongo"):
+            documents = list(self.db_ops.find_regulations_page(
+                keywords, language, country, category, after_id, limit + 1, projection, search_terms
+            ))
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = encode_cursor(documents[-1]["_id"], fingerprint)
+        results = [self._without_id(document) for document in documents]
+
+        # Fall back to semantic similarity when no keyword matched,
+        # e.g. for paraphrased questions
+        if not results and after_id is None:
+            with stage("search.semantic"):
+                results = self._semantic_search(corrected_query, language, limit, country, category)
+            if fields:
+                results = [{field: r.get(field) for field in fields} for r in results]
+
         return {
             "results": results,
             "query": query,
             "matched_keywords": keywords,
-            "total_results": len(results)
-        }
\ No newline at end of file
+            "total_results": len(results),
+            "next_cursor": next_cursor,
+            "corrected_query": corrected_query if corrected_query != query else None
+        }
+
+    async def iter_regulations(self, query: str, language: str, category: str = None, country: str = None,
+                         cursor: Optional[str] = None, fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        """
+        Iterate over every regulation matching the query, for NDJSON exports.
+        Documents are read from Mongo in bounded batches.
+        """
+        country = country or settings.default_country
+        projection = self._projection(fields)
+        fingerprint = self._fingerprint(query, language, country, category, fields)
+        after_id = decode_cursor(cursor, fingerprint) if cursor else None
+        keywords = await get_nlp_executor().extract_keywords(spelling.correct_text(query, language),
+                                                             language.split('-')[0])
+        # Validation above runs eagerly; only the reads are deferred
+        cursor = self.db_ops.find_regulations_page(keywords, language, country, category, after_id,
+                                                   fields=projection, terms=terms.query_terms(keywords, language))
+        return (self._without_id(document) for document in cursor)
+
+    def _projection(self, fields: Optional[List[str]]) -> Optional[List[str]]:
+        if not fields:
+            return None
+        unknown = [field for field in fields if field not in SEARCH_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return list(fields)
+
+    def _fingerprint(self, *parts) -> str:
+        return hashlib.sha1(json.dumps(parts, default=str).encode("utf-8")).hexdigest()[:16]
+
+    def _without_id(self, document: Dict) -> Dict:
+        document.pop("_id", None)
+        return document
+
+    def _semantic_search(self, query: str, language: str, limit: int, country: str, category: Optional[str] = None):
+        """Query the vector index partition of the country and language"""
+        if not settings.vector_index_enabled:
+            return []
+        index = get_vector_index(country, language)
+        if index is None:
+            return []
+        results = index.search(query, k=limit, min_score=settings.vector_index_min_score, category=category)
+        for document in results:
+            document["match"] = "semantic"
+        return results
@@ -0,0 +1,337 @@
+"""
+Two-level caches shared by the workers of a node.
+
+Level 1 is a per-process LRU (app/services/response_cache.py). Level 2 is
+shared by every worker:
+- a Redis-protocol server, when shared_cache_redis_url is set (needs the
+  redis package); entries expire with their TTL and the server's maxmemory
+  policy bounds the size
+- otherwise a SQLite file per node (shared_cache_path) in WAL mode, so the
+  workers read it concurrently; kept under shared_cache_max_mb by deleting
+  expired entries, then the least recently stored ones
+A level 2 hit fills level 1 for the rest of the entry's TTL. Values are
+stored as JSON (orjson when installed), zlib-compressed for large values
+such as pages. Level 2 errors are logged and the cache then acts as
+level 1 only.
+
+get_or_compute() protects against stampedes: within a process, concurrent
+misses of a key wait for one computation; across processes, the first takes
+a lease on the key in level 2 and the others poll level 2 for its result,
+computing it themselves only when the lease of shared_cache_lease_seconds
+runs out.
+
+Level 2 is blocking I/O (SQLite with its busy timeout, or the network), so
+get(), put() and get_or_compute() are for worker threads. Code on the event
+loop uses get_async(), put_behind() and get_or_compute_async(), which serve
+level 1 at once and run level 2 on the default thread pool, writing behind.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from app.config import resolve_path, settings
+from app.services.metrics import Counter
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+try:
+    import redis
+except ImportError:  # optional: only needed with shared_cache_redis_url
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds between level 2 reads while another process holds the lease
+LEASE_POLL_INTERVAL = 0.05
+# Level 2 writes between size checks of the SQLite store
+TRIM_EVERY_WRITES = 200
+KEY_LOCKS = 64
+
+cache_lookups = Counter("shared_cache_lookups_total", "Cache lookups by cache and result (l1, l2, miss)")
+cache_errors = Counter("shared_cache_errors_total", "Failed level 2 operations by cache")
+
+
+class JSONCodec:
+    def __init__(self, compress_level: int = 0):
+        self.compress_level = compress_level
+
+    def encode(self, value: Any) -> bytes:
+        if orjson is not None:
+            data = orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+        else:
+            data = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        return zlib.compress(data, self.compress_level) if self.compress_level else data
+
+    def decode(self, data: bytes) -> Any:
+        if self.compress_level:
+            data = zlib.decompress(data)
+        return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class SQLiteStore:
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()  # one connection per thread and process
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                               "expires_at REAL NOT NULL, stored_at REAL NOT NULL, size INTEGER NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_stored_at ON entries (stored_at)")
+            connection.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """The value and its expiry (epoch seconds), or None"""
+        row = self._connection().execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0], row[1]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        now = time.time()
+        self._connection().execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                                   (key, value, now + ttl, now, len(value)))
+        self._writes += 1
+        if self._writes % TRIM_EVERY_WRITES == 0:
+            self.trim()
+
+    def trim(self):
+        """Delete expired entries, then the oldest ones while over max_bytes"""
+        connection = self._connection()
+        connection.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        excess = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        oldest = []
+        for key, size in connection.execute("SELECT key, size FROM entries ORDER BY stored_at"):
+            oldest.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        connection.executemany("DELETE FROM entries WHERE key = ?", oldest)
+
+    def acquire_lease(self, key: str, seconds: float) -> bool:
+        connection = self._connection()
+        now = time.time()
+        connection.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (key, now))
+        return connection.execute("INSERT OR IGNORE INTO leases VALUES (?, ?)", (key, now + seconds)).rowcount == 1
+
+    def release_lease(self, key: str):
+        self._connection().execute("DELETE FROM leases WHERE key = ?", (key,))
+
+
+class RedisStore:
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("shared_cache_redis_url is set but the redis package is not installed")
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        value, ttl_ms = self.client.pipeline().get(key).pttl(key).execute()
+        if value is None:
+            return None
+        return value, time.time() + max(ttl_ms, 0) / 1000
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self.client.set(key, value, px=max(int(ttl * 1000), 1))
+
+    def acquire_lease(self, key: str, seconds: float) -> bool:
+        return bool(self.client.set(f"lease:{key}", b"1", nx=True, px=max(int(seconds * 1000), 1)))
+
+    def release_lease(self, key: str):
+        self.client.delete(f"lease:{key}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The level 2 store of this node, or None if the shared cache is disabled"""
+    global _store
+    if _store is None and settings.shared_cache_enabled:
+        with _store_lock:
+            if _store is None:
+                if settings.shared_cache_redis_url:
+                    _store = RedisStore(settings.shared_cache_redis_url)
+                else:
+                    _store = SQLiteStore(resolve_path(settings.shared_cache_path),
+                                         int(settings.shared_cache_max_mb * 1024 * 1024))
+    return _store
+
+
+class TieredCache:
+    def __init__(self, namespace: str, local, codec: Optional[JSONCodec] = None, ttl: Optional[float] = None):
+        """local is the level 1 cache (a ResponseCache); ttl defaults to its TTL"""
+        self.namespace = namespace
+        self.local = local
+        self.codec = codec or JSONCodec()
+        self.ttl = local.ttl if ttl is None else ttl
+        self._locks = [threading.Lock() for _ in range(KEY_LOCKS)]
+        self._async_locks = [asyncio.Lock() for _ in range(KEY_LOCKS)]
+
+    def __len__(self):
+        return len(self.local)
+
+    def _shared_key(self, key: Hashable) -> str:
+        text = key if isinstance(key, str) else json.dumps(key, default=str)
+        return f"{self.namespace}:{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+
+    def _shared(self, operation: str, *args, default=None):
+        try:
+            store = get_store()
+            return getattr(store, operation)(*args) if store is not None else default
+        except Exception as e:
+            cache_errors.inc(cache=self.namespace)
+            logger.warning(f"Shared cache '{self.namespace}' {operation} failed: {e}")
+            return default
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            cache_lookups.inc(cache=self.namespace, result="l1")
+            return value
+        value = self._get_shared(key)
+        cache_lookups.inc(cache=self.namespace, result="l2" if value is not None else "miss")
+        return value
+
+    def _get_shared(self, key: Hashable) -> Optional[Any]:
+        entry = self._shared("get", self._shared_key(key))
+        if entry is None:
+            return None
+        data, expires_at = entry
+        value = self.codec.decode(data)
+        self.local.put(key, value, ttl=max(expires_at - time.time(), 0))
+        return value
+
+    async def get_async(self, key: Hashable) -> Optional[Any]:
+        """get() for the event loop: level 2 is read on the default thread pool"""
+        value = self.local.get(key)
+        if value is not None:
+            cache_lookups.inc(cache=self.namespace, result="l1")
+            return value
+        value = await asyncio.get_running_loop().run_in_executor(None, self._get_shared, key)
+        cache_lookups.inc(cache=self.namespace, result="l2" if value is not None else "miss")
+        return value
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        self.local.put(key, value, ttl=ttl)
+        self._put_shared(key, value, ttl)
+
+    def put_behind(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """put() for the event loop: level 1 at once, level 2 written behind on the default thread pool"""
+        ttl = self.ttl if ttl is None else ttl
+        self.local.put(key, value, ttl=ttl)
+        asyncio.get_running_loop().run_in_executor(None, self._put_shared, key, value, ttl)
+
+    def _put_shared(self, key: Hashable, value: Any, ttl: float, release_lease: bool = False):
+        shared_key = self._shared_key(key)
+        if value is not None:
+            self._shared("set", shared_key, self.codec.encode(value), ttl)
+        if release_lease:
+            self._shared("release_lease", shared_key)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """
+        The cached value, or compute() once across threads and workers; None
+        results are not cached. Blocks while another worker holds the lease.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._locks[hash(key) % KEY_LOCKS]:
+            # Another thread may have computed it while this one waited
+            value = self.local.get(key)
+            if value is not None:
+                return value
+            shared_key = self._shared_key(key)
+            leased = self._acquire_lease(key)
+            if not leased:
+                value = self._wait_for(key)
+                if value is not None:
+                    return value
+            try:
+                value = compute()
+                if value is not None:
+                    self.put(key, value, ttl)
+                return value
+            finally:
+                if leased:
+                    self._shared("release_lease", shared_key)
+
+    async def get_or_compute_async(self, key: Hashable, compute: Callable[[], Awaitable[Any]],
+                                   ttl: Optional[float] = None) -> Any:
+        """get_or_compute() for the event loop, with an async compute and lease waits that yield"""
+        value = await self.get_async(key)
+        if value is not None:
+            return value
+        loop = asyncio.get_running_loop()
+        async with self._async_locks[hash(key) % KEY_LOCKS]:
+            # Another task may have computed it while this one waited
+            value = self.local.get(key)
+            if value is not None:
+                return value
+            leased = await loop.run_in_executor(None, self._acquire_lease, key)
+            if not leased:
+                value = await self._wait_for_async(key)
+                if value is not None:
+                    return value
+            value = None
+            try:
+                value = await compute()
+                return value
+            finally:
+                ttl = self.ttl if ttl is None else ttl
+                if value is not None:
+                    self.local.put(key, value, ttl=ttl)
+                # Written before the lease is released, so the waiting workers find it
+                loop.run_in_executor(None, self._put_shared, key, value, ttl, leased)
+
+    def _acquire_lease(self, key: Hashable) -> bool:
+        return self._shared("acquire_lease", self._shared_key(key), settings.shared_cache_lease_seconds, default=True)
+
+    async def _wait_for_async(self, key: Hashable) -> Optional[Any]:
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + settings.shared_cache_lease_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LEASE_POLL_INTERVAL)
+            value = await loop.run_in_executor(None, self._get_shared, key)
+            if value is not None:
+                return value
+        return None
+
+    def _wait_for(self, key: Hashable) -> Optional[Any]:
+        """Poll level 2 for a value another worker is computing, until its lease runs out"""
+        deadline = time.monotonic() + settings.shared_cache_lease_seconds
+        while time.monotonic() < deadline:
+            time.sleep(LEASE_POLL_INTERVAL)
+            value = self._get_shared(key)
+            if value is not None:
+                return value
+        return None
+
+    def memory_usage(self) -> Dict:
+        return self.local.memory_usage()
+
+    def evict(self, keep_fraction: float):
+        self.local.evict(keep_fraction)
@@ -0,0 +1,352 @@
+"""
+Typo-tolerant keyword matching with a SymSpell-style deletion index.
+
+The vocabulary of a language is every word the routing tiers match on: the
+offline knowledge base, the web scraper topic mappings, the question lists
+and the regulation keywords in Mongo, plus spaCy's stop words so ordinary
+words are known and left alone. For every word, all variants of its first
+PREFIX_LENGTH characters with up to spelling_max_edit_distance characters
+deleted are precomputed. A token is corrected by generating the same
+deletions of the token and looking them up, a few dozen binary searches
+whatever the vocabulary size, instead of an edit distance against every
+word. Candidates are confirmed with the real edit distance; the closest,
+then most frequent, word wins, and only by a margin: when another word as
+close is nearly as frequent the token is left as typed.
+
+Only tokens that are not words are corrected. Besides the vocabulary, the
+words of the spaCy pipeline's lemmatizer tables (its lexicon) are known, and
+so are inflections of known words by suffix rules ("tires" of "tire",
+"permit" of "permits"), so a valid word is never rewritten into a nearby
+vocabulary word. The lexicon is kept as a sorted array of spaCy string
+hashes; it only answers whether a word exists and is never suggested.
+
+The index lives in flat arrays rather than dicts of Python objects, so
+lookups never write to its pages: built in the gunicorn master before fork
+(see app/server.py), one copy is shared by all workers.
+"""
+import hashlib
+import logging
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from app.config import settings
+from app.data.knowledge_base import OFFLINE_KNOWLEDGE
+from app.data.questions import POPULAR_QUESTIONS, RELATED_QUESTIONS
+from app.database.operations import DatabaseOperations
+from app.services.memory import register_component
+from app.services.vector_index import language_key
+from app.services.web_scraper import GETTING_AROUND_TOPIC_MAPPING, ROUTE_TOPIC_MAPPING
+
+logger = logging.getLogger(__name__)
+
+PREFIX_LENGTH = 7
+# Shorter tokens are never corrected; tokens up to SHORT_WORD_LENGTH by one edit at
+# most, so that words missing from the vocabulary ("legal") are not rewritten
+MIN_WORD_LENGTH = 3
+SHORT_WORD_LENGTH = 5
+# Words the tiers match on outrank words that only occur in answer texts
+KEYWORD_WEIGHT = 10
+# The best correction must be this many times as frequent as the next one as close
+CORRECTION_MARGIN = 2
+# Suffix rules (inflected ending, base ending) for pipelines without lemmatizer rules
+SUFFIX_RULES = (("s", ""), ("es", ""), ("ies", "y"), ("ed", ""), ("ed", "e"), ("ing", ""), ("ing", "e"),
+                ("er", ""), ("en", ""), ("ern", ""))
+
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def deletes(word: str, max_distance: int) -> Set[str]:
+    """word and every string made from it by deleting up to max_distance characters"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Damerau-Levenshtein (optimal string alignment) distance, or max_distance + 1 if larger"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+class DeletionIndex:
+    def __init__(self, words: Dict[str, int], max_distance: Optional[int] = None,
+                 prefix_length: int = PREFIX_LENGTH, lexicon: Iterable[int] = (),
+                 suffix_rules: Iterable[Tuple[str, str]] = SUFFIX_RULES):
+        self.max_distance = settings.spelling_max_edit_distance if max_distance is None else max_distance
+        self.prefix_length = prefix_length
+        self.suffix_rules = tuple(suffix_rules)
+        # spaCy string hashes of the lexicon words
+        self._lexicon = array("Q", sorted(set(lexicon)))
+        vocabulary = sorted(words)
+        # Words are one string sliced by offsets; counts and hashes are machine integers
+        self._text = "\n".join(vocabulary) + "\n"
+        self._offsets = array("I", [0])
+        for word in vocabulary:
+            self._offsets.append(self._offsets[-1] + len(word) + 1)
+        self._counts = array("I", (words[word] for word in vocabulary))
+        self._word_hashes = array("Q", sorted(_hash(word) for word in vocabulary))
+        pairs = sorted(
+            (_hash(variant), word_id)
+            for word_id, word in enumerate(vocabulary)
+            for variant in deletes(word[:prefix_length], self.max_distance)
+        )
+        self._delete_hashes = array("Q", (variant_hash for variant_hash, _ in pairs))
+        self._delete_words = array("I", (word_id for _, word_id in pairs))
+        # Changes when the words, and so the corrections, change; part of the search ETags
+        self.version = f"{_hash(self._text):x}.{len(self._lexicon)}"
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __contains__(self, word: str) -> bool:
+        word_hash = _hash(word)
+        i = bisect_left(self._word_hashes, word_hash)
+        return i < len(self._word_hashes) and self._word_hashes[i] == word_hash
+
+    def word(self, word_id: int) -> str:
+        return self._text[self._offsets[word_id]:self._offsets[word_id + 1] - 1]
+
+    def in_lexicon(self, word: str) -> bool:
+        if not self._lexicon:
+            return False
+        from spacy.strings import get_string_id
+
+        word_hash = get_string_id(word)
+        i = bisect_left(self._lexicon, word_hash)
+        return i < len(self._lexicon) and self._lexicon[i] == word_hash
+
+    def _known(self, word: str) -> bool:
+        return word in self or self.in_lexicon(word)
+
+    def is_word(self, token: str) -> bool:
+        """Whether a token is a known word or an inflection of one, in which case it is not corrected"""
+        lower = token.lower()
+        if self._known(lower) or (lower != token and self.in_lexicon(token)):
+            return True
+        for inflected, base in self.suffix_rules:
+            if lower.endswith(inflected) and len(lower) - len(inflected) >= MIN_WORD_LENGTH - 1:
+                stem = lower[:len(lower) - len(inflected)]
+                if self._known(stem + base):
+                    return True
+                # "running" of "run"
+                if not base and len(stem) > MIN_WORD_LENGTH and stem[-1] == stem[-2] and self._known(stem[:-1]):
+                    return True
+            if lower.endswith(base) and lower[:len(lower) - len(base)] + inflected in self:
+                return True
+        return False
+
+    def lookup(self, token: str, max_distance: Optional[int] = None, margin: float = 1) -> Optional[str]:
+        """
+        The closest known word within max_distance edits of a lowercase token,
+        or None. With a margin above 1 the closest word must also be that many
+        times as frequent as any other word as close.
+        """
+        if token in self:
+            return token
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        best = None  # (distance, -count, word)
+        runner_up = None
+        seen = set()
+        for variant in deletes(token[:self.prefix_length], max_distance):
+            variant_hash = _hash(variant)
+            i = bisect_left(self._delete_hashes, variant_hash)
+            while i < len(self._delete_hashes) and self._delete_hashes[i] == variant_hash:
+                word_id = self._delete_words[i]
+                i += 1
+                if word_id in seen:
+                    continue
+                seen.add(word_id)
+                word = self.word(word_id)
+                distance = edit_distance(token, word, max_distance)
+                if distance <= max_distance:
+                    candidate = (distance, -self._counts[word_id], word)
+                    if best is None or candidate < best:
+                        best, runner_up = candidate, best
+                    elif runner_up is None or candidate < runner_up:
+                        runner_up = candidate
+        if best is None:
+            return None
+        if runner_up is not None and runner_up[0] == best[0] and -best[1] < margin * -runner_up[1]:
+            return None  # too close to call
+        return best[2]
+
+    def correct(self, text: str) -> str:
+        """text with every token that is not a word replaced by its closest known word, if one stands out"""
+        def replace(match):
+            token = match.group(0)
+            lower = token.lower()
+            if len(lower) < MIN_WORD_LENGTH or self.is_word(token):
+                return token
+            correction = self.lookup(lower, 1 if len(lower) <= SHORT_WORD_LENGTH else None, CORRECTION_MARGIN)
+            if not correction or correction == lower:
+                return token
+            return correction[0].upper() + correction[1:] if token[0].isupper() else correction
+
+        return _WORD_RE.sub(replace, text)
+
+    def memory_bytes(self) -> int:
+        arrays = (self._offsets, self._counts, self._word_hashes, self._delete_hashes, self._delete_words,
+                  self._lexicon)
+        return len(self._text.encode("utf-8")) + sum(len(a) * a.itemsize for a in arrays)
+
+
+_indexes: Dict[str, DeletionIndex] = {}
+_build_lock = threading.Lock()
+
+
+def stop_words(lang: str) -> Set[str]:
+    if lang == "de":
+        from spacy.lang.de.stop_words import STOP_WORDS
+    else:
+        from spacy.lang.en.stop_words import STOP_WORDS
+    return STOP_WORDS
+
+
+def build_vocabulary(language: str, regulation_keywords=()) -> Dict[str, int]:
+    lang = language_key(language)
+    lang_key = "de" if lang == "de" else "en-US"
+    counts = Counter()
+
+    def add(text: str, weight: int = 1):
+        for word in _WORD_RE.findall(text.lower()):
+            if len(word) >= MIN_WORD_LENGTH:
+                counts[word] += weight
+
+    for topic in OFFLINE_KNOWLEDGE[lang_key].values():
+        for keyword in topic["keywords"]:
+            add(keyword, KEYWORD_WEIGHT)
+        add(topic["response"])
+    if lang_key == "en-US":
+        for keyword in list(ROUTE_TOPIC_MAPPING) + list(GETTING_AROUND_TOPIC_MAPPING):
+            add(keyword, KEYWORD_WEIGHT)
+    for question in POPULAR_QUESTIONS.get(lang_key, []):
+        add(question)
+    for questions in RELATED_QUESTIONS.values():
+        for question in questions.get(lang_key, []):
+            add(question)
+    for keyword in regulation_keywords:
+        add(keyword, KEYWORD_WEIGHT)
+    for word in stop_words(lang):
+        add(word)
+    return dict(counts)
+
+
+def pipeline_lexicon(language: str) -> Tuple[Set[int], Tuple[Tuple[str, str], ...]]:
+    """spaCy string hashes of the words in the lemmatizer tables of a pipeline, and its suffix rules"""
+    try:
+        from app.nlp.processor import load_models
+
+        nlp = load_models()[language_key(language)]
+    except Exception as e:
+        logger.warning(f"Spelling index built without the spaCy lexicon: {e}")
+        return set(), SUFFIX_RULES
+    if "lemmatizer" not in nlp.pipe_names:
+        return set(), SUFFIX_RULES
+    from spacy.strings import get_string_id
+
+    lookups = nlp.get_pipe("lemmatizer").lookups
+    lexicon = set()
+
+    def add(word):
+        if isinstance(word, str):
+            lexicon.add(get_string_id(word))
+        elif isinstance(word, (list, tuple)):
+            for item in word:
+                add(item)
+
+    # lemma_lookup: inflected form (kept as its hash) -> lemma, e.g. the German pipeline
+    if lookups.has_table("lemma_lookup"):
+        for key, lemma in lookups.get_table("lemma_lookup").items():
+            lexicon.add(key)
+            add(lemma)
+    # Rule lemmatizers, e.g. the English pipeline: base forms and irregular forms by part of speech
+    if lookups.has_table("lemma_index"):
+        for words in lookups.get_table("lemma_index").values():
+            add(list(words))
+    if lookups.has_table("lemma_exc"):
+        for exceptions in lookups.get_table("lemma_exc").values():
+            for word, lemmas in exceptions.items():
+                add(word)
+                add(lemmas)
+    rules = SUFFIX_RULES
+    if lookups.has_table("lemma_rules"):
+        rules = tuple(dict.fromkeys(
+            (inflected, base) for pos_rules in lookups.get_table("lemma_rules").values()
+            for inflected, base in pos_rules if inflected
+        )) or SUFFIX_RULES
+    return lexicon, rules
+
+
+def regulation_keywords(language: str):
+    try:
+        return DatabaseOperations().get_regulation_keywords(language)
+    except Exception as e:
+        logger.warning(f"Spelling index built without regulation keywords: {e}")
+        return []
+
+
+def get_index(language: str) -> DeletionIndex:
+    """Index for a language, built on first use"""
+    key = language_key(language)
+    index = _indexes.get(key)
+    if index is None:
+        with _build_lock:
+            index = _indexes.get(key)
+            if index is None:
+                lexicon, suffix_rules = pipeline_lexicon(key)
+                index = DeletionIndex(build_vocabulary(key, regulation_keywords(key)),
+                                      lexicon=lexicon, suffix_rules=suffix_rules)
+                _indexes[key] = index
+                logger.info(f"Spelling index for '{key}' built with {len(index)} words")
+    return index
+
+
+def index_version(language: str) -> Optional[str]:
+    """Version of a language's index if it is built; never builds it"""
+    index = _indexes.get(language_key(language))
+    return index.version if index is not None else None
+
+
+def preload_indexes(languages=("en", "de")):
+    """Build the indexes before the workers fork so they share them"""
+    for language in languages:
+        get_index(language)
+
+
+def correct_text(text: str, language: str) -> str:
+    if not settings.spelling_correction_enabled:
+        return text
+    return get_index(language).correct(text)
+
+
+def _indexes_memory() -> Dict:
+    indexes = list(_indexes.values())
+    return {"entries": sum(len(index) for index in indexes),
+            "bytes": sum(index.memory_bytes() for index in indexes)}
+
+
+register_component("spelling_indexes", _indexes_memory)
@@ -0,0 +1,240 @@
+"""
+Normalised search terms for the keyword index.
+
+spaCy keywords are lemmas (app/nlp/processor.py). Each lemma is then reduced
+to a term: umlauts folded and common inflection suffixes stripped, and
+German compounds are split into the parts found in the language's lexicon
+(the spelling vocabulary and regulation keywords), so "Parkplätzen" yields
+"parkplatz", "park" and "platz", which matches the "parken" keyword.
+
+The same normalisation runs at index time, where every regulation gets a
+``terms`` array from its keywords, title and category (a multikey Mongo
+index, i.e. an inverted index from term to regulations), and at query time.
+Terms are cached per token, since the same words recur in every query.
+
+Backfill the terms of regulations stored before this index existed with:
+    python -m app.services.terms
+"""
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+from pymongo import UpdateOne
+
+from app.config import settings
+from app.database.operations import DatabaseOperations
+from app.services import spelling
+from app.services.memory import deep_sizeof, register_component
+from app.services.vector_index import language_key
+
+logger = logging.getLogger(__name__)
+
+MIN_PART_LENGTH = 4
+# Inflection suffixes, longest first; only stripped if MIN_PART_LENGTH characters remain
+SUFFIXES = {
+    "de": ("ern", "en", "em", "er", "es", "e", "n", "s"),
+    "en": ("ies", "es", "s"),
+}
+# Fugenelemente between the parts of a German compound
+LINKING_ELEMENTS = ("s", "es", "n", "en", "e", "")
+_FOLD = str.maketrans({"ä": "a", "ö": "o", "ü": "u", "ß": "ss"})
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+
+def stem(word: str, language: str) -> str:
+    word = word.lower().translate(_FOLD)
+    lang = "de" if language_key(language) == "de" else "en"
+    for suffix in SUFFIXES[lang]:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_PART_LENGTH:
+            if lang == "en" and suffix == "ies":
+                return word[:-3] + "y"
+            if lang == "en" and word.endswith("ss"):
+                return word
+            return word[:-len(suffix)]
+    return word
+
+
+def split_compound(word: str, lexicon: Set[str]) -> List[str]:
+    """
+    Parts of a compound stem, left to right; [] if it cannot be split.
+    A split into known parts only wins; otherwise the longest known head
+    (the last part, which carries the meaning in German) with its modifier,
+    or else the shortest known modifier with the rest.
+    """
+    full = _split_known(word, lexicon, {})
+    if full and len(full) > 1:
+        return full
+    for i in range(MIN_PART_LENGTH, len(word) - MIN_PART_LENGTH + 1):
+        head = word[i:]
+        if head in lexicon:
+            return [_strip_linking(word[:i], lexicon), head]
+    for i in range(MIN_PART_LENGTH, len(word) - MIN_PART_LENGTH + 1):
+        modifier = _strip_linking(word[:i], lexicon)
+        if modifier in lexicon:
+            return [modifier, word[i:]]
+    return []
+
+
+def _strip_linking(modifier: str, lexicon: Set[str]) -> str:
+    for link in LINKING_ELEMENTS[:-1]:
+        if modifier.endswith(link) and modifier[:-len(link)] in lexicon:
+            return modifier[:-len(link)]
+    return modifier
+
+
+def _split_known(word: str, lexicon: Set[str], memo: Dict[str, Optional[List[str]]]) -> Optional[List[str]]:
+    if word in memo:
+        return memo[word]
+    memo[word] = [word] if word in lexicon else None
+    if memo[word] is None:
+        # Longest modifier first, so "parkplatz" is not read as "par" + ...
+        for i in range(len(word) - MIN_PART_LENGTH, MIN_PART_LENGTH - 1, -1):
+            rest = _split_known(word[i:], lexicon, memo)
+            if rest is None:
+                continue
+            modifier = word[:i]
+            for link in LINKING_ELEMENTS:
+                if modifier.endswith(link) and len(modifier) - len(link) >= MIN_PART_LENGTH \
+                        and modifier[:len(modifier) - len(link)] in lexicon:
+                    memo[word] = [modifier[:len(modifier) - len(link)]] + rest
+                    return memo[word]
+    return memo[word]
+
+
+class TermNormalizer:
+    def __init__(self, language: str, lexicon: Iterable[str], stop_words: Iterable[str] = (),
+                 cache_size: Optional[int] = None):
+        self.language = language_key(language)
+        self.lexicon = {stem(word, self.language) for word in lexicon if len(word) >= MIN_PART_LENGTH}
+        self.stop_words = {word.lower() for word in stop_words}
+        self.cache_size = cache_size or settings.term_cache_size
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def token_terms(self, token: str) -> tuple:
+        """Terms of one keyword (a lemma); cached"""
+        token = token.lower()
+        with self._lock:
+            terms = self._cache.get(token)
+            if terms is not None:
+                self._cache.move_to_end(token)
+                return terms
+        if token in self.stop_words or len(token) < 2:
+            terms = ()
+        else:
+            term = stem(token, self.language)
+            parts = split_compound(term, self.lexicon) if self.language == "de" else []
+            terms = tuple(dict.fromkeys([term] + parts))
+        with self._lock:
+            self._cache[token] = terms
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return terms
+
+    def terms(self, keywords: Iterable[str]) -> List[str]:
+        result = {}
+        for keyword in keywords:
+            for word in _WORD_RE.findall(keyword.lower()):
+                for term in self.token_terms(word):
+                    result[term] = None
+        return list(result)
+
+    def memory_usage(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._cache), "bytes": deep_sizeof(self._cache) + deep_sizeof(self.lexicon)}
+
+
+_normalizers: Dict[str, TermNormalizer] = {}
+_build_lock = threading.Lock()
+
+
+def get_normalizer(language: str) -> TermNormalizer:
+    """Normalizer for a language, built on first use"""
+    key = language_key(language)
+    normalizer = _normalizers.get(key)
+    if normalizer is None:
+        with _build_lock:
+            normalizer = _normalizers.get(key)
+            if normalizer is None:
+                stop_words = spelling.stop_words(key)
+                vocabulary = spelling.build_vocabulary(key, spelling.regulation_keywords(key))
+                normalizer = TermNormalizer(key, (word for word in vocabulary if word not in stop_words),
+                                            stop_words)
+                _normalizers[key] = normalizer
+                logger.info(f"Term normalizer for '{key}' built with {len(normalizer.lexicon)} lexicon stems")
+    return normalizer
+
+
+def query_terms(keywords: List[str], language: str) -> List[str]:
+    return get_normalizer(language).terms(keywords)
+
+
+def _regulation_text(regulation: Dict) -> str:
+    return " ".join(regulation.get("keywords", []) + [
+        str(regulation.get("title") or ""), regulation.get("category", "").replace("_", " ")
+    ])
+
+
+def _regulation_language(regulation: Dict) -> str:
+    language = regulation.get("language") or "en"
+    return language_key(language[0] if isinstance(language, list) else language)
+
+
+def document_terms(regulations: List[Dict]) -> List[List[str]]:
+    """Index terms of each regulation, lemmatised in one nlp.pipe pass per language"""
+    from app.nlp.processor import LanguageProcessor
+
+    texts = [_regulation_text(regulation) for regulation in regulations]
+    keywords: List[Optional[List[str]]] = [None] * len(regulations)
+    by_language: Dict[str, List[int]] = {}
+    for i, regulation in enumerate(regulations):
+        by_language.setdefault(_regulation_language(regulation), []).append(i)
+    try:
+        processor = LanguageProcessor()
+        for language, positions in by_language.items():
+            for i, lemmas in zip(positions, processor.extract_keywords_batch([texts[i] for i in positions], language)):
+                keywords[i] = lemmas
+    except OSError as e:
+        # No spaCy model: index the words as they are; stems and compounds still apply
+        logger.warning(f"Indexing terms without lemmas: {e}")
+    return [
+        get_normalizer(_regulation_language(regulation)).terms(keywords[i] or _WORD_RE.findall(texts[i].lower()))
+        for i, regulation in enumerate(regulations)
+    ]
+
+
+def reindex_terms(db_ops: Optional[DatabaseOperations] = None, batch_size: int = 500) -> int:
+    """Recompute the terms of every stored regulation; returns the number updated"""
+    db_ops = db_ops or DatabaseOperations()
+    fields = {"keywords": 1, "title": 1, "category": 1, "language": 1}
+    batch, updated = [], 0
+    for regulation in db_ops.db.regulations.find({}, fields).batch_size(batch_size):
+        batch.append(regulation)
+        if len(batch) >= batch_size:
+            updated += _write_terms(db_ops, batch)
+            batch = []
+    if batch:
+        updated += _write_terms(db_ops, batch)
+    return updated
+
+
+def _write_terms(db_ops: DatabaseOperations, regulations: List[Dict]) -> int:
+    operations = [UpdateOne({"_id": regulation["_id"]}, {"$set": {"terms": terms}})
+                  for regulation, terms in zip(regulations, document_terms(regulations))]
+    db_ops.bulk_upsert_regulations(operations)
+    return len(operations)
+
+
+def _normalizers_memory() -> Dict:
+    usage = [normalizer.memory_usage() for normalizer in list(_normalizers.values())]
+    return {"entries": sum(row["entries"] for row in usage), "bytes": sum(row["bytes"] for row in usage)}
+
+
+register_component("search_terms", _normalizers_memory)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Updated the terms of {reindex_terms()} regulations")
@@ -0,0 +1,175 @@
+"""
+Cost-aware planning of the chat answer tiers.
+
+The planner measures every tier (db_search, db, web, offline): its latency,
+as a moving average per tier, and its answer quality per topic, as a moving
+average of the score of its answers (confidence times the tier weight in
+chat_tier_weights, 0 when it had no answer). The topic of a message is the
+intent of the offline knowledge base topic it matches, else "general".
+
+With chat_tier_policy "planned", tiers run in order of expected latency. An
+answer is accepted as soon as its score reaches chat_tier_accept_confidence,
+or when no tier left is expected to score higher on the topic; otherwise the
+best answer so far is kept and the next tier runs. When the cheaper tiers
+have been measured on the topic at least chat_tier_min_samples times each
+and still fall short of the threshold, the slowest tier is started at once
+in parallel (speculatively), provided its expected latency fits
+chat_tier_budget_ms; its answer is dropped if a cheaper one is accepted
+first. Unmeasured tiers are never speculated past. Past the budget, the best answer so far is returned rather than
+waiting for a slower tier. "fixed" keeps the former order, db_search, web,
+db, offline, and takes the first answer.
+
+Statistics are kept per worker and start from PRIOR_LATENCY_MS and
+PRIOR_QUALITY. The priors rank the cheap tiers at or above the accept
+threshold and the web below them, so a cold worker answers from the
+database and only waits for the web when the cheaper answers score low. Every answer reports its plan: topic, tier order, speculative
+tiers, the attempts with their latency and score, and the chosen tier.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.data.knowledge_base import best_match
+from app.services.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+FIXED_ORDER = ("db_search", "web", "db", "offline")
+PRIOR_LATENCY_MS = {"offline": 1.0, "db": 30.0, "db_search": 60.0, "web": 2000.0}
+PRIOR_QUALITY = {"db_search": 0.75, "db": 0.7, "web": 0.6, "offline": 0.5}
+# Weight of the newest observation in the moving averages
+SMOOTHING = 0.2
+
+Tier = Callable[[], Awaitable[Optional[Dict]]]
+
+tier_seconds = Histogram("chat_tier_duration_seconds", "Time for one answer tier to answer or give up")
+tier_attempts = Counter("chat_tier_attempts_total", "Answer tier runs by outcome (answered, empty, error)")
+speculative_runs = Counter("chat_tier_speculative_total", "Speculative tier runs by outcome (used, wasted)")
+
+
+def message_topic(message: str, language: str) -> str:
+    match = best_match(message, language)
+    return match["intent"] if match else "general"
+
+
+class TierPlanner:
+    def __init__(self):
+        self.latency_ms: Dict[str, float] = dict(PRIOR_LATENCY_MS)
+        self.quality: Dict[Tuple[str, str], float] = {}  # (tier, topic) -> expected score
+        self.samples: Dict[Tuple[str, str], int] = {}  # (tier, topic) -> answers measured
+        self._speculating = 0
+
+    def expected_latency(self, tier: str) -> float:
+        return self.latency_ms.get(tier, max(PRIOR_LATENCY_MS.values()))
+
+    def expected_quality(self, tier: str, topic: str) -> float:
+        return self.quality.get((tier, topic), PRIOR_QUALITY.get(tier, 0.5))
+
+    def score(self, tier: str, result: Optional[Dict]) -> float:
+        if not result:
+            return 0.0
+        return result.get("confidence", 0.0) * settings.chat_tier_weights.get(tier, 1.0)
+
+    def record(self, tier: str, topic: str, seconds: float, score: float):
+        self.latency_ms[tier] = (1 - SMOOTHING) * self.expected_latency(tier) + SMOOTHING * seconds * 1000
+        self.quality[(tier, topic)] = (1 - SMOOTHING) * self.expected_quality(tier, topic) + SMOOTHING * score
+        self.samples[(tier, topic)] = self.samples.get((tier, topic), 0) + 1
+
+    def order(self, tiers: List[str]) -> List[str]:
+        if settings.chat_tier_policy == "fixed":
+            return [tier for tier in FIXED_ORDER if tier in tiers]
+        return sorted(tiers, key=self.expected_latency)
+
+    def should_speculate(self, order: List[str], topic: str) -> bool:
+        """Start the slowest tier now if the cheaper ones were measured not to do and it fits the budget"""
+        if settings.chat_tier_policy == "fixed" or not settings.chat_tier_speculate or len(order) < 2:
+            return False
+        if self._speculating >= settings.chat_tier_max_speculative:
+            return False
+        slowest = order[-1]
+        if self.expected_latency(slowest) > settings.chat_tier_budget_ms:
+            return False
+        if any(self.samples.get((tier, topic), 0) < settings.chat_tier_min_samples for tier in order[:-1]):
+            return False
+        cheaper = max(self.expected_quality(tier, topic) for tier in order[:-1])
+        return cheaper < settings.chat_tier_accept_confidence
+
+    def accepts(self, score: float, remaining: List[str], topic: str) -> bool:
+        if settings.chat_tier_policy == "fixed":
+            return score > 0
+        if score >= settings.chat_tier_accept_confidence:
+            return True
+        return all(self.expected_quality(tier, topic) <= score for tier in remaining)
+
+    async def execute(self, tiers: Dict[str, Tier], topic: str) -> Tuple[Optional[Dict], Dict]:
+        """Run the tiers by plan; returns the chosen answer (None if no tier had one) and the plan"""
+        started = time.perf_counter()
+        deadline = started + settings.chat_tier_budget_ms / 1000
+        order = self.order(list(tiers))
+        plan = {"policy": settings.chat_tier_policy, "topic": topic, "order": order,
+                "speculative": [], "attempts": [], "chosen": None}
+        runs: Dict[str, asyncio.Future] = {}
+        if self.should_speculate(order, topic):
+            slowest = order[-1]
+            runs[slowest] = self._start(slowest, tiers[slowest], topic, speculative=True)
+            plan["speculative"].append(slowest)
+
+        best: Optional[Tuple[float, str, Dict]] = None
+        for i, tier in enumerate(order):
+            if best is not None and time.perf_counter() >= deadline:
+                plan["budget_exceeded"] = True
+                break
+            run = runs.get(tier)
+            if run is None:
+                run = runs[tier] = self._start(tier, tiers[tier], topic)
+            if best is not None:
+                # With an answer in hand, wait for slower tiers only within the budget
+                await asyncio.wait({run}, timeout=max(0.0, deadline - time.perf_counter()))
+                if not run.done():
+                    plan["budget_exceeded"] = True
+                    break
+            result, seconds, score = await run
+            plan["attempts"].append({"tier": tier, "ms": round(seconds * 1000, 1), "score": round(score, 3)})
+            if result and (best is None or score > best[0]):
+                best = (score, tier, result)
+            if best is not None and self.accepts(best[0], order[i + 1:], topic):
+                break
+
+        for tier in plan["speculative"]:
+            speculative_runs.inc(outcome="used" if best is not None and best[1] == tier else "wasted")
+        plan["chosen"] = best[1] if best else None
+        plan["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.debug(f"Tier plan: {plan}")
+        return (best[2] if best else None), plan
+
+    def _start(self, tier: str, run: Tier, topic: str, speculative: bool = False) -> asyncio.Future:
+        async def timed():
+            tier_started = time.perf_counter()
+            try:
+                result = await run()
+                outcome = "answered" if result else "empty"
+            except Exception as e:
+                logger.warning(f"Answer tier '{tier}' failed: {e}")
+                result, outcome = None, "error"
+            finally:
+                if speculative:
+                    self._speculating -= 1
+            seconds = time.perf_counter() - tier_started
+            score = self.score(tier, result)
+            # Abandoned runs still finish and are measured
+            self.record(tier, topic, seconds, score)
+            tier_seconds.observe(seconds, tier=tier)
+            tier_attempts.inc(tier=tier, outcome=outcome)
+            return result, seconds, score
+
+        if speculative:
+            self._speculating += 1
+        return asyncio.ensure_future(timed())
+
+
+planner = TierPlanner()
+
+Gauge("chat_tier_expected_latency_seconds", "Moving average latency of each answer tier",
+      callback=lambda: {(("tier", tier),): ms / 1000 for tier, ms in planner.latency_ms.items()})
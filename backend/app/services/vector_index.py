@@ -0,0 +1,390 @@
+"""
+Semantic similarity index over regulations and scraped website sections.
+
+Documents are embedded with TF-IDF followed by LSA (truncated SVD), a local
+CPU-only representation. The L2-normalised embeddings are stored as a
+float32 ``.npy`` matrix that is memory-mapped at query time, so a query is one
+matrix-vector product plus a top-k selection. Document metadata is stored as
+JSON lines with an offset table, and only the top-k rows are ever read.
+
+The index is partitioned by (country, language) into
+``<vector_index_dir>/<country>/<language>/`` and each partition is loaded on
+first use. Build the indexes with:
+    python -m app.services.vector_index build
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.config import resolve_path, settings
+from app.services.memory import deep_sizeof, register_component
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+MODEL_FILE = "model.joblib"
+DOCUMENTS_FILE = "documents.jsonl"
+OFFSETS_FILE = "offsets.npy"
+
+# Candidate window growth of category filtered searches
+CATEGORY_OVERFETCH = 4
+
+# Fields kept in the index metadata for each document
+DOCUMENT_FIELDS = ["category", "content", "country", "language", "source", "url"]
+
+
+def section_hash(content: str) -> str:
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def _normalise_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorIndex:
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.vectors = None
+        self.offsets = None
+        self.model = None
+        # Live updates from the recrawler: new sections are embedded into a
+        # small in-memory overlay and replaced rows of the mapped matrix are
+        # masked out, so a changed page never requires a rebuild. Updates run
+        # in a worker thread and swap in new values, so searches never see a
+        # half-applied change.
+        self._overlay: Tuple[Optional[np.ndarray], List[Dict]] = (None, [])  # (vectors, documents)
+        self._deleted_rows = frozenset()
+        self._section_rows = None  # (url, section hash) -> base row, built on first update
+        # Of the index files, then folded with every section change; part of the search ETags
+        self.version = ""
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.index_dir, VECTORS_FILE))
+
+    def load(self) -> "VectorIndex":
+        """Memory-map the vectors and load the fitted TF-IDF/LSA model"""
+        import joblib
+
+        self.vectors = np.load(os.path.join(self.index_dir, VECTORS_FILE), mmap_mode="r")
+        self.offsets = np.load(os.path.join(self.index_dir, OFFSETS_FILE), mmap_mode="r")
+        model_path = os.path.join(self.index_dir, MODEL_FILE)
+        self.model = joblib.load(model_path) if os.path.exists(model_path) else None
+        vectors_stat = os.stat(os.path.join(self.index_dir, VECTORS_FILE))
+        self.version = f"{int(vectors_stat.st_mtime)}.{vectors_stat.st_size}"
+        logger.info(f"Loaded vector index with {len(self.vectors)} rows from {self.index_dir}")
+        return self
+
+    def __len__(self):
+        base_rows = 0 if self.vectors is None else len(self.vectors)
+        return base_rows - len(self._deleted_rows) + len(self._overlay[1])
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectorizer, svd = self.model
+        embedded = vectorizer.transform(texts)
+        if svd is not None:
+            embedded = svd.transform(embedded)
+        else:
+            embedded = embedded.toarray()
+        return _normalise_rows(np.asarray(embedded, dtype=np.float32))
+
+    def search_vector(self, query_vector: np.ndarray, k: int = 5) -> List[Tuple[int, float]]:
+        """Return (row, cosine score) pairs of the k nearest rows of the mapped matrix"""
+        if self.vectors is None or not len(self.vectors):
+            return []
+        scores = self.vectors @ query_vector.astype(np.float32, copy=False)
+        if self._deleted_rows:
+            scores[list(self._deleted_rows)] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def search(self, query: str, k: int = 5, min_score: float = 0.0, category: Optional[str] = None) -> List[Dict]:
+        """
+        Return the documents most similar to a text query. With a category,
+        the candidates are filtered before the top k are taken, widening the
+        candidate window until k documents match or the scores fall below
+        min_score.
+        """
+        if not len(self) or self.model is None:
+            return []
+        query_vector = self.embed([query])[0]
+        if not query_vector.any():
+            return []  # no known terms in the query
+        window = k if category is None else k * CATEGORY_OVERFETCH
+        while True:
+            results = []
+            exhausted = window >= len(self)
+            for score, row, overlay_document in self._candidates(query_vector, window):
+                if score < min_score:
+                    exhausted = True
+                    break
+                document = self.get_document(row) if row is not None else dict(overlay_document)
+                if category is not None and document.get("category") != category:
+                    continue
+                document["score"] = round(score, 4)
+                results.append(document)
+                if len(results) == k:
+                    return results
+            if exhausted:
+                return results
+            window *= CATEGORY_OVERFETCH
+
+    def _candidates(self, query_vector: np.ndarray, k: int) -> List[Tuple[float, Optional[int], Optional[Dict]]]:
+        """(score, base row, overlay document) of the k best rows, best first"""
+        candidates = [(score, row, None) for row, score in self.search_vector(query_vector, k)]
+        overlay_vectors, overlay_documents = self._overlay
+        if overlay_documents:
+            overlay_scores = overlay_vectors @ query_vector
+            for position in np.argsort(-overlay_scores)[:k]:
+                candidates.append((float(overlay_scores[position]), None, overlay_documents[position]))
+        candidates.sort(key=lambda candidate: -candidate[0])
+        return candidates[:k]
+
+    def apply_section_changes(self, url: str, removed_hashes, added_documents: List[Dict]):
+        """
+        Re-index only the changed sections of a page: rows whose section hash
+        was removed are masked out and added sections are embedded into the
+        overlay. Hashes are section_hash(content).
+        """
+        removed_hashes = set(removed_hashes)
+        overlay_vectors, overlay_documents = self._overlay
+        deleted_rows = self._deleted_rows
+        if removed_hashes:
+            deleted_rows = deleted_rows | {
+                row for (row_url, digest), row in self._get_section_rows().items()
+                if row_url == url and digest in removed_hashes
+            }
+            kept = [
+                (vector, document)
+                for vector, document in zip(overlay_vectors if overlay_documents else [], overlay_documents)
+                if not (document.get("url") == url and section_hash(document["content"]) in removed_hashes)
+            ]
+            overlay_documents = [document for _, document in kept]
+            overlay_vectors = np.array([vector for vector, _ in kept], dtype=np.float32) if kept else None
+
+        if added_documents and self.model is not None:
+            added_documents = [{field: d.get(field) for field in DOCUMENT_FIELDS} for d in added_documents]
+            vectors = self.embed([f"{d.get('category') or ''} {d['content']}" for d in added_documents])
+            overlay_vectors = vectors if overlay_vectors is None else np.vstack([overlay_vectors, vectors])
+            overlay_documents = overlay_documents + added_documents
+
+        self._deleted_rows = frozenset(deleted_rows)
+        self._overlay = (overlay_vectors, overlay_documents)
+        if removed_hashes or added_documents:
+            change = [url, sorted(removed_hashes), [section_hash(d["content"]) for d in added_documents]]
+            self.version = hashlib.sha1(json.dumps([self.version, change]).encode("utf-8")).hexdigest()[:16]
+
+    def section_hashes(self, url: str) -> Set[str]:
+        """Hashes of the sections of a page currently in the index"""
+        hashes = {digest for (row_url, digest), row in self._get_section_rows().items()
+                  if row_url == url and row not in self._deleted_rows}
+        hashes.update(section_hash(document["content"]) for document in self._overlay[1]
+                      if document.get("url") == url)
+        return hashes
+
+    def _get_section_rows(self) -> Dict[Tuple[str, str], int]:
+        if self._section_rows is None:
+            self._section_rows = {}
+            with open(os.path.join(self.index_dir, DOCUMENTS_FILE), "rb") as f:
+                for row, line in enumerate(f):
+                    document = json.loads(line)
+                    if document.get("url"):
+                        self._section_rows[(document["url"], section_hash(document["content"]))] = row
+        return self._section_rows
+
+    def get_document(self, row: int) -> Dict:
+        with open(os.path.join(self.index_dir, DOCUMENTS_FILE), "rb") as f:
+            f.seek(int(self.offsets[row]))
+            return json.loads(f.readline())
+
+
+def build_index(documents: Iterable[Dict], index_dir: str, dimensions: int = 256) -> VectorIndex:
+    """Fit TF-IDF/LSA on the documents and write the index files"""
+    import joblib
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    documents = [
+        {field: document.get(field) for field in DOCUMENT_FIELDS}
+        for document in documents if document.get("content")
+    ]
+    if not documents:
+        raise ValueError("No documents to index")
+
+    os.makedirs(index_dir, exist_ok=True)
+    texts = [f"{d.get('category') or ''} {d['content']}" for d in documents]
+
+    vectorizer = TfidfVectorizer(sublinear_tf=True, ngram_range=(1, 2), min_df=1)
+    tfidf = vectorizer.fit_transform(texts)
+
+    # LSA needs fewer components than terms; tiny corpora keep plain TF-IDF
+    components = min(dimensions, tfidf.shape[1] - 1, max(len(documents) - 1, 1))
+    svd = TruncatedSVD(n_components=components, random_state=0) if components >= 2 else None
+    embedded = svd.fit_transform(tfidf) if svd is not None else tfidf.toarray()
+
+    vectors = np.lib.format.open_memmap(
+        os.path.join(index_dir, VECTORS_FILE), mode="w+",
+        dtype=np.float32, shape=embedded.shape
+    )
+    vectors[:] = _normalise_rows(np.asarray(embedded, dtype=np.float32))
+    vectors.flush()
+    del vectors
+
+    offsets = np.zeros(len(documents), dtype=np.int64)
+    with open(os.path.join(index_dir, DOCUMENTS_FILE), "wb") as f:
+        for row, document in enumerate(documents):
+            offsets[row] = f.tell()
+            f.write(json.dumps(document, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+    np.save(os.path.join(index_dir, OFFSETS_FILE), offsets)
+
+    joblib.dump((vectorizer, svd), os.path.join(index_dir, MODEL_FILE))
+    logger.info(f"Built vector index with {len(documents)} rows and {embedded.shape[1]} dimensions")
+    return VectorIndex(index_dir).load()
+
+
+def collect_documents(include_web: bool = True) -> List[Dict]:
+    """Gather regulations from the database and sections from the scraped websites"""
+    from app.database.operations import DatabaseOperations
+
+    documents = list(DatabaseOperations().db.regulations.find({}, {"_id": 0}))
+    if include_web:
+        documents.extend(collect_web_sections())
+    return documents
+
+
+def collect_web_sections() -> List[Dict]:
+    from app.services.web_scraper import WebSearchService
+
+    web_search_service = WebSearchService()
+    sections = []
+    for page in web_search_service.source_pages():
+        html_content = web_search_service.fetch_page(page)
+        if html_content:
+            sections.extend(web_search_service.page_documents(page, html_content))
+    return sections
+
+
+def document_partitions(document: Dict) -> List[Tuple[str, str]]:
+    """(country, language) partitions a document belongs to"""
+    country = (document.get("country") or settings.default_country).lower()
+    languages = document.get("language") or "en"
+    if isinstance(languages, str):
+        languages = [languages]
+    return sorted({(country, language_key(language)) for language in languages})
+
+
+def language_key(language: str) -> str:
+    """Partition key of a language code, e.g. 'en-US' -> 'en'"""
+    return language.replace("_", "-").split("-")[0].lower()
+
+
+def partition_dir(country: str, language: str, index_dir: Optional[str] = None) -> str:
+    return os.path.join(index_dir or resolve_path(settings.vector_index_dir), country.lower(), language_key(language))
+
+
+def build_partitioned_index(documents: Iterable[Dict], index_dir: str, dimensions: int = 256) -> Dict[Tuple[str, str], VectorIndex]:
+    """Build one index per (country, language) partition"""
+    partitions: Dict[Tuple[str, str], List[Dict]] = {}
+    for document in documents:
+        for partition in document_partitions(document):
+            partitions.setdefault(partition, []).append(document)
+    return {
+        (country, language): build_index(partition_documents, partition_dir(country, language, index_dir), dimensions)
+        for (country, language), partition_documents in partitions.items()
+    }
+
+
+# Partitions are loaded lazily, so a worker only maps the indexes of the
+# countries and languages it actually serves. Missing partitions cache None.
+_indexes: Dict[Tuple[str, str], Optional[VectorIndex]] = {}
+_index_lock = threading.Lock()
+
+
+def get_vector_index(country: str, language: str) -> Optional[VectorIndex]:
+    """Process-wide index of one partition, loaded on first use (or preloaded before fork)"""
+    key = (country.lower(), language_key(language))
+    if key not in _indexes:
+        with _index_lock:
+            if key not in _indexes:
+                index = VectorIndex(partition_dir(*key))
+                _indexes[key] = index.load() if index.exists else None
+    return _indexes[key]
+
+
+def index_version(country: str, language: str) -> Optional[str]:
+    """Version of a partition if it is loaded ("none" if it does not exist); never loads it"""
+    key = (country.lower(), language_key(language))
+    if key not in _indexes:
+        return None
+    index = _indexes[key]
+    return index.version if index is not None else "none"
+
+
+def _indexes_memory() -> Dict:
+    heap = mapped = rows = 0
+    for index in list(_indexes.values()):
+        if index is None:
+            continue
+        rows += len(index)
+        mapped += index.vectors.nbytes + index.offsets.nbytes
+        overlay_vectors, overlay_documents = index._overlay
+        heap += deep_sizeof(index.model) + deep_sizeof(overlay_documents) + deep_sizeof(index._section_rows)
+        if overlay_vectors is not None:
+            heap += overlay_vectors.nbytes
+    # Mapped pages are file-backed and shared between workers
+    return {"entries": rows, "bytes": heap, "mapped_bytes": mapped, "partitions": len(_indexes)}
+
+
+register_component("vector_indexes", _indexes_memory)
+
+
+def preload_partitions(countries: List[str]):
+    """Load the partitions of the given countries (every partition on disk if empty)"""
+    root = resolve_path(settings.vector_index_dir)
+    if not os.path.isdir(root):
+        return
+    for country in countries or os.listdir(root):
+        country_dir = os.path.join(root, country.lower())
+        if os.path.isdir(country_dir):
+            for language in os.listdir(country_dir):
+                get_vector_index(country, language)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the semantic similarity index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="(re)build the index from the database and websites")
+    build.add_argument("--index-dir", default=resolve_path(settings.vector_index_dir))
+    build.add_argument("--dimensions", type=int, default=settings.vector_index_dimensions)
+    build.add_argument("--no-web", action="store_true", help="index database regulations only")
+    query = subparsers.add_parser("query", help="run a query against the index")
+    query.add_argument("text")
+    query.add_argument("--index-dir", default=resolve_path(settings.vector_index_dir))
+    query.add_argument("--country", default=settings.default_country)
+    query.add_argument("--language", default="en")
+    query.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "build":
+        indexes = build_partitioned_index(collect_documents(not args.no_web), args.index_dir, args.dimensions)
+        for (country, language), index in sorted(indexes.items()):
+            print(f"Indexed {len(index)} documents into {country}/{language}")
+    else:
+        index_dir = partition_dir(args.country, args.language, args.index_dir)
+        for document in VectorIndex(index_dir).load().search(args.text, args.k):
+            print(f"{document['score']:.3f}  [{document.get('category')}] {document['content'][:100]}")
+
+
+if __name__ == "__main__":
+    main()
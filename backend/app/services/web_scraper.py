@@ -1,16 +1,88 @@
 import requests
-from bs4 import BeautifulSoup
 from typing import Optional, Dict, List
 import time
 import re
 from urllib.parse import urljoin, urlparse
 import logging
+from app.config import settings
+from app.services.page_cache import page_cache
+from app.services.profiling import stage
 
 logger = logging.getLogger(__name__)
 
+def parse_html(html_content: str):
+    """Parse HTML with BeautifulSoup, imported on first use to keep startup fast"""
+    from bs4 import BeautifulSoup
+    with stage("scraper.parse"):
+        return BeautifulSoup(html_content, 'html.parser')
+
+# Query keywords of RouteToGermanyScraper.search_topic and their topics
+ROUTE_TOPIC_MAPPING = {
+    "speed": "speed_limit",
+    "limit": "speed_limit", 
+    "autobahn": "autobahn",
+    "highway": "autobahn",
+    "park": "parking",
+    "parking": "parking",
+    "right": "right_of_way",
+    "way": "right_of_way",
+    "priority": "right_of_way",
+    "sign": "traffic_signs",
+    "traffic": "traffic_signs",
+    "alcohol": "alcohol_limit",
+    "drink": "alcohol_limit",
+    "license": "license",
+    "licence": "license",
+    "safety": "safety",
+    "seatbelt": "seatbelt",
+    "seat belt": "seatbelt",
+    "accident": "accident",
+    "insurance": "insurance",
+    "fine": "fines",
+    "penalty": "fines",
+    "tire": "tires",
+    "winter": "tires",
+    "environmental": "environmental",
+    "tuning": "tuning",
+    "performance": "tuning", 
+    "modification": "tuning"
+}
+
+# Query keywords of GettingAroundGermanyScraper.search_topic and their sections
+GETTING_AROUND_TOPIC_MAPPING = {
+    "license": "licensing",
+    "licence": "licensing", 
+    "driving license": "licensing",
+    "speed": "speed limits",
+    "autobahn": "autobahn traffic regulations",
+    "parking": "parking regulations",
+    "right": "right-of-way",
+    "priority": "right-of-way",
+    "alcohol": "drinking and driving",
+    "drink": "drinking and driving",
+    "accident": "accidents",
+    "insurance": "general laws and enforcement",
+    "seatbelt": "general laws and enforcement",
+    "safety": "general laws and enforcement",
+    "enforcement": "general laws and enforcement",
+    "fine": "general laws and enforcement",
+    "penalty": "general laws and enforcement",
+    "bicycle": "bicycle lanes, streets, and zones",
+    "bike": "bicycle lanes, streets, and zones",
+    "urban": "urban traffic regulations",
+    "city": "urban traffic regulations",
+    "traffic": "traffic calming zones",
+    "calm": "traffic calming zones",
+    "pass": "passing/overtaking",
+    "overtake": "passing/overtaking",
+    "phone": "additional prohibitions",
+    "mobile": "additional prohibitions"
+}
+
+
 class RouteToGermanyScraper:
     def __init__(self):
-        self.base_url = "https://routetogermany.com"
+        self.base_url = settings.route_to_germany_url
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
@@ -37,6 +109,15 @@ class RouteToGermanyScraper:
         }
     
     def get_page_content(self, url: str) -> Optional[str]:
+        """Get a page from the page cache, fetching it if missing or stale"""
+        page_cache.record_request(url)
+        return page_cache.get_or_fetch(url, self._fetch_page_timed)
+
+    def _fetch_page_timed(self, url: str) -> Optional[str]:
+        with stage("scraper.fetch"):
+            return self.fetch_page(url)
+
+    def fetch_page(self, url: str) -> Optional[str]:
         """Fetch content from a specific URL with timeout protection"""
         try:
             response = self.session.get(url, timeout=5)  # Reduced timeout to 5 seconds
@@ -51,7 +132,7 @@ class RouteToGermanyScraper:
     
     def extract_relevant_sections(self, html_content: str, topic_keywords: List[str]) -> List[str]:
         """Extract relevant sections based on topic keywords"""
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = parse_html(html_content)
         
         # Remove script, style, navigation elements
         for element in soup(["script", "style", "nav", "header", "footer"]):
@@ -167,41 +248,10 @@ class RouteToGermanyScraper:
         # Identify the most relevant topic URL based on keywords
         query_lower = query.lower()
         
-        # Map query keywords to topic categories
-        topic_mapping = {
-            "speed": "speed_limit",
-            "limit": "speed_limit", 
-            "autobahn": "autobahn",
-            "highway": "autobahn",
-            "park": "parking",
-            "parking": "parking",
-            "right": "right_of_way",
-            "way": "right_of_way",
-            "priority": "right_of_way",
-            "sign": "traffic_signs",
-            "traffic": "traffic_signs",
-            "alcohol": "alcohol_limit",
-            "drink": "alcohol_limit",
-            "license": "license",
-            "licence": "license",
-            "safety": "safety",
-            "seatbelt": "seatbelt",
-            "seat belt": "seatbelt",
-            "accident": "accident",
-            "insurance": "insurance",
-            "fine": "fines",
-            "penalty": "fines",
-            "tire": "tires",
-            "winter": "tires",
-            "environmental": "environmental",
-            "tuning": "tuning",
-            "performance": "tuning", 
-            "modification": "tuning"
-        }
         
         # Find the best matching topic
         matched_topic = None
-        for keyword, topic in topic_mapping.items():
+        for keyword, topic in ROUTE_TOPIC_MAPPING.items():
             if keyword in query_lower:
                 matched_topic = topic
                 break
@@ -406,41 +456,22 @@ class RouteToGermanyScraper:
 
 class GettingAroundGermanyScraper:
     def __init__(self):
-        self.base_url = "https://www.gettingaroundgermany.info"
+        self.base_url = settings.getting_around_germany_url
         self.main_page_url = f"{self.base_url}/regeln.shtml"
         
         # Topic mapping for keywords to sections
-        self.topic_mapping = {
-            "license": "licensing",
-            "licence": "licensing", 
-            "driving license": "licensing",
-            "speed": "speed limits",
-            "autobahn": "autobahn traffic regulations",
-            "parking": "parking regulations",
-            "right": "right-of-way",
-            "priority": "right-of-way",
-            "alcohol": "drinking and driving",
-            "drink": "drinking and driving",
-            "accident": "accidents",
-            "insurance": "general laws and enforcement",
-            "seatbelt": "general laws and enforcement",
-            "safety": "general laws and enforcement",
-            "enforcement": "general laws and enforcement",
-            "fine": "general laws and enforcement",
-            "penalty": "general laws and enforcement",
-            "bicycle": "bicycle lanes, streets, and zones",
-            "bike": "bicycle lanes, streets, and zones",
-            "urban": "urban traffic regulations",
-            "city": "urban traffic regulations",
-            "traffic": "traffic calming zones",
-            "calm": "traffic calming zones",
-            "pass": "passing/overtaking",
-            "overtake": "passing/overtaking",
-            "phone": "additional prohibitions",
-            "mobile": "additional prohibitions"
-        }
+        self.topic_mapping = GETTING_AROUND_TOPIC_MAPPING
     
     def get_page_content(self, url: str) -> Optional[str]:
+        """Get a page from the page cache, fetching it if missing or stale"""
+        page_cache.record_request(url)
+        return page_cache.get_or_fetch(url, self._fetch_page_timed)
+
+    def _fetch_page_timed(self, url: str) -> Optional[str]:
+        with stage("scraper.fetch"):
+            return self.fetch_page(url)
+
+    def fetch_page(self, url: str) -> Optional[str]:
         """Fetch content from a specific URL with timeout protection"""
         try:
             headers = {
@@ -456,7 +487,7 @@ class GettingAroundGermanyScraper:
     def extract_section_content(self, html_content: str, section_title: str) -> Optional[str]:
         """Extract content for a specific section from the main page"""
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
+            soup = parse_html(html_content)
             
             # Find the section heading
             section_heading = None
@@ -618,10 +649,57 @@ class GettingAroundGermanyScraper:
         return best_answer.strip()
 
 class WebSearchService:
+    # The scraped websites only cover German driving rules
+    countries = {"germany"}
+
     def __init__(self):
         self.route_scraper = RouteToGermanyScraper()
         self.getting_around_scraper = GettingAroundGermanyScraper()
     
+    def supports_country(self, country: str) -> bool:
+        return country.lower() in self.countries
+
+    def source_pages(self) -> List[Dict]:
+        """Every page the scrapers read, with the topics served from it"""
+        pages = {}
+        for topic, path in self.route_scraper.topic_urls.items():
+            url = urljoin(self.route_scraper.base_url, path)
+            page = pages.setdefault(url, {"url": url, "source": "routetogermany.com", "topics": []})
+            page["topics"].append(topic)
+        url = self.getting_around_scraper.main_page_url
+        pages[url] = {
+            "url": url,
+            "source": "gettingaroundgermany.info",
+            "topics": sorted(set(self.getting_around_scraper.topic_mapping.values()))
+        }
+        return list(pages.values())
+
+    def fetch_page(self, page: Dict) -> Optional[str]:
+        """Fetch a source page directly, bypassing the page cache"""
+        if page["source"] == "routetogermany.com":
+            return self.route_scraper.fetch_page(page["url"])
+        return self.getting_around_scraper.fetch_page(page["url"])
+
+    def page_documents(self, page: Dict, html_content: str) -> List[Dict]:
+        """Split a source page into indexable sections"""
+        documents = []
+        for topic in page["topics"]:
+            if page["source"] == "routetogermany.com":
+                sections = self.route_scraper.extract_relevant_sections(html_content, [topic])
+            else:
+                section = self.getting_around_scraper.extract_section_content(html_content, topic)
+                sections = [section] if section else []
+            for content in sections:
+                documents.append({
+                    "category": topic, "content": content, "country": "germany",
+                    "language": "en", "source": page["source"], "url": page["url"]
+                })
+        # Pages shared by several topics yield the same sections more than once
+        unique = {}
+        for document in documents:
+            unique.setdefault(document["content"], document)
+        return list(unique.values())
+
     def search_route_to_germany(self, query: str, language: str = "en") -> Optional[Dict]:
         """Search both websites for driving information with intelligent fallback"""
         # Try both sources and compare relevance
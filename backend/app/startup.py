@@ -0,0 +1,73 @@
+"""
+Startup warm-up and readiness state.
+
+Heavy dependencies (spaCy, BeautifulSoup) are imported lazily, so the process
+is alive long before it can answer a question. ``warm_up`` loads the models
+and runs a dummy parse; the readiness endpoint reports 503 until it finished.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WARM_UP_MESSAGES = [
+    ("What is the speed limit?", "en"),
+    ("Wie hoch ist die Geschwindigkeitsbegrenzung?", "de"),
+]
+
+_state = {
+    "ready": False,
+    "error": None,
+    "warm_up_seconds": None,
+}
+_lock = threading.Lock()
+
+
+def warm_up():
+    """Load the models and run a dummy parse. Safe to call more than once."""
+    with _lock:
+        if _state["ready"]:
+            return
+        started = time.perf_counter()
+        try:
+            from app.nlp.executor import get_nlp_executor
+            from app.nlp.processor import LanguageProcessor
+            from app.services import autocomplete, popularity, spelling, terms
+            from app.services.web_scraper import parse_html
+
+            processor = LanguageProcessor()
+            for text, language in WARM_UP_MESSAGES:
+                processor.process_text(text, language)
+                processor.extract_keywords(text, language)
+            get_nlp_executor().warm_up()
+            parse_html("<p>warm up</p>")
+            for _, language in WARM_UP_MESSAGES:
+                autocomplete.get_trie(language)
+                spelling.get_index(language)
+                terms.get_normalizer(language)
+                popularity.tracker.top(language, 1)
+        except Exception as e:
+            _state["error"] = str(e)
+            logger.error(f"Warm-up failed: {e}")
+            return
+
+        _state["ready"] = True
+        _state["error"] = None
+        _state["warm_up_seconds"] = round(time.perf_counter() - started, 3)
+        logger.info(f"Warm-up completed in {_state['warm_up_seconds']}s")
+
+
+async def warm_up_async():
+    """Run the warm-up off the event loop so liveness checks keep answering"""
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, warm_up)
+
+
+def is_ready() -> bool:
+    return _state["ready"]
+
+
+def get_state() -> dict:
+    return dict(_state)
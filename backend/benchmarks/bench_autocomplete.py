@@ -0,0 +1,67 @@
+"""
+Lookup latency of the autocomplete trie.
+
+The trie is seeded with the static question lists plus synthetic user
+questions, then queried with every prefix of a sample of those questions,
+the way a client calls the endpoint on each keystroke.
+
+Usage:
+    python -m benchmarks.bench_autocomplete --questions 1000 10000 50000
+"""
+import argparse
+import random
+import time
+
+from app.services.autocomplete import build_trie
+
+SUBJECTS = ["speed limit", "alcohol limit", "parking", "winter tires", "right of way", "seat belt",
+            "driving license", "environmental zone", "autobahn", "fine", "accident", "insurance"]
+TEMPLATES = ["What is the {} in {}?", "Do I need a {} for {}?", "How much is the {} near {}?",
+             "Is there a {} rule in {}?", "Where can I check the {} for {}?"]
+PLACES = ["Berlin", "Munich", "Hamburg", "cities", "towns", "the countryside", "school zones", "tunnels"]
+
+
+def synthetic_questions(count: int, rng: random.Random):
+    for _ in range(count):
+        yield rng.choice(TEMPLATES).format(rng.choice(SUBJECTS), rng.choice(PLACES)) + f" #{rng.randrange(count)}"
+
+
+def bench(questions: int, samples: int):
+    rng = random.Random(0)
+    trie = build_trie("en")
+    started = time.perf_counter()
+    for question in synthetic_questions(questions, rng):
+        trie.add(question)
+    build_seconds = time.perf_counter() - started
+
+    latencies = []
+    for question in rng.sample(list(trie.phrases.values()), min(samples, len(trie))):
+        for end in range(1, len(question) + 1):
+            started = time.perf_counter()
+            trie.complete(question[:end], 5)
+            latencies.append((time.perf_counter() - started) * 1e6)
+    latencies.sort()
+    return {
+        "phrases": len(trie),
+        "build_s": build_seconds,
+        "lookups": len(latencies),
+        "p50_us": latencies[len(latencies) // 2],
+        "p99_us": latencies[max(int(len(latencies) * 0.99) - 1, 0)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--samples", type=int, default=200, help="questions whose prefixes are looked up")
+    args = parser.parse_args()
+
+    print(f"{'questions':>10}{'phrases':>10}{'build s':>10}{'lookups':>10}{'p50 us':>10}{'p99 us':>10}")
+    for questions in args.questions:
+        result = bench(questions, args.samples)
+        print(f"{questions:>10}{result['phrases']:>10}{result['build_s']:>10.2f}{result['lookups']:>10}"
+              f"{result['p50_us']:>10.1f}{result['p99_us']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
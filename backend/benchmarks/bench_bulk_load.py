@@ -0,0 +1,78 @@
+"""
+Load test for the streaming bulk loader.
+
+Generates an NDJSON stream of synthetic regulations on the fly (with a share
+of duplicates and invalid documents), feeds it through the incremental
+parser and the loader into a scratch database, and reports documents/second,
+error counts and the peak resident memory of the process.
+
+Usage:
+    python -m benchmarks.bench_bulk_load --documents 1000000 --batch-size 1000
+"""
+import argparse
+import json
+import random
+import resource
+
+from app.data.bulk_loader import BulkLoader, iter_json_documents
+from app.database.operations import DatabaseOperations
+
+CATEGORIES = ["speed_limit", "alcohol_limit", "parking", "right_of_way", "traffic_signs", "seatbelt"]
+
+
+def generate_ndjson(documents: int, duplicate_rate: float, invalid_rate: float, lines_per_chunk: int = 500):
+    """Yield NDJSON byte chunks without ever holding the whole input in memory"""
+    rng = random.Random(0)
+    lines = []
+    for i in range(documents):
+        roll = rng.random()
+        if roll < invalid_rate:
+            document = {"category": "speed_limit", "content": ""}
+        else:
+            n = rng.randrange(max(i, 1)) if roll < invalid_rate + duplicate_rate else i
+            document = {
+                "category": CATEGORIES[n % len(CATEGORIES)],
+                "country": "germany",
+                "content": f"Synthetic regulation number {n} for load testing.",
+                "language": ["en-US", "en-GB"],
+                "keywords": ["synthetic", CATEGORIES[n % len(CATEGORIES)]],
+                "source": "load-test",
+            }
+        lines.append(json.dumps(document))
+        if len(lines) >= lines_per_chunk:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[1000])
+    parser.add_argument("--duplicate-rate", type=float, default=0.1)
+    parser.add_argument("--invalid-rate", type=float, default=0.01)
+    parser.add_argument("--database", default="driving_regulations_loadtest")
+    parser.add_argument("--dry-run", action="store_true", help="measure parsing and validation only")
+    args = parser.parse_args()
+
+    db_ops = DatabaseOperations()
+    db_ops.db = db_ops.client[args.database]
+    for batch_size in args.batch_size:
+        if not args.dry_run:
+            db_ops.db.regulations.drop()
+            db_ops.db.regulations.create_index("content_hash", unique=True)
+        loader = BulkLoader(db_ops, batch_size=batch_size, dry_run=args.dry_run)
+        chunks = generate_ndjson(args.documents, args.duplicate_rate, args.invalid_rate)
+        report = loader.load(iter_json_documents(chunks))
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"batch {batch_size:>6}: {report['documents_per_second']:>10.1f} docs/s  "
+              f"inserted {report['inserted']}  duplicates {report['duplicates']}  "
+              f"invalid {report['invalid']}  write errors {report['write_errors']}  "
+              f"peak RSS {peak_rss_mb:.0f} MB")
+    if not args.dry_run:
+        db_ops.client.drop_database(args.database)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Load test for the regulation feed collector.
+
+Serves synthetic regulation feeds from a local HTTP server (chunked, generated
+on the fly, so multi-GB feeds need no disk or memory), in NDJSON or as one
+JSON array and with the records in the regulation schema or under feed-style
+field names, collects them concurrently into a scratch database and reports
+documents/second, MB/second and the peak resident memory of the process.
+With --bad-every N every Nth record is malformed JSON; each must be counted
+as one invalid document while the records after it still load.
+
+Usage:
+    python -m benchmarks.bench_collector --feeds 4 --documents 2000000 --format array --dry-run
+    python -m benchmarks.bench_collector --documents 100000 --bad-every 1000 --dry-run
+"""
+import argparse
+import json
+import resource
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from app.data.bulk_loader import BulkLoader
+from app.data.collector import DataCollector
+from app.database.operations import DatabaseOperations
+from benchmarks.bench_bulk_load import CATEGORIES
+
+RECORDS_PER_CHUNK = 500
+# A record cut off in the middle, as a corrupt feed would have it
+BAD_RECORD = '{"topic": "corrupt", "rule": {"text": "cut off'
+
+
+def feed_record(feed: int, n: int, schema: str) -> dict:
+    category = CATEGORIES[n % len(CATEGORIES)]
+    content = f"Synthetic regulation number {n} of feed {feed} for load testing."
+    if schema == "alias":
+        return {"topic": category, "rule": {"text": content}, "lang": "en-US", "tags": f"synthetic,{category}"}
+    return {"category": category, "country": "germany", "content": content, "language": "en-US",
+            "keywords": ["synthetic", category], "source": f"feed-{feed}"}
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        feed = int(url.path.strip("/").split("-")[-1])
+        documents = int(query.get("documents", 1000))
+        array = query.get("format") == "array"
+        schema = query.get("schema", "native")
+        bad_every = int(query.get("bad_every", 0))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json" if array else "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._chunk(b"[" if array else b"")
+        for start in range(0, documents, RECORDS_PER_CHUNK):
+            lines = [BAD_RECORD if bad_every and n % bad_every == bad_every - 1 else json.dumps(feed_record(feed, n, schema))
+                     for n in range(start, min(start + RECORDS_PER_CHUNK, documents))]
+            separator = ",\n" if array else "\n"
+            text = separator.join(lines) + ("," if array and start + RECORDS_PER_CHUNK < documents else "\n")
+            self._chunk(text.encode("utf-8"))
+        self._chunk(b"]" if array else b"")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, data: bytes):
+        if data:
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_feed_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--feeds", type=int, default=4)
+    parser.add_argument("--documents", type=int, default=250_000, help="documents per feed")
+    parser.add_argument("--format", choices=["ndjson", "array"], default="ndjson")
+    parser.add_argument("--schema", choices=["native", "alias"], default="native",
+                        help="records in the regulation schema or under feed-style field names")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--database", default="driving_regulations_loadtest")
+    parser.add_argument("--bad-every", type=int, default=0, help="make every Nth record malformed JSON")
+    parser.add_argument("--dry-run", action="store_true", help="measure fetching, parsing and validation only")
+    args = parser.parse_args()
+
+    server = start_feed_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    feeds = [
+        {"url": f"{base_url}/feed-{i}?documents={args.documents}&format={args.format}&schema={args.schema}"
+                f"&bad_every={args.bad_every}",
+         "fields": {"content": "rule.text"} if args.schema == "alias" else {}, "defaults": {"country": "germany"}}
+        for i in range(args.feeds)
+    ]
+    db_ops = None
+    if not args.dry_run:
+        db_ops = DatabaseOperations()
+        db_ops.db = db_ops.client[args.database]
+    for concurrency in args.concurrency:
+        if db_ops is not None:
+            db_ops.db.regulations.drop()
+            db_ops.db.regulations.create_index("content_hash", unique=True)
+        collector = DataCollector(feeds, concurrency)
+        started = time.perf_counter()
+        report = collector.collect(BulkLoader(db_ops, batch_size=args.batch_size, dry_run=args.dry_run))
+        elapsed = time.perf_counter() - started
+        megabytes = sum(stats["bytes"] for stats in report["feeds"].values()) / 1e6
+        failed = [url for url, stats in report["feeds"].items() if stats["error"]]
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"concurrency {concurrency:>3}: {report['read'] / elapsed:>10.1f} docs/s  {megabytes / elapsed:>7.1f} MB/s  "
+              f"read {report['read']} ({megabytes:.0f} MB)  inserted {report['inserted']}  "
+              f"invalid {report['invalid']}  failed feeds {len(failed)}  peak RSS {peak_rss_mb:.0f} MB")
+        if args.bad_every:
+            expected = args.feeds * (args.documents // args.bad_every)
+            print(f"{'':<17}malformed records {expected}: "
+                  f"{'ok' if report['invalid'] == expected and not failed else 'FAILED'}")
+    if db_ops is not None:
+        db_ops.client.drop_database(args.database)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
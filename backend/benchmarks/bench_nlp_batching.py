@@ -0,0 +1,86 @@
+"""
+Throughput/latency trade-off of micro-batched NLP calls.
+
+Concurrent asyncio clients call NLPExecutor.extract_keywords in a closed loop
+for each combination of max batch size and max wait; the table shows
+throughput, p50/p99 latency and the mean batch size achieved. Batch size 1
+with no wait is the unbatched baseline.
+
+Usage:
+    python -m benchmarks.bench_nlp_batching --workers 2 --clients 32 --batch-sizes 1 4 16 --waits-ms 0 2 5
+    python -m benchmarks.bench_nlp_batching --blank   # blank pipelines, no model download needed
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+import app.nlp.processor as processor
+from app.nlp.executor import NLPExecutor
+
+QUESTIONS = [
+    "What is the speed limit on the Autobahn near Munich?",
+    "Do I need winter tires in Germany when it snows?",
+    "How much is the fine for parking in front of a driveway?",
+    "Is it allowed to use my phone while waiting at a red light?",
+    "Who has the right of way at an intersection without signs?",
+    "What is the blood alcohol limit for new drivers?",
+]
+
+
+async def run(executor: NLPExecutor, clients: int, duration: float):
+    latencies = []
+    deadline = time.perf_counter() + duration
+    rng = random.Random(0)
+
+    async def client():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await executor.extract_keywords(rng.choice(QUESTIONS), "en")
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return latencies
+
+
+def bench(workers: int, clients: int, batch_size: int, wait_ms: float, duration: float):
+    executor = NLPExecutor(workers=workers, max_batch_size=batch_size, max_wait_ms=wait_ms)
+    executor.warm_up()
+    try:
+        started = time.perf_counter()
+        latencies = sorted(asyncio.run(run(executor, clients, duration)))
+        elapsed = time.perf_counter() - started
+    finally:
+        executor.shutdown()
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2, help="pool processes (0 = thread)")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--waits-ms", type=float, nargs="+", default=[0, 2, 5, 10])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per setting")
+    parser.add_argument("--blank", action="store_true", help="use blank spaCy pipelines")
+    args = parser.parse_args()
+
+    if args.blank:
+        processor.MODEL_NAMES = {language: f"blank:{language}" for language in processor.MODEL_NAMES}
+    processor.load_models()  # inherited by the forked pool processes
+
+    print(f"{'batch':>6}{'wait ms':>9}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    for batch_size, wait_ms in itertools.product(args.batch_sizes, args.waits_ms):
+        if batch_size == 1 and wait_ms:
+            continue  # a batch of one never waits
+        result = bench(args.workers, args.clients, batch_size, wait_ms, args.duration)
+        print(f"{batch_size:>6}{wait_ms:>9}{result['throughput']:>10.0f}{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
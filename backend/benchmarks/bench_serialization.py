@@ -0,0 +1,82 @@
+"""
+Serialisation time and bytes on the wire for chat and search responses.
+
+Compares the default FastAPI path (validate through the response model,
+jsonable_encoder, json.dumps) with the fast path (plain dict through
+app.api.responses.dumps, orjson when installed), and reports body sizes
+uncompressed, gzip and brotli, with and without duplicated search content.
+
+Usage:
+    python -m benchmarks.bench_serialization --repeat 2000
+"""
+import argparse
+import gzip
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from app.api import responses
+from app.api.models import ChatResponse, SearchResponse
+
+PARAGRAPH = ("The normal speed limit in cities and towns is 50 km/h unless signs show otherwise. "
+             "In residential zones the speed limit is often 30 km/h and cameras are common. ")
+
+
+def regulation(i: int) -> dict:
+    return {"category": "speed_limit", "content": PARAGRAPH * 2, "country": "germany", "language": "en-US",
+            "source": f"StVO §{i}", "keywords": ["speed", "limit", "town"], "last_updated": "2024-01-01"}
+
+
+def payloads():
+    web = {"response": "According to routetogermany.com:\n\n" + "\n\n".join([PARAGRAPH * 2] * 4),
+           "intent": "speed_limit", "confidence": 0.9, "suggestions": ["What happens if I exceed the speed limit?"],
+           "source": "routetogermany.com", "url": "https://routetogermany.com/drivingingermany/city-driving",
+           "tier": "web", "degraded": False}
+    results = [regulation(i) for i in range(3)]
+    db_search = {"response": "Here's what I found:\n\n" + "\n".join(r["content"] for r in results),
+                 "intent": "search", "confidence": 0.9, "search_results": results, "tier": "db_search",
+                 "degraded": False}
+    compact = {**db_search, "search_results": [{k: v for k, v in r.items() if k != "content"} for r in results]}
+    search = lambda n: {"results": [regulation(i) for i in range(n)], "query": "speed limit",
+                        "matched_keywords": ["speed", "limit"], "total_results": n, "next_cursor": None}
+    return [
+        ("chat web summary", ChatResponse, web),
+        ("chat db_search", ChatResponse, db_search),
+        ("chat db_search omit dup", ChatResponse, compact),
+        ("search 10 results", SearchResponse, search(10)),
+        ("search 100 results", SearchResponse, search(100)),
+    ]
+
+
+def default_path(model, payload) -> bytes:
+    validated = model(**payload)
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def timed(function, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    encoder = "orjson" if responses.orjson is not None else "json"
+    print(f"fast path encoder: {encoder}; brotli {'available' if responses.brotli else 'not installed'}\n")
+    print(f"{'payload':<26}{'default us':>11}{'fast us':>9}{'bytes':>8}{'gzip':>7}{'br':>7}")
+    for name, model, payload in payloads():
+        default_us = timed(lambda: default_path(model, payload), args.repeat)
+        fast_us = timed(lambda: responses.dumps(payload), args.repeat)
+        body = responses.dumps(payload)
+        gzipped = len(gzip.compress(body, 6))
+        brotli_size = len(responses.brotli.compress(body, quality=4)) if responses.brotli else "-"
+        print(f"{name:<26}{default_us:>11.1f}{fast_us:>9.1f}{len(body):>8}{gzipped:>7}{brotli_size:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Typo correction with the deletion index versus a naive edit-distance scan.
+
+The English vocabulary (without Mongo keywords) is padded with synthetic
+words to each size, then misspellings of random vocabulary words (one or two
+random edits) are corrected by DeletionIndex.lookup and by computing the edit
+distance to every word. Reports build time, index bytes, per-token latency
+of both and how often the index returns the same word as the scan.
+
+Usage:
+    python -m benchmarks.bench_spelling --words 1000 10000 50000
+"""
+import argparse
+import random
+import string
+import time
+
+from app.services.spelling import DeletionIndex, build_vocabulary, edit_distance
+
+
+def synthetic_words(count: int, rng: random.Random):
+    for _ in range(count):
+        yield "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12)))
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    for _ in range(rng.randint(1, 2)):
+        i = rng.randrange(len(word))
+        operation = rng.choice(["delete", "insert", "replace", "swap"])
+        if operation == "delete" and len(word) > 3:
+            word = word[:i] + word[i + 1:]
+        elif operation == "insert":
+            word = word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+        elif operation == "swap" and i < len(word) - 1:
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        else:
+            word = word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+    return word
+
+
+def naive_lookup(token: str, words: dict, max_distance: int):
+    best = None
+    for word, count in words.items():
+        distance = edit_distance(token, word, max_distance)
+        if distance <= max_distance and (best is None or (distance, -count, word) < best):
+            best = (distance, -count, word)
+    return best[2] if best else None
+
+
+def timed(function, tokens):
+    started = time.perf_counter()
+    results = [function(token) for token in tokens]
+    return results, (time.perf_counter() - started) / len(tokens) * 1e6
+
+
+def bench(size: int, samples: int, naive_samples: int):
+    rng = random.Random(0)
+    words = build_vocabulary("en")
+    for word in synthetic_words(size - len(words), rng):
+        words.setdefault(word, 1)
+    started = time.perf_counter()
+    index = DeletionIndex(words, max_distance=2)
+    build_seconds = time.perf_counter() - started
+
+    vocabulary = [word for word in words if len(word) >= 5]
+    tokens = [misspell(rng.choice(vocabulary), rng) for _ in range(samples)]
+    indexed, index_us = timed(lambda token: index.lookup(token, 2), tokens)
+    scanned, naive_us = timed(lambda token: naive_lookup(token, words, 2), tokens[:naive_samples])
+    agreement = sum(a == b for a, b in zip(indexed, scanned)) / len(scanned)
+    return {
+        "words": len(index),
+        "build_s": build_seconds,
+        "bytes": index.memory_bytes(),
+        "index_us": index_us,
+        "naive_us": naive_us,
+        "agreement": agreement,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--samples", type=int, default=2000, help="misspelled tokens for the index")
+    parser.add_argument("--naive-samples", type=int, default=50, help="tokens for the (slow) scan")
+    args = parser.parse_args()
+
+    print(f"{'words':>8}{'build s':>9}{'index MB':>10}{'index us':>10}{'scan us':>11}{'speedup':>9}{'agree':>7}")
+    for size in args.words:
+        result = bench(size, args.samples, args.naive_samples)
+        print(f"{result['words']:>8}{result['build_s']:>9.2f}{result['bytes'] / 1e6:>10.1f}"
+              f"{result['index_us']:>10.1f}{result['naive_us']:>11.1f}"
+              f"{result['naive_us'] / result['index_us']:>8.0f}x{result['agreement']:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
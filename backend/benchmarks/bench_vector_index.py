@@ -0,0 +1,70 @@
+"""
+Query latency of the memory-mapped vector index at increasing corpus sizes.
+
+Random unit vectors stand in for document embeddings; each query is the same
+matrix-vector product and top-k selection that VectorIndex.search runs.
+
+Usage:
+    python -m benchmarks.bench_vector_index --rows 10000 100000 1000000 --dimensions 256
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.vector_index import OFFSETS_FILE, VECTORS_FILE, VectorIndex
+
+
+def write_random_index(index_dir: str, rows: int, dimensions: int, chunk: int = 100_000):
+    rng = np.random.default_rng(0)
+    vectors = np.lib.format.open_memmap(
+        os.path.join(index_dir, VECTORS_FILE), mode="w+", dtype=np.float32, shape=(rows, dimensions)
+    )
+    for start in range(0, rows, chunk):
+        block = rng.standard_normal((min(chunk, rows - start), dimensions)).astype(np.float32)
+        vectors[start:start + len(block)] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    vectors.flush()
+    del vectors
+    np.save(os.path.join(index_dir, OFFSETS_FILE), np.zeros(rows, dtype=np.int64))
+
+
+def bench(rows: int, dimensions: int, queries: int, k: int):
+    with tempfile.TemporaryDirectory() as index_dir:
+        write_random_index(index_dir, rows, dimensions)
+        index = VectorIndex(index_dir).load()
+        rng = np.random.default_rng(1)
+        query_vectors = rng.standard_normal((queries, dimensions)).astype(np.float32)
+        query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+        index.search_vector(query_vectors[0], k)  # page the matrix in
+        latencies = []
+        for query_vector in query_vectors:
+            started = time.perf_counter()
+            index.search_vector(query_vector, k)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        return {
+            "p50_ms": latencies[len(latencies) // 2],
+            "p99_ms": latencies[max(int(len(latencies) * 0.99) - 1, 0)],
+            "matrix_mb": rows * dimensions * 4 / 1e6,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        result = bench(rows, args.dimensions, args.queries, args.k)
+        print(f"{rows:>9} rows ({result['matrix_mb']:7.1f} MB): "
+              f"p50 {result['p50_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Chat over the WebSocket channel versus POST /api/chat.
+
+Starts the development server (or uses --url), then sends the same messages
+- over HTTP with a new connection per message, as a client without
+  keep-alive does
+- over HTTP with one keep-alive connection
+- over one WebSocket, one message at a time
+- over one WebSocket with --pipeline messages in flight
+and reports messages/second, plus the cost of opening a connection: an HTTP
+request to /api/health on a fresh connection versus a WebSocket handshake
+including the session greeting. Per-user rate limiting is switched off for
+the started server, since every WebSocket message counts against its session.
+
+Needs the websockets package (also what uvicorn serves WebSockets with).
+
+Usage:
+    python -m benchmarks.bench_websocket --messages 300 --pipeline 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+import websockets
+
+from benchmarks.bench_workers import MESSAGES, wait_until_healthy
+
+
+def start_server(port: int):
+    env = dict(os.environ, PORT=str(port), ADMISSION_USER_RATE="0")
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)]
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def http_messages(base_url: str, total: int, keep_alive: bool) -> float:
+    session = requests.Session() if keep_alive else None
+    started = time.perf_counter()
+    for i in range(total):
+        message, language = MESSAGES[i % len(MESSAGES)]
+        post = session.post if keep_alive else requests.post
+        post(f"{base_url}/api/chat", json={"message": message, "language": language},
+             headers={} if keep_alive else {"Connection": "close"}).raise_for_status()
+    return total / (time.perf_counter() - started)
+
+
+def http_connect_ms(base_url: str, samples: int) -> float:
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        requests.get(f"{base_url}/api/health", headers={"Connection": "close"}).raise_for_status()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+async def ws_connect_ms(ws_url: str, samples: int) -> float:
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        async with websockets.connect(ws_url) as socket:
+            await socket.recv()  # session greeting
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+async def ws_messages(ws_url: str, total: int, pipeline: int) -> float:
+    async with websockets.connect(ws_url) as socket:
+        await socket.recv()
+        started = time.perf_counter()
+        sent = received = 0
+        while received < total:
+            while sent < total and sent - received < pipeline:
+                message, language = MESSAGES[sent % len(MESSAGES)]
+                await socket.send(json.dumps({"id": sent, "message": message, "language": language}))
+                sent += 1
+            answer = json.loads(await socket.recv())
+            if answer["type"] != "answer":
+                raise RuntimeError(f"Message {answer['id']} failed: {answer['error']}")
+            received += 1
+        return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--pipeline", type=int, default=8)
+    parser.add_argument("--connections", type=int, default=50, help="samples for the connection cost")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--url", help="use a running server, e.g. http://127.0.0.1:8000")
+    args = parser.parse_args()
+
+    process = None if args.url else start_server(args.port)
+    base_url = args.url or f"http://127.0.0.1:{args.port}"
+    ws_url = base_url.replace("http", "ws", 1) + "/api/ws/chat"
+    try:
+        wait_until_healthy(base_url)
+        http_messages(base_url, len(MESSAGES), keep_alive=True)  # warm the caches for every mode alike
+        rows = [
+            ("HTTP, connection per message", http_messages(base_url, args.messages, keep_alive=False)),
+            ("HTTP, keep-alive", http_messages(base_url, args.messages, keep_alive=True)),
+            ("WebSocket, sequential", asyncio.run(ws_messages(ws_url, args.messages, 1))),
+            (f"WebSocket, {args.pipeline} pipelined", asyncio.run(ws_messages(ws_url, args.messages, args.pipeline))),
+        ]
+        http_connect = http_connect_ms(base_url, args.connections)
+        ws_connect = asyncio.run(ws_connect_ms(ws_url, args.connections))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    for label, rate in rows:
+        print(f"{label:>30}: {rate:8.1f} messages/s")
+    print(f"{'connection cost':>30}: HTTP request on a new connection {http_connect:.2f} ms, "
+          f"WebSocket handshake + greeting {ws_connect:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Throughput comparison between the single reloading development server and the
+multi-worker production server.
+
+Each mode is started as a subprocess, the script waits for /api/health and
+then sends a fixed number of chat requests from a pool of client threads.
+
+Usage:
+    python -m benchmarks.bench_workers --requests 500 --concurrency 16 --workers 4
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+MESSAGES = [
+    ("What is the speed limit on highways?", "en-US"),
+    ("hello", "en-US"),
+    ("Wie hoch ist die Alkoholgrenze für Fahrer?", "de"),
+    ("Do I need to carry my driving license?", "en-US"),
+]
+
+
+def wait_until_healthy(base_url: str, timeout: float = 120.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/api/health/ready", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {base_url} did not become healthy")
+
+
+def start_server(mode: str, port: int, workers: int):
+    env = dict(os.environ, PORT=str(port), WORKERS=str(workers))
+    if mode == "single":
+        command = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)]
+    else:
+        env["DEBUG"] = "False"
+        command = [sys.executable, "-m", "app.server"]
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def run_load(base_url: str, total: int, concurrency: int):
+    session = requests.Session()
+
+    def send(i):
+        message, language = MESSAGES[i % len(MESSAGES)]
+        started = time.perf_counter()
+        response = session.post(f"{base_url}/api/chat", json={"message": message, "language": language})
+        return time.perf_counter() - started, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, status in results if status != 200)
+    return {
+        "throughput_rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    for mode in ("single", "production"):
+        process = start_server(mode, args.port, args.workers)
+        try:
+            base_url = f"http://127.0.0.1:{args.port}"
+            wait_until_healthy(base_url)
+            result = run_load(base_url, args.requests, args.concurrency)
+        finally:
+            process.terminate()
+            process.wait()
+        label = "single worker" if mode == "single" else f"{args.workers} workers (preloaded)"
+        print(f"{label:>28}: {result['throughput_rps']:8.1f} req/s  "
+              f"p50 {result['p50_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms  errors {result['errors']}")
+
+
+if __name__ == "__main__":
+    main()
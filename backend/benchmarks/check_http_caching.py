@@ -0,0 +1,107 @@
+"""
+Conditional requests against the read-mostly endpoints.
+
+Runs the app in process against a scratch database of the configured
+MongoDB, counting the commands sent to Mongo with a pymongo command
+listener. For /api/categories, GET /api/search and /api/popular-questions it
+- requests the resource and keeps its ETag
+- repeats the request with If-None-Match: expects 304 and, for the corpus
+  derived endpoints, no Mongo command at all
+- ingests a regulation through /api/regulations/bulk and repeats the
+  conditional request: expects 200 with a new ETag
+Exits with status 1 if any check fails. The scratch database is dropped.
+
+Usage:
+    python -m benchmarks.check_http_caching
+"""
+import json
+import os
+import sys
+
+from pymongo import monitoring
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        self.commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# Registered before the app creates its client
+counter = CommandCounter()
+monitoring.register(counter)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database.operations import DatabaseOperations  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services import spelling, vector_index  # noqa: E402
+
+REGULATION = {
+    "category": "speed_limit",
+    "content": "Within built-up areas the speed limit is 50 km/h unless signs say otherwise.",
+    "keywords": ["speed", "limit", "town"],
+    "language": "en-US",
+    "country": settings.default_country,
+    "source": "check_http_caching",
+}
+ENDPOINTS = [
+    ("categories", "/api/categories?language=en-US", True),
+    ("search", "/api/search?query=speed%20limit&language=en-US", True),
+    ("popular-questions", "/api/popular-questions?language=en-US", False),
+]
+
+
+BULK_HEADERS = {"Authorization": "Bearer check_http_caching"}
+
+
+def request(client, path, tag=None):
+    counter.commands.clear()
+    response = client.get(path, headers={"If-None-Match": tag} if tag else {})
+    return response, list(counter.commands)
+
+
+def main():
+    settings.database_name = f"http_caching_check_{os.getpid()}"
+    settings.bulk_load_token = "check_http_caching"
+    db_ops = DatabaseOperations()
+    client = TestClient(app)
+    failures = 0
+    try:
+        client.post("/api/regulations/bulk", content=json.dumps(REGULATION), headers=BULK_HEADERS)
+        # Built by the startup warm-up, which the test client does not run; their versions are part of the search ETag
+        spelling.preload_indexes()
+        vector_index.get_vector_index(settings.default_country, "en-US")
+        print(f"{'endpoint':<19}{'first':>7}{'cmds':>6}{'revalidate':>12}{'cmds':>6}{'after ingest':>14}")
+        for name, path, corpus_derived in ENDPOINTS:
+            first, first_commands = request(client, path)
+            tag = first.headers.get("etag")
+            second, second_commands = request(client, path, tag)
+            client.post("/api/regulations/bulk",
+                        content=json.dumps({**REGULATION, "content": f"{REGULATION['content']} ({name})"}),
+                        headers=BULK_HEADERS)
+            third, _ = request(client, path, tag)
+            print(f"{name:<19}{first.status_code:>7}{len(first_commands):>6}{second.status_code:>12}"
+                  f"{len(second_commands):>6}{third.status_code:>14}")
+            ok = tag and second.status_code == 304 and "cache-control" in second.headers
+            if corpus_derived:
+                ok = ok and not second_commands and third.status_code == 200 and third.headers["etag"] != tag
+            if not ok:
+                failures += 1
+                print(f"  FAILED: ETag {tag}, 304 path ran {second_commands}")
+    finally:
+        db_ops.client.drop_database(settings.database_name)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
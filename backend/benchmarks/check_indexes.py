@@ -0,0 +1,108 @@
+"""
+Collection scan check for the queries of DatabaseOperations.
+
+Creates the indexes of app/database/indexes.py in a scratch database of the
+configured MongoDB, runs every query method of DatabaseOperations on a few
+seeded documents with mongo_collscan_check enabled, so each command they
+send is explained, and lists the plans. Exits with status 1 if a query plans
+to a collection scan or a query method is not exercised here. The scratch
+database is dropped.
+
+Needs a real MongoDB (explain() is not available with mongomock://).
+
+Usage:
+    python -m benchmarks.check_indexes
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.config import settings
+
+# Before the first client is created, so it gets the listener
+settings.mongo_collscan_check = True
+settings.mongo_slow_query_ms = 0
+settings.database_name = f"index_check_{os.getpid()}"
+
+from app.database import slow_queries  # noqa: E402
+from app.database.indexes import reconcile  # noqa: E402
+from app.database.operations import DatabaseOperations  # noqa: E402
+
+REGULATION = {
+    "category": "speed_limit",
+    "content": "Within built-up areas the speed limit is 50 km/h unless signs say otherwise.",
+    "keywords": ["speed", "limit", "town"],
+    "language": "en-US",
+    "country": settings.default_country,
+    "source": "check_indexes",
+}
+# Methods that only insert, which plans do not apply to
+NOT_QUERIES = {"store_chat_message"}
+
+
+def queries(db_ops: DatabaseOperations, since: datetime):
+    """Every query method of DatabaseOperations with representative arguments"""
+    return {
+        "insert_regulation": lambda: db_ops.insert_regulation([REGULATION]),
+        "bulk_upsert_regulations": lambda: db_ops.bulk_upsert_regulations(
+            [UpdateOne({"content_hash": "0" * 64}, {"$setOnInsert": {**REGULATION, "content_hash": "0" * 64}},
+                       upsert=True)]),
+        "bump_corpus_version": db_ops.bump_corpus_version,
+        "get_corpus_version": db_ops.get_corpus_version,
+        "search_regulations": lambda: db_ops.search_regulations(["speed"], "en-US", settings.default_country, 10,
+                                                                terms=["speed"]),
+        "find_regulations_page": lambda: list(db_ops.find_regulations_page(
+            ["speed"], "en-US", settings.default_country, "speed_limit", ObjectId(), 10, ["content"], ["speed"])),
+        "get_regulations": lambda: db_ops.get_regulations("speed_limit", "en-US", settings.default_country),
+        "get_chat_history": lambda: db_ops.get_chat_history("check-user"),
+        "get_categories": lambda: db_ops.get_categories("en-US", settings.default_country),
+        "get_regulation_titles": lambda: db_ops.get_regulation_titles("en-US"),
+        "get_regulation_keywords": lambda: db_ops.get_regulation_keywords("en-US"),
+        "increment_popular_questions": lambda: db_ops.increment_popular_questions(
+            [UpdateOne({"_id": "en-US:1:speed"}, {"$inc": {"count": 1}}, upsert=True)]),
+        "get_popular_question_counts": lambda: db_ops.get_popular_question_counts("en-US", 1, 10),
+        "delete_popular_questions_before": lambda: db_ops.delete_popular_questions_before(0),
+        "increment_tier_stats": lambda: db_ops.increment_tier_stats(
+            [UpdateOne({"_id": "check"}, {"$inc": {"count": 1}}, upsert=True)]),
+        "increment_slow_questions": lambda: db_ops.increment_slow_questions(
+            [UpdateOne({"_id": "check"}, {"$inc": {"count": 1}}, upsert=True)]),
+        "get_tier_stats": lambda: db_ops.get_tier_stats(since, "en"),
+        "get_slow_questions": lambda: db_ops.get_slow_questions(since, "en", 5),
+        "delete_analytics_before": lambda: db_ops.delete_analytics_before(since - timedelta(days=30)),
+    }
+
+
+def main():
+    db_ops = DatabaseOperations()
+    monitor = slow_queries.monitor()
+    if monitor is None:
+        print("The collection scan check needs a MongoDB client with listeners (not mongomock://)")
+        sys.exit(1)
+    failures = 0
+    try:
+        reconcile(db_ops.db)
+        db_ops.store_chat_message({"user_id": "check-user", "message": "hello", "timestamp": datetime.now()})
+        checks = queries(db_ops, datetime.now() - timedelta(hours=24))
+        public = {name for name in vars(DatabaseOperations) if not name.startswith("_")}
+        missing = public - set(checks) - NOT_QUERIES
+        if missing:
+            failures += len(missing)
+            print(f"FAILED: not exercised here, add them to queries(): {', '.join(sorted(missing))}")
+        for name, run in checks.items():
+            seen = len(monitor.explained)
+            run()
+            monitor.wait_for_explains()
+            print(name)
+            for plan in monitor.explained[seen:]:
+                print(f"  {'COLLSCAN' if plan['collscan'] else 'ok':<10}{plan['query']}\n  {'':<10}{plan['plan']}")
+                failures += plan["collscan"]
+    finally:
+        db_ops.client.drop_database(settings.database_name)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
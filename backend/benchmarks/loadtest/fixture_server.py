@@ -0,0 +1,190 @@
+"""
+Local stand-in for the two scraped websites.
+
+Serves the routetogermany.com topic pages (/drivingingermany/...) and the
+gettingaroundgermany.info rules page (/regeln.shtml) from one HTTP server,
+with injectable latency and error rate. Pages are generated synthetically
+unless a directory of recorded pages is given (one file per URL path, e.g.
+``<dir>/drivingingermany/parking``); --record DIR fetches the live pages into
+such a directory, so load tests and replays can run offline against real
+content.
+
+Point the app at it with:
+    ROUTE_TO_GERMANY_URL=http://127.0.0.1:8765
+    GETTING_AROUND_GERMANY_URL=http://127.0.0.1:8765
+
+Usage:
+    python -m benchmarks.loadtest.fixture_server --port 8765 --latency-ms 150 --jitter-ms 50
+    python -m benchmarks.loadtest.fixture_server --record fixtures/
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlparse
+
+ROUTE_TOPICS = {
+    "/drivingingermany/city-driving": "The normal speed limit in cities and towns is 50 km/h unless signs show otherwise. "
+                                      "In residential zones the speed limit is often 30 km/h. Seat belts are mandatory for all occupants.",
+    "/drivingingermany/autobahn": "There is no general speed limit on large parts of the Autobahn, but the recommended speed is 130 km/h. "
+                                  "Overtaking on the right is prohibited and slow vehicles must keep right.",
+    "/drivingingermany/parking": "Parking is prohibited within 5 metres of intersections and in front of driveways. "
+                                 "Use a parking disc where signs require it and observe the maximum parking time.",
+    "/drivingingermany/right-of-way": "At intersections without signs the rule right before left applies. "
+                                      "Vehicles on a priority road marked by a yellow diamond sign have the right of way.",
+    "/drivingingermany/road-signs-germany": "Road signs in Germany are divided into warning signs, regulatory signs and direction signs. "
+                                            "A round sign with a red border is a prohibition sign that must be obeyed.",
+    "/drivingingermany/fines-on-violations": "The blood alcohol limit is 0.5 per mille; novice drivers must not drink at all. "
+                                             "Exceeding the speed limit by 21 km/h in town costs a fine of 115 euros and one point.",
+    "/drivingingermany/driving-license": "A foreign driving licence is valid for six months after taking up residence in Germany. "
+                                         "Afterwards it has to be converted into a German driving licence.",
+    "/drivingingermany/accident": "After an accident secure the scene, switch on the hazard lights and set up the warning triangle. "
+                                  "Call 112 if anyone is injured and exchange insurance details.",
+    "/drivingingermany/insurance": "Third-party liability insurance is mandatory for every registered vehicle in Germany. "
+                                   "Comprehensive insurance is optional but recommended for new cars.",
+    "/drivingingermany/tires-regulations": "Winter tires are required in wintry road conditions such as black ice, snow or slush. "
+                                           "The minimum tread depth is 1.6 mm for all tires.",
+    "/drivingingermany/environmental-zone-germany": "Many cities have environmental zones that may only be entered with a green emissions sticker. "
+                                                    "Driving into a zone without the sticker costs a fine of 100 euros.",
+    "/drivingingermany/performance-tuning": "Modifications that affect performance or emissions must be approved by an inspection body. "
+                                            "Unapproved tuning invalidates the vehicle registration.",
+}
+
+GETTING_AROUND_SECTIONS = [
+    ("Licensing", "Visitors may drive with a valid foreign licence for up to six months. An international permit is recommended."),
+    ("Speed limits", "The speed limit is 50 km/h in built-up areas and 100 km/h outside built-up areas for cars."),
+    ("Autobahn traffic regulations", "On the Autobahn the recommended speed is 130 km/h. Stopping on the Autobahn is prohibited."),
+    ("Parking regulations", "Parking is not allowed on the left side of the road except on one-way streets."),
+    ("Right-of-way", "Unless otherwise indicated, traffic from the right has the right of way at intersections."),
+    ("Drinking and driving", "The legal limit is 0.05 percent blood alcohol content; penalties include fines and licence suspension."),
+    ("Accidents", "Drivers involved in an accident must stop and remain at the scene until details are exchanged."),
+    ("General laws and enforcement", "Seat belts are required for all occupants and fines are collected on the spot."),
+    ("Bicycle lanes, streets, and zones", "Bicycle streets are reserved for cyclists; cars may only enter when signs allow it."),
+    ("Urban traffic regulations", "In towns, trams have priority and must not be passed on the left where passengers board."),
+    ("Traffic calming zones", "In traffic calming zones vehicles must drive at walking speed and pedestrians may use the full street."),
+    ("Passing/overtaking", "Passing on the right is prohibited on highways except in slow-moving traffic jams."),
+    ("Additional prohibitions", "Using a mobile phone held in the hand while driving is prohibited and fined."),
+]
+
+
+def route_page(path: str) -> Optional[str]:
+    text = ROUTE_TOPICS.get(path)
+    if text is None:
+        return None
+    paragraphs = "".join(f"<p>{sentence.strip()}.</p>" for sentence in text.split(". ") if sentence.strip())
+    return f"<html><body><nav>Home</nav><h1>{path.rsplit('/', 1)[-1]}</h1><p>{text}</p>{paragraphs}</body></html>"
+
+
+def getting_around_page() -> str:
+    body = "".join(
+        f"<h2>{title}</h2><p>{text} This paragraph is part of the local fixture for load tests.</p>"
+        for title, text in GETTING_AROUND_SECTIONS
+    )
+    return f"<html><body>{body}</body></html>"
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, fixtures_dir: Optional[str] = None):
+        super().__init__(address, FixtureHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.fixtures_dir = fixtures_dir
+        self.requests_served = 0
+        self._lock = threading.Lock()
+
+    def page(self, path: str) -> Optional[str]:
+        if self.fixtures_dir:
+            file_path = os.path.join(self.fixtures_dir, path.lstrip("/") or "index.html")
+            if os.path.isfile(file_path):
+                with open(file_path, encoding="utf-8") as f:
+                    return f.read()
+            return None
+        if path == "/regeln.shtml":
+            return getting_around_page()
+        return route_page(path)
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server: FixtureServer = self.server
+        with server._lock:
+            server.requests_served += 1
+        delay = server.latency_ms + random.uniform(-server.jitter_ms, server.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if random.random() < server.error_rate:
+            self.send_error(503, "Injected failure")
+            return
+        page = server.page(self.path.split("?", 1)[0])
+        if page is None:
+            self.send_error(404)
+            return
+        body = page.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep load test output readable
+
+
+def start_fixture_server(port: int = 0, **options) -> FixtureServer:
+    """Start the server on a background thread; port 0 picks a free port"""
+    server = FixtureServer(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def record_pages(fixtures_dir: str) -> int:
+    """Fetch every source page of the scrapers into fixtures_dir; returns the number recorded"""
+    from app.services.web_scraper import WebSearchService
+
+    service = WebSearchService()
+    recorded = 0
+    for page in service.source_pages():
+        html = service.fetch_page(page)
+        if html is None:
+            print(f"Could not fetch {page['url']}")
+            continue
+        file_path = os.path.join(fixtures_dir, urlparse(page["url"]).path.lstrip("/") or "index.html")
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(html)
+        recorded += 1
+    return recorded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--fixtures-dir", help="serve recorded pages from this directory")
+    parser.add_argument("--record", metavar="DIR", help="record the live source pages into DIR and exit")
+    args = parser.parse_args()
+
+    if args.record:
+        print(f"Recorded {record_pages(args.record)} pages into {args.record}")
+        return
+
+    server = FixtureServer(("127.0.0.1", args.port), args.latency_ms, args.jitter_ms,
+                           args.error_rate, args.fixtures_dir)
+    print(f"Fixture server listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
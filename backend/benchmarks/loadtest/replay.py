@@ -0,0 +1,361 @@
+"""
+Replay a captured question log against two builds and diff the answers.
+
+Every question of the log is sent to POST /api/chat of a baseline and a
+candidate build, one after the other (alternating which goes first). The
+answers are compared on tier, intent and response text, and the latencies
+of both builds are reported side by side, overall and per tier. An answer
+counts as a regression when the candidate's tier ranks lower (TIER_RANKS:
+fallback < offline < cache < web/db/db_search) or, on the same tier, its
+confidence dropped; the reverse is an improvement.
+
+Offline by default: the builds are started from their checkout directories
+(e.g. ``git worktree add ../baseline main``), each against its own
+in-memory Mongo stand-in seeded with the same regulations, with both
+websites served by the fixture server, from recorded pages if
+--fixtures-dir is given (record them with ``fixture_server --record DIR``).
+--baseline-url/--candidate-url compare builds that are already running
+instead.
+
+Memory stays bounded on logs of millions of questions: the log is streamed,
+requests in flight are capped, latencies go into fixed log-scale histograms
+and differing answers are streamed to --diffs instead of kept.
+
+The log is NDJSON with "message" or "question" and optionally "language"
+per line (the analytics logs of app/services/analytics.py qualify), or plain
+text with one question per line; .gz is supported. Exits with status 1 when
+regressions exceed --max-regressions or the candidate's p95 latency exceeds
+the baseline's by more than --latency-tolerance.
+
+Usage:
+    python -m benchmarks.loadtest.replay data/analytics/events-*.ndjson \\
+        --baseline ../baseline/backend --candidate . --fixtures-dir fixtures/ --diffs diffs.ndjson
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+import requests
+
+from app.data.bulk_loader import open_input
+from benchmarks.loadtest.fixture_server import start_fixture_server
+from benchmarks.loadtest.run import BULK_LOAD_TOKEN, SEED_REGULATIONS, wait_until_ready
+
+BUILDS = ("baseline", "candidate")
+TIER_RANKS = {"fallback": 0, "offline": 1, "cache": 2, "web": 3, "db": 3, "db_search": 3}
+# Latency histogram: buckets growing by 5% from 0.1 ms
+HISTOGRAM_START_MS = 0.1
+HISTOGRAM_GROWTH = 1.05
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts: Dict[int, int] = defaultdict(int)
+        self.total = 0
+
+    def add(self, ms: float):
+        self.counts[max(0, int(math.log(max(ms, HISTOGRAM_START_MS) / HISTOGRAM_START_MS, HISTOGRAM_GROWTH)))] += 1
+        self.total += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the percentile, within 5%"""
+        if not self.total:
+            return 0.0
+        rank = fraction * self.total
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return HISTOGRAM_START_MS * HISTOGRAM_GROWTH ** (bucket + 1)
+        return 0.0
+
+
+class Comparison:
+    def __init__(self, diffs_path: Optional[str], examples: int):
+        self.latency = {build: LatencyHistogram() for build in BUILDS}
+        self.tier_latency = {build: defaultdict(LatencyHistogram) for build in BUILDS}
+        self.tiers = {build: Counter() for build in BUILDS}
+        self.errors = Counter()
+        self.outcomes = Counter()
+        self.transitions = Counter()
+        self.examples = []
+        self.max_examples = examples
+        self.questions = 0
+        self._diffs = open(diffs_path, "w", encoding="utf-8") if diffs_path else None
+        self._lock = threading.Lock()
+
+    def add(self, question: str, language: str, answers: Dict[str, Tuple[Optional[Dict], float]]):
+        with self._lock:
+            self.questions += 1
+            for build, (answer, ms) in answers.items():
+                tier = (answer.get("tier") or "unknown") if answer else "error"
+                self.tiers[build][tier] += 1
+                self.latency[build].add(ms)
+                self.tier_latency[build][tier].add(ms)
+                if answer is None:
+                    self.errors[build] += 1
+            baseline, candidate = answers["baseline"][0], answers["candidate"][0]
+            if baseline is None or candidate is None:
+                self.outcomes["error"] += 1
+                return
+            changes = [field for field in ("tier", "intent", "response") if baseline.get(field) != candidate.get(field)]
+            verdict = self._verdict(baseline, candidate)
+            self.outcomes["same" if not changes else "changed"] += 1
+            for field in changes:
+                self.outcomes[f"{field}_changed"] += 1
+            if verdict:
+                self.outcomes[verdict] += 1
+            if baseline.get("tier") != candidate.get("tier"):
+                self.transitions[(baseline.get("tier"), candidate.get("tier"))] += 1
+            if changes:
+                diff = {"question": question, "language": language, "verdict": verdict, "changed": changes,
+                        **{build: {field: answers[build][0].get(field)
+                                   for field in ("tier", "intent", "confidence", "response")}
+                           for build in BUILDS}}
+                if self._diffs:
+                    self._diffs.write(json.dumps(diff, ensure_ascii=False) + "\n")
+                if verdict == "regression" and len(self.examples) < self.max_examples:
+                    self.examples.append(diff)
+
+    def _verdict(self, baseline: Dict, candidate: Dict) -> Optional[str]:
+        before = TIER_RANKS.get(baseline.get("tier"), 0)
+        after = TIER_RANKS.get(candidate.get("tier"), 0)
+        if after != before:
+            return "regression" if after < before else "improvement"
+        if baseline.get("tier") == candidate.get("tier"):
+            confidence_change = candidate.get("confidence", 0) - baseline.get("confidence", 0)
+            if abs(confidence_change) > 1e-9:
+                return "regression" if confidence_change < 0 else "improvement"
+        return None
+
+    def close(self):
+        if self._diffs:
+            self._diffs.close()
+
+    def report(self) -> Dict:
+        def latency(histogram):
+            return {"requests": histogram.total, **{f"p{int(q * 100)}_ms": round(histogram.percentile(q), 1)
+                                                    for q in (0.5, 0.95, 0.99)}}
+
+        return {
+            "questions": self.questions,
+            "outcomes": dict(self.outcomes),
+            "latency": {build: latency(self.latency[build]) for build in BUILDS},
+            "tiers": {build: dict(self.tiers[build]) for build in BUILDS},
+            "tier_latency": {build: {tier: latency(histogram) for tier, histogram in self.tier_latency[build].items()}
+                             for build in BUILDS},
+            "tier_transitions": [{"from": before, "to": after, "count": count}
+                                 for (before, after), count in self.transitions.most_common()],
+            "errors": dict(self.errors),
+            "regression_examples": self.examples,
+        }
+
+
+def iter_questions(paths, default_language: str, limit: Optional[int]) -> Iterator[Tuple[str, str]]:
+    count = 0
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            with open_input(path) as stream:
+                for raw in stream:
+                    line = raw.decode("utf-8").strip()
+                    if not line:
+                        continue
+                    if line.startswith("{"):
+                        event = json.loads(line)
+                        question = event.get("message") or event.get("question")
+                        language = event.get("language") or default_language
+                    else:
+                        question, language = line, default_language
+                    if not question:
+                        continue
+                    yield question, language
+                    count += 1
+                    if limit and count >= limit:
+                        return
+
+
+def ask(session: requests.Session, base_url: str, question: str, language: str) -> Tuple[Optional[Dict], float]:
+    started = time.perf_counter()
+    try:
+        response = session.post(f"{base_url}/api/chat", json={"message": question, "language": language}, timeout=60)
+        answer = response.json() if response.status_code == 200 else None
+    except (requests.RequestException, ValueError):
+        answer = None
+    return answer, (time.perf_counter() - started) * 1000
+
+
+def replay(urls: Dict[str, str], questions: Iterator[Tuple[str, str]], comparison: Comparison, concurrency: int,
+           progress_every: int = 10000):
+    local = threading.local()
+    slots = threading.BoundedSemaphore(concurrency * 2)
+
+    def task(index: int, question: str, language: str):
+        try:
+            if not hasattr(local, "session"):
+                local.session = requests.Session()
+            # Alternate the order so neither build always sees the warmer caches
+            order = BUILDS if index % 2 == 0 else BUILDS[::-1]
+            answers = {build: ask(local.session, urls[build], question, language) for build in order}
+            comparison.add(question, language, answers)
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index, (question, language) in enumerate(questions):
+            slots.acquire()
+            pool.submit(task, index, question, language)
+            if progress_every and index and index % progress_every == 0:
+                print(f"  {index} questions replayed", file=sys.stderr)
+
+
+def start_build(directory: str, port: int, fixture_url: str, scratch_dir: str):
+    """Start a build from its checkout (the directory holding app/) on the in-memory Mongo stand-in"""
+    if not os.path.isdir(os.path.join(directory, "app")) and os.path.isdir(os.path.join(directory, "backend", "app")):
+        directory = os.path.join(directory, "backend")
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        MONGODB_URI="mongomock://replay",
+        ROUTE_TO_GERMANY_URL=fixture_url,
+        GETTING_AROUND_GERMANY_URL=fixture_url,
+        # Compare the answers, not admission control or caches left by earlier runs
+        ADMISSION_USER_RATE="0",
+        ADMISSION_MAX_IN_FLIGHT="100000",
+        ADMISSION_DEGRADE_IN_FLIGHT="100000",
+        SHARED_CACHE_PATH=os.path.join(scratch_dir, f"cache-{port}.sqlite3"),
+        ANALYTICS_ENABLED="False",
+        BULK_LOAD_TOKEN=BULK_LOAD_TOKEN,
+        BULK_LOAD_MAX_MB="100000",  # --regulations may be large
+        PYTHONPATH=directory,
+    )
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"]
+    return subprocess.Popen(command, cwd=directory, env=env)
+
+
+def print_report(report: Dict):
+    print(f"\nQuestions: {report['questions']}")
+    print(f"\n{'latency':<24}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        before, after = report["latency"]["baseline"][key], report["latency"]["candidate"][key]
+        change = f"{(after - before) / before:+.0%}" if before else ""
+        print(f"{key:<24}{before:>12}{after:>12}{change:>10}")
+    print(f"{'errors':<24}{report['errors'].get('baseline', 0):>12}{report['errors'].get('candidate', 0):>12}")
+
+    print(f"\n{'tier (answers, p95 ms)':<24}{'baseline':>18}{'candidate':>18}")
+    tiers = sorted(set(report["tiers"]["baseline"]) | set(report["tiers"]["candidate"]))
+    for tier in tiers:
+        cells = []
+        for build in BUILDS:
+            count = report["tiers"][build].get(tier, 0)
+            p95 = report["tier_latency"][build].get(tier, {}).get("p95_ms", 0)
+            cells.append(f"{count} / {p95:.0f}")
+        print(f"{tier:<24}{cells[0]:>18}{cells[1]:>18}")
+
+    outcomes = report["outcomes"]
+    total = report["questions"] or 1
+    print("\nanswers")
+    for key in ("same", "changed", "tier_changed", "intent_changed", "response_changed", "regression",
+                "improvement", "error"):
+        print(f"  {key:<22}{outcomes.get(key, 0):>10}{outcomes.get(key, 0) / total:>8.1%}")
+    if report["tier_transitions"]:
+        print("\ntier changes")
+        for row in report["tier_transitions"][:10]:
+            print(f"  {row['from']} -> {row['to']}: {row['count']}")
+    for example in report["regression_examples"]:
+        print(f"\nregression: {example['question']!r} ({example['language']})")
+        for build in BUILDS:
+            answer = example[build]
+            print(f"  {build:<10} {answer['tier']}/{answer['intent']} {answer['confidence']}: "
+                  f"{(answer['response'] or '')[:100]!r}")
+
+
+def seed(build: str, base_url: str, body):
+    """Load the regulations into a started build; comparing against an empty database would be meaningless"""
+    try:
+        response = requests.post(f"{base_url}/api/regulations/bulk", data=body, timeout=300,
+                                 headers={"Authorization": f"Bearer {BULK_LOAD_TOKEN}"})
+        response.raise_for_status()
+    except requests.RequestException as e:
+        raise SystemExit(f"Could not seed the {build} build at {base_url}: {e}. Builds without "
+                         f"/api/regulations/bulk or its token cannot be compared on the seed data.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="question logs (NDJSON or text, .gz supported, globs allowed)")
+    parser.add_argument("--baseline", help="checkout directory of the baseline build")
+    parser.add_argument("--candidate", help="checkout directory of the candidate build")
+    parser.add_argument("--baseline-url", help="running baseline instead of --baseline")
+    parser.add_argument("--candidate-url", help="running candidate instead of --candidate")
+    parser.add_argument("--fixtures-dir", help="recorded pages for the fixture server (default: synthetic pages)")
+    parser.add_argument("--regulations", help="NDJSON/JSON regulations to seed both builds with")
+    parser.add_argument("--language", default="en-US", help="language of questions without one")
+    parser.add_argument("--limit", type=int, help="replay at most this many questions")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--diffs", help="write every differing answer to this NDJSON file")
+    parser.add_argument("--examples", type=int, default=5, help="regressions to print")
+    parser.add_argument("--max-regressions", type=float, default=0.01, help="tolerated share of regressions")
+    parser.add_argument("--latency-tolerance", type=float, default=0.2, help="tolerated p95 increase")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    processes = []
+    urls = {"baseline": args.baseline_url, "candidate": args.candidate_url}
+    scratch = tempfile.TemporaryDirectory(prefix="replay-")
+    if not (urls["baseline"] and urls["candidate"]):
+        fixtures = start_fixture_server(fixtures_dir=args.fixtures_dir)
+        fixture_url = f"http://127.0.0.1:{fixtures.server_address[1]}"
+        for port, build in zip((8301, 8302), BUILDS):
+            if urls[build]:
+                continue
+            directory = getattr(args, build)
+            if not directory:
+                parser.error(f"--{build} or --{build}-url is required")
+            processes.append(start_build(directory, port, fixture_url, scratch.name))
+            urls[build] = f"http://127.0.0.1:{port}"
+
+    comparison = Comparison(args.diffs, args.examples)
+    try:
+        regulations = SEED_REGULATIONS
+        if args.regulations:
+            with open_input(args.regulations) as stream:
+                regulations = stream.read()
+        for build in BUILDS:
+            wait_until_ready(urls[build])
+            if processes:
+                body = regulations if isinstance(regulations, bytes) else json.dumps(regulations)
+                seed(build, urls[build], body)
+        replay(urls, iter_questions(args.logs, args.language, args.limit), comparison, args.concurrency)
+    finally:
+        comparison.close()
+        for process in processes:
+            process.terminate()
+            process.wait()
+        scratch.cleanup()
+
+    report = comparison.report()
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = report["outcomes"].get("regression", 0) / (report["questions"] or 1)
+    before, after = report["latency"]["baseline"]["p95_ms"], report["latency"]["candidate"]["p95_ms"]
+    slower = before and after > before * (1 + args.latency_tolerance)
+    if regressions > args.max_regressions or slower:
+        print(f"\nFAILED: {regressions:.1%} regressions, p95 {before} -> {after} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Load-testing harness for the chat and search API.
+
+Replays a weighted question mix (popular questions, paraphrases, search-style
+queries and chit-chat in English and German, see questions.json) against a
+running app, either closed-loop at a fixed concurrency or open-loop at a
+target request rate. Reports throughput and p50/p95/p99 latency per endpoint
+and per answer tier.
+
+With --start-app the harness also starts everything locally: the fixture
+server standing in for the two websites (with injectable latency), and the
+app itself pointed at it and at an in-memory Mongo stand-in (mongomock://,
+requires the mongomock package; use --mongodb-uri with a local mongod for
+multi-worker runs, since every worker gets its own in-memory database).
+
+Usage:
+    python -m benchmarks.loadtest.run --start-app --concurrency 16 --duration 30
+    python -m benchmarks.loadtest.run --base-url http://127.0.0.1:8000 --rate 50 --duration 60
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+from benchmarks.loadtest.fixture_server import start_fixture_server
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(__file__), "questions.json")
+# Enables /api/regulations/bulk on the apps started here, to seed them
+BULK_LOAD_TOKEN = "loadtest"
+
+SEED_REGULATIONS = [
+    {"category": "speed_limit", "country": "germany", "language": ["en-US", "en-GB"],
+     "content": "The speed limit in urban areas is 50 km/h.", "keywords": ["speed", "urban", "limit"], "source": "StVO §3"},
+    {"category": "alcohol_limit", "country": "germany", "language": "en-US",
+     "content": "The legal alcohol limit for drivers is 0.5‰.", "keywords": ["alcohol", "limit", "drivers"], "source": "StVO §24a"},
+    {"category": "parking", "country": "germany", "language": "en-US",
+     "content": "Parking within 5 metres of an intersection is prohibited.", "keywords": ["parking", "park"], "source": "StVO §12"},
+    {"category": "speed_limit", "country": "germany", "language": "de",
+     "content": "Innerorts gilt eine Höchstgeschwindigkeit von 50 km/h.", "keywords": ["geschwindigkeit", "limit", "innerorts"], "source": "StVO §3"},
+    {"category": "alcohol_limit", "country": "germany", "language": "de",
+     "content": "Die Promillegrenze für Fahrer liegt bei 0,5 Promille.", "keywords": ["alkohol", "promille"], "source": "StVO §24a"},
+]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class QuestionMix:
+    def __init__(self, path: str, seed: int = 0):
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        self.rng = random.Random(seed)
+        self.kinds = list(config["mix"].items())
+        self.languages = list(config["languages"].items())
+        self.questions = config["questions"]
+        self.search_share = config.get("search_share", 0.0)
+        self._lock = threading.Lock()
+
+    def _pick(self, weighted):
+        return self.rng.choices([name for name, _ in weighted], [weight for _, weight in weighted])[0]
+
+    def next_request(self) -> Dict:
+        with self._lock:
+            language = self._pick(self.languages)
+            kind = self._pick(self.kinds)
+            candidates = self.questions[kind].get(language) or self.questions[kind]["en-US"]
+            message = self.rng.choice(candidates)
+            use_search = self.rng.random() < self.search_share
+        if use_search:
+            return {"endpoint": "/api/search", "kind": kind,
+                    "payload": {"query": message, "language": language, "limit": 10}}
+        return {"endpoint": "/api/chat", "kind": kind,
+                "payload": {"message": message, "language": language}}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # (group, name) -> seconds
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, tier: str, latency: float, ok: bool):
+        with self._lock:
+            self.latencies[("endpoint", endpoint)].append(latency)
+            if tier:
+                self.latencies[("tier", tier)].append(latency)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self, elapsed: float) -> Dict:
+        report = {"elapsed_seconds": round(elapsed, 2), "endpoints": {}, "tiers": {}}
+        for (group, name), values in sorted(self.latencies.items()):
+            values = sorted(values)
+            report["endpoints" if group == "endpoint" else "tiers"][name] = {
+                "requests": len(values),
+                "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+                "errors": self.errors.get(name, 0) if group == "endpoint" else None,
+            }
+        return report
+
+
+def send(session: requests.Session, base_url: str, request: Dict, recorder: Recorder, intended_start: float):
+    """Send one request; latency is measured from the intended start to avoid coordinated omission"""
+    tier, ok = None, False
+    try:
+        response = session.post(base_url + request["endpoint"], json=request["payload"], timeout=60)
+        ok = response.status_code == 200
+        if ok and request["endpoint"] == "/api/chat":
+            tier = response.json().get("tier") or "unknown"
+        elif ok:
+            tier = "search"
+        else:
+            tier = f"http_{response.status_code}"
+    except requests.RequestException:
+        tier = "connection_error"
+    recorder.record(request["endpoint"], tier, time.perf_counter() - intended_start, ok)
+
+
+def run_closed_loop(base_url: str, mix: QuestionMix, recorder: Recorder, concurrency: int, duration: float):
+    deadline = time.perf_counter() + duration
+
+    def client():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            send(session, base_url, mix.next_request(), recorder, time.perf_counter())
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_open_loop(base_url: str, mix: QuestionMix, recorder: Recorder, rate: float, duration: float,
+                  max_in_flight: int):
+    local = threading.local()
+
+    def task(request, intended_start):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        send(local.session, base_url, request, recorder, intended_start)
+
+    started = time.perf_counter()
+    interval = 1.0 / rate
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        sent = 0
+        while True:
+            intended_start = started + sent * interval
+            if intended_start - started >= duration:
+                break
+            delay = intended_start - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(task, mix.next_request(), intended_start)
+            sent += 1
+
+
+def start_app(port: int, fixture_url: str, mongodb_uri: str, workers: int):
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        WORKERS=str(workers),
+        MONGODB_URI=mongodb_uri,
+        ROUTE_TO_GERMANY_URL=fixture_url,
+        GETTING_AROUND_GERMANY_URL=fixture_url,
+        BULK_LOAD_TOKEN=BULK_LOAD_TOKEN,
+    )
+    if workers > 1:
+        env["DEBUG"] = "False"
+        command = [sys.executable, "-m", "app.server"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"]
+    return subprocess.Popen(command, env=env)
+
+
+def wait_until_ready(base_url: str, timeout: float = 180.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/api/health/ready", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"App at {base_url} did not become ready")
+
+
+def print_report(report: Dict):
+    print(f"\nDuration: {report['elapsed_seconds']} s")
+    for group in ("endpoints", "tiers"):
+        print(f"\n{'by ' + group[:-1]:<22}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for name, row in report[group].items():
+            errors = "" if row["errors"] is None else row["errors"]
+            print(f"{name:<22}{row['requests']:>10}{row['throughput_rps']:>10}{row['p50_ms']:>10}"
+                  f"{row['p95_ms']:>10}{row['p99_ms']:>10}{errors:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--start-app", action="store_true", help="start fixture server and app locally")
+    parser.add_argument("--port", type=int, default=8200, help="app port with --start-app")
+    parser.add_argument("--workers", type=int, default=1, help="app workers with --start-app")
+    parser.add_argument("--mongodb-uri", default="mongomock://local", help="Mongo used with --start-app")
+    parser.add_argument("--fixture-latency-ms", type=float, default=100.0)
+    parser.add_argument("--fixture-jitter-ms", type=float, default=30.0)
+    parser.add_argument("--fixture-error-rate", type=float, default=0.0)
+    parser.add_argument("--questions", default=QUESTIONS_FILE)
+    parser.add_argument("--concurrency", type=int, default=8, help="closed-loop clients")
+    parser.add_argument("--rate", type=float, help="open-loop target requests/second (overrides --concurrency)")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="open-loop client threads")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    app_process = None
+    base_url = args.base_url
+    if args.start_app:
+        fixtures = start_fixture_server(latency_ms=args.fixture_latency_ms, jitter_ms=args.fixture_jitter_ms,
+                                        error_rate=args.fixture_error_rate)
+        fixture_url = f"http://127.0.0.1:{fixtures.server_address[1]}"
+        app_process = start_app(args.port, fixture_url, args.mongodb_uri, args.workers)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        wait_until_ready(base_url)
+        if args.start_app:
+            requests.post(f"{base_url}/api/regulations/bulk", data=json.dumps(SEED_REGULATIONS), timeout=30,
+                          headers={"Authorization": f"Bearer {BULK_LOAD_TOKEN}"})
+
+        mix = QuestionMix(args.questions, args.seed)
+        recorder = Recorder()
+        started = time.perf_counter()
+        if args.rate:
+            run_open_loop(base_url, mix, recorder, args.rate, args.duration, args.max_in_flight)
+        else:
+            run_closed_loop(base_url, mix, recorder, args.concurrency, args.duration)
+        report = recorder.report(time.perf_counter() - started)
+    finally:
+        if app_process:
+            app_process.terminate()
+            app_process.wait()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
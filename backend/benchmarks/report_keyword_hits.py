@@ -0,0 +1,112 @@
+"""
+DB-tier hit rate of surface-form keywords versus lemma/compound terms.
+
+For every question of an English and a German corpus, checks whether the
+keyword query of the database tier matches at least one regulation of the
+language:
+- before: lowercased surface tokens against the regulation keywords
+- after: lemmas against the keywords, or normalised terms (stems and
+  German compound parts, app/services/terms.py) against the regulation terms
+Regulations come from MongoDB, or from an NDJSON/JSON file; their terms are
+computed here, so the report works before the backfill has run.
+
+Usage:
+    python -m benchmarks.report_keyword_hits
+    python -m benchmarks.report_keyword_hits --regulations regulations.ndjson --blank
+"""
+import argparse
+import json
+import os
+
+import app.nlp.processor as processor
+from app.data.bulk_loader import iter_file_chunks, iter_json_documents, open_input
+from app.services import terms
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(__file__), "loadtest", "questions.json")
+
+# Inflected forms and compounds the surface keywords miss
+EXTRA_QUESTIONS = {
+    "en-US": [
+        "What are the speed limits in towns?",
+        "Are there limits for drinking before driving?",
+        "Which penalties apply for speeding?",
+        "Rules for seatbelts in the back seats",
+        "Where are parking spaces allowed?",
+        "Do highways have minimum speeds?",
+    ],
+    "de": [
+        "Wo darf man auf Parkplätzen parken?",
+        "Welche Geschwindigkeitsbegrenzungen gelten innerorts?",
+        "Gibt es eine Promillegrenze für Fahranfänger?",
+        "Wann muss ich den Sicherheitsgurt anlegen?",
+        "Welche Kindersitze sind vorgeschrieben?",
+        "Ist das Handyverbot auch an Ampeln gültig?",
+        "Was bedeuten die Verkehrszeichen an Autobahnen?",
+    ],
+}
+
+
+def load_questions():
+    with open(QUESTIONS_FILE, encoding="utf-8") as f:
+        groups = json.load(f)["questions"]
+    questions = {language: list(extra) for language, extra in EXTRA_QUESTIONS.items()}
+    for group in ("popular", "paraphrase", "search"):
+        for language, items in groups.get(group, {}).items():
+            questions.setdefault(language, []).extend(items)
+    return questions
+
+
+def load_regulations(path):
+    if path:
+        with open_input(path) as stream:
+            return list(iter_json_documents(iter_file_chunks(stream)))
+    from app.database.operations import DatabaseOperations
+    return list(DatabaseOperations().db.regulations.find({}, {"keywords": 1, "title": 1, "category": 1,
+                                                              "language": 1}))
+
+
+def regulation_languages(regulation):
+    language = regulation.get("language") or ""
+    return " ".join(language) if isinstance(language, list) else language
+
+
+def report(questions, regulations):
+    nlp = processor.LanguageProcessor()
+    regulation_terms = terms.document_terms(regulations)
+    rows = []
+    for language, items in questions.items():
+        lang = language.split("-")[0]
+        candidates = [(set(regulation.get("keywords", [])), set(document_terms))
+                      for regulation, document_terms in zip(regulations, regulation_terms)
+                      if lang in regulation_languages(regulation)]
+        before = after = 0
+        for question in items:
+            surface = {token.text.lower() for token in nlp.nlp[lang](question) if token.is_alpha}
+            lemmas = set(nlp.extract_keywords(question, lang))
+            query_terms = set(terms.query_terms(list(lemmas), language))
+            before += any(surface & keywords for keywords, _ in candidates)
+            after += any(lemmas & keywords or query_terms & doc_terms for keywords, doc_terms in candidates)
+        rows.append((language, len(items), len(candidates), before, after))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--regulations", help="NDJSON/JSON file instead of MongoDB")
+    parser.add_argument("--blank", action="store_true", help="blank spaCy pipelines (no lemmas)")
+    args = parser.parse_args()
+
+    if args.blank:
+        processor.MODEL_NAMES = {language: f"blank:{language}" for language in processor.MODEL_NAMES}
+    regulations = load_regulations(args.regulations)
+    if not regulations:
+        raise SystemExit("No regulations found")
+
+    print(f"{'language':>9}{'questions':>11}{'regulations':>13}{'before':>9}{'after':>9}{'change':>9}")
+    for language, count, regulation_count, before, after in report(load_questions(), regulations):
+        print(f"{language:>9}{count:>11}{regulation_count:>13}{before / count:>9.0%}{after / count:>9.0%}"
+              f"{(after - before) / count:>+9.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Startup import-time benchmark.
+
+Runs ``python -X importtime -c "import app.main"`` in a fresh interpreter,
+reports the total import time and the slowest top-level packages, and fails
+when a budget is exceeded or a heavy dependency is imported eagerly.
+
+Usage:
+    python -m benchmarks.startup_importtime --budget-ms 1500 --output importtime.json
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+# These must only be imported on first use (see app/startup.py)
+LAZY_MODULES = ["torch", "spacy", "bs4"]
+
+LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str = "app.main"):
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr)
+
+    # Cumulative microseconds of every top-level import, grouped by package
+    packages = defaultdict(int)
+    imported = set()
+    for line in completed.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), match.group(3), match.group(4)
+        imported.add(name.split(".")[0])
+        if len(indent) == 1:  # top-level import of the measured statement
+            packages[name.split(".")[0]] += cumulative
+
+    total_us = sum(packages.values())
+    return {
+        "module": module,
+        "total_ms": round(total_us / 1000, 1),
+        "top_packages_ms": {
+            name: round(us / 1000, 1)
+            for name, us in sorted(packages.items(), key=lambda item: -item[1])[:15]
+        },
+        "eager_heavy_imports": [name for name in LAZY_MODULES if name in imported],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if total import time exceeds this")
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    args = parser.parse_args()
+
+    result = measure(args.module)
+    print(f"import {result['module']}: {result['total_ms']} ms")
+    for name, ms in result["top_packages_ms"].items():
+        print(f"  {name:<30} {ms:8.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    failed = False
+    if result["eager_heavy_imports"]:
+        print(f"Heavy modules imported at startup: {', '.join(result['eager_heavy_imports'])}")
+        failed = True
+    if args.budget_ms is not None and result["total_ms"] > args.budget_ms:
+        print(f"Import time {result['total_ms']} ms exceeds budget of {args.budget_ms} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
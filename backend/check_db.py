@@ -29,5 +29,5 @@ sample_regulation = [{
 
 }]
 
-db_ops.insert_regulation(sample_regulation)
-print("Sample regulation inserted.")
+report = db_ops.insert_regulation(sample_regulation)
+print(f"Sample regulation inserted ({report['inserted']} new, {report['duplicates']} already present).")
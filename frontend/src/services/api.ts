@@ -2,6 +2,7 @@ import axios from 'axios';
 import { ChatResponse } from '../types';
 
 const API_BASE_URL = 'http://localhost:8000/api';
+const WS_CHAT_URL = API_BASE_URL.replace(/^http/, 'ws') + '/ws/chat';
 
 
 interface SearchParams {
@@ -9,6 +10,7 @@ interface SearchParams {
     language: string;
     category?: string;
     limit?: number;
+    country?: string;
 }
 
 interface SearchResponse {
@@ -18,8 +20,81 @@ interface SearchResponse {
     total_results: number;
 }
 
+interface PendingMessage {
+    resolve: (response: ChatResponse) => void;
+    reject: (error: Error) => void;
+}
+
+// One WebSocket per page; the server keeps the conversation state of the
+// connection, and several messages can be in flight on it at once.
+class ChatSocket {
+    private socket: WebSocket | null = null;
+    private opening: Promise<WebSocket> | null = null;
+    private pending = new Map<number, PendingMessage>();
+    private nextId = 1;
+
+    private connect(): Promise<WebSocket> {
+        if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+            return Promise.resolve(this.socket);
+        }
+        if (!this.opening) {
+            this.opening = new Promise((resolve, reject) => {
+                const socket = new WebSocket(WS_CHAT_URL);
+                socket.onopen = () => {
+                    this.socket = socket;
+                    this.opening = null;
+                    resolve(socket);
+                };
+                socket.onmessage = (event) => this.onMessage(JSON.parse(event.data));
+                socket.onerror = () => reject(new Error('WebSocket connection failed'));
+                socket.onclose = () => {
+                    this.socket = null;
+                    this.opening = null;
+                    this.pending.forEach(({ reject }) => reject(new Error('WebSocket closed')));
+                    this.pending.clear();
+                };
+            });
+        }
+        return this.opening;
+    }
+
+    private onMessage(data: any) {
+        const pending = this.pending.get(data.id);
+        if (!pending) {
+            return;  // the session greeting, or an answer nobody waits for
+        }
+        this.pending.delete(data.id);
+        if (data.type === 'answer') {
+            pending.resolve(data as ChatResponse);
+        } else {
+            pending.reject(Object.assign(new Error(data.error), { status: data.status }));
+        }
+    }
+
+    async send(message: string, language: string): Promise<ChatResponse> {
+        const socket = await this.connect();
+        const id = this.nextId++;
+        return new Promise((resolve, reject) => {
+            this.pending.set(id, { resolve, reject });
+            socket.send(JSON.stringify({ id, message, language }));
+        });
+    }
+}
+
+const chatSocket = typeof WebSocket !== 'undefined' ? new ChatSocket() : null;
+
 export const chatAPI = {
     sendMessage: async (message: string, language: string): Promise<ChatResponse> => {
+        if (chatSocket) {
+            try {
+                return await chatSocket.send(message, language);
+            } catch (error: any) {
+                if (error.status) {
+                    throw error;  // answered by the server with an error, e.g. 429
+                }
+                console.warn('WebSocket chat unavailable, falling back to HTTP:', error);
+            }
+        }
         try {
             const response = await axios.post(`${API_BASE_URL}/chat`, {
                 message,
@@ -34,7 +109,8 @@ export const chatAPI = {
 
     search: async (params: SearchParams): Promise<SearchResponse> => {
         try {
-            const response = await axios.post(`${API_BASE_URL}/search`, params);
+            // GET, so the browser can revalidate with the ETag instead of re-running the search
+            const response = await axios.get(`${API_BASE_URL}/search`, { params });
             return response.data;
         } catch (error) {
             console.error('Error searching:', error);